@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Tuple, TypeVar
+
+
+class SQLiteLRUCache:
+    """
+    Base of the persistent SQLite caches (embeddings, LLM responses, OCR results).
+
+    Owns the connection (WAL mode), the table with its last_access index, the
+    hit/miss counters and least recently used eviction once max_entries or
+    max_bytes is exceeded. Subclasses only define their table and their own
+    key and payload handling (get/put), running queries under self._lock.
+    """
+
+    # Set by subclasses
+    table = ""
+    columns = ""  # column definitions of the table, including last_access
+    size_sql = "size"  # SQL expression of an entry's size in bytes
+
+    def __init__(self, db_file: str, max_entries: int, max_bytes: int, enabled: bool = True):
+        """
+        Initialize the cache
+
+        Args:
+            db_file: Path of the SQLite database file
+            max_entries: Maximum number of cached entries (0 for no limit)
+            max_bytes: Maximum total size of cached entries in bytes (0 for no limit)
+            enabled: If False every lookup is a miss and nothing is stored
+        """
+        self.db_file = db_file
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+        if self.enabled:
+            self._connect()
+
+    def _connect(self):
+        directory = os.path.dirname(os.path.abspath(self.db_file))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {self.table} ({self.columns})")
+        self._conn.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{self.table}_last_access ON {self.table} (last_access)"
+        )
+        self._conn.commit()
+
+    def _count(self, hits: int = 0, misses: int = 0):
+        """Add to the hit/miss counters (call without holding self._lock)"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _size(self) -> Tuple[int, int]:
+        """Number of entries and their total size in bytes (call with self._lock held)"""
+        return self._conn.execute(
+            f"SELECT COUNT(*), COALESCE(SUM({self.size_sql}), 0) FROM {self.table}"
+        ).fetchone()
+
+    def _evict(self):
+        """Delete least recently used entries until both size limits hold (call with self._lock held)"""
+        count, total_bytes = self._size()
+
+        excess = 0
+        if self.max_entries and count > self.max_entries:
+            excess = count - self.max_entries
+        if self.max_bytes and total_bytes > self.max_bytes and count:
+            avg_bytes = total_bytes / count
+            excess = max(excess, int((total_bytes - self.max_bytes) / avg_bytes) + 1)
+
+        if excess > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE rowid IN "
+                f"(SELECT rowid FROM {self.table} ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters and the current size of the cache"""
+        entries, total_bytes = 0, 0
+        with self._lock:
+            if self.enabled:
+                entries, total_bytes = self._size()
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "enabled": self.enabled,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def clear(self):
+        """Remove every cached entry"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+CacheT = TypeVar("CacheT", bound=SQLiteLRUCache)
+
+_caches: Dict[Tuple[type, str], SQLiteLRUCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_shared_cache(cache_class: type, db_file: str, create: Callable[[], CacheT]) -> CacheT:
+    """
+    Return the process-wide cache of a class for a database file, created on first use
+
+    Args:
+        cache_class: The SQLiteLRUCache subclass
+        db_file: Path of the SQLite database file
+        create: Builds the cache from the caller's config when there is none yet
+
+    Returns:
+        The shared cache
+    """
+    key = (cache_class, db_file)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = create()
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,88 @@
+"""
+Measure page extraction throughput of an LLM backend without any outside service.
+
+Runs every page of a template through run_all on the chosen backend ("fake",
+"llama_cpp" with a local .gguf file, or "ollama" if a server is running) and
+prints per-page TTFT, tokens and tokens/sec plus the job time. The response
+cache is bypassed so every page is generated.
+
+Run from this directory:
+    python benchmark_backends.py --backend fake
+    python benchmark_backends.py --backend llama_cpp --model-path ./models/phi-4-Q4_K_M.gguf --threads 8
+"""
+
+import argparse
+import json
+import os
+import time
+
+import llm
+from llm_backends import create_llm_backend
+
+DEFAULT_RETRIEVAL = "../../../../data/retrieval/retrieval.json"
+
+
+def load_schemas(template: str) -> dict:
+    prompt_set = llm.load_llm_config().get('llm_prompts', {}).get(template, {})
+    schemas = {}
+    for key, path in prompt_set.items():
+        if key.startswith("page_") and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                schemas[int(key.split('_')[1])] = f.read()
+    return dict(sorted(schemas.items()))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="LLM backend throughput benchmark")
+    arg_parser.add_argument("--backend", default="fake", choices=["fake", "llama_cpp", "ollama"])
+    arg_parser.add_argument("--template", default="ge_prompts")
+    arg_parser.add_argument("--retrieval", default=DEFAULT_RETRIEVAL)
+    arg_parser.add_argument("--model-path", default=None, help="GGUF file for llama_cpp")
+    arg_parser.add_argument("--threads", type=int, default=None, help="CPU threads for llama_cpp")
+    arg_parser.add_argument("--sequential", action="store_true", help="Query pages one after another")
+    args = arg_parser.parse_args()
+
+    config = dict(llm.load_llm_config())
+    backend_config = dict(config.get('llm_backend') or {}, type=args.backend)
+    if args.backend == "llama_cpp":
+        llama_config = dict(backend_config.get('llama_cpp') or {})
+        if args.model_path:
+            llama_config['model_path'] = args.model_path
+        if args.threads:
+            llama_config['n_threads'] = args.threads
+        backend_config['llama_cpp'] = llama_config
+    config['llm_backend'] = backend_config
+
+    load_start = time.perf_counter()
+    backend = create_llm_backend(config)
+    print(f"Loaded {backend.name} backend ({backend.model}) in {time.perf_counter() - load_start:.1f}s")
+    llm.get_client = lambda: backend
+
+    schemas = load_schemas(args.template)
+    meta_rules = config.get('llm_prompts', {}).get('meta_rules', '')
+    with open(args.retrieval, 'r', encoding='utf-8') as f:
+        retrieval = {int(page): result for page, result in json.load(f).items()}
+
+    page_metrics = {}
+
+    def on_progress(page, progress):
+        if progress["status"] == "done":
+            page_metrics[page] = progress
+
+    start = time.perf_counter()
+    llm.run_all(retrieval, len(schemas), schemas, use_multithreading=not args.sequential, meta_rules=meta_rules,
+                on_progress=on_progress, template=args.template, use_cache=False, batch_pages=False)
+    job_s = time.perf_counter() - start
+
+    print(f"\n{'page':>4} {'ttft s':>7} {'tokens':>7} {'tok/s':>7}")
+    total_tokens = 0
+    for page in sorted(page_metrics):
+        metrics = page_metrics[page]
+        total_tokens += metrics["tokens"]
+        print(f"{page:>4} {metrics['ttft_s'] or 0:7.2f} {metrics['tokens']:7d} {metrics['tokens_per_s'] or 0:7.1f}")
+    print(f"job {job_s:.2f}s, {total_tokens} tokens, {total_tokens / job_s:.1f} tok/s overall")
+    backend.close()
+
+
+if __name__ == "__main__":
+    main()
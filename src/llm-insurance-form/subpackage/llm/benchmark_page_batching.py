@@ -0,0 +1,116 @@
+"""
+Compare job latency with one LLM call per page against cross-page batching.
+
+Runs the same jobs through run_all against the stub Ollama server, once with
+batch_pages=False and once with batch_pages=True, and prints the median and
+p95 job latency, LLM calls and prompt tokens prefilled. Each job shuffles the
+retrieved chunks, like a different patient, and the stub answers structured
+requests with JSON shaped like the requested schema, so batched answers are
+split back per page as in production.
+
+Run from this directory:
+    python benchmark_page_batching.py
+    python benchmark_page_batching.py --template ge_prompts --jobs 20 --concurrency 2
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import io
+import json
+import os
+import random
+import statistics
+import time
+
+import llm
+from llm_client import OllamaClient
+from stub_ollama_server import start_stub_server
+
+DEFAULT_RETRIEVAL = "../../../../data/retrieval/retrieval.json"
+
+
+def load_schemas(template: str) -> dict:
+    prompt_set = llm.load_llm_config().get('llm_prompts', {}).get(template, {})
+    schemas = {}
+    for key, path in prompt_set.items():
+        if key.startswith("page_") and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                schemas[int(key.split('_')[1])] = f.read()
+    return dict(sorted(schemas.items()))
+
+
+def job_retrieval(retrieval: dict, pages, seed: int) -> dict:
+    """Retrieval results with each page's chunks shuffled, so every job's prompts differ"""
+    rng = random.Random(seed)
+    results = {}
+    for page in pages:
+        result = dict(retrieval.get(str(page), retrieval.get(page, {})))
+        chunks = list(result.get("retrieved_chunks", []))
+        rng.shuffle(chunks)
+        result["retrieved_chunks"] = chunks
+        result["aggregated_text"] = "\n\n".join(chunk["text"] for chunk in chunks)
+        results[page] = result
+    return results
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run_mode(batch_pages: bool, schemas: dict, meta_rules: str, retrieval: dict, args) -> dict:
+    server, url, state = start_stub_server(parallel=args.parallel, tokens_per_s=args.tokens_per_s,
+                                           prefill_ms_per_token=args.prefill_ms_per_token,
+                                           cache_slots=4 * len(schemas))
+    client = OllamaClient(url=url, max_concurrency=args.parallel)
+    llm.get_client = lambda: client
+
+    def run_job(job: int) -> float:
+        job_results = job_retrieval(retrieval, schemas, seed=job)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = llm.run_all(job_results, len(schemas), schemas, meta_rules=meta_rules, job_id=f"job_{job}",
+                                  template=args.template, use_cache=False, batch_pages=batch_pages)
+        assert sorted(results) == sorted(schemas)
+        return time.perf_counter() - start
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(run_job, range(args.jobs)))
+    finally:
+        client.close()
+        server.shutdown()
+    return {"latencies": latencies, **state.stats()}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Cross-page batching benchmark")
+    arg_parser.add_argument("--template", default="ge_prompts")
+    arg_parser.add_argument("--retrieval", default=DEFAULT_RETRIEVAL)
+    arg_parser.add_argument("--jobs", type=int, default=10)
+    arg_parser.add_argument("--concurrency", type=int, default=1, help="Jobs running at once")
+    arg_parser.add_argument("--parallel", type=int, default=2, help="Stub slots and client max_concurrency")
+    arg_parser.add_argument("--tokens-per-s", type=float, default=40.0)
+    arg_parser.add_argument("--prefill-ms-per-token", type=float, default=0.5)
+    args = arg_parser.parse_args()
+
+    schemas = load_schemas(args.template)
+    meta_rules = llm.load_llm_config().get('llm_prompts', {}).get('meta_rules', '')
+    with open(args.retrieval, 'r', encoding='utf-8') as f:
+        retrieval = json.load(f)
+
+    calls = llm.plan_page_calls(job_retrieval(retrieval, schemas, seed=0), len(schemas), schemas)
+    print(f"{args.template}: {len(schemas)} pages -> calls {calls}")
+
+    print(f"\n{'mode':<9} {'median s':>9} {'p95 s':>7} {'calls':>6} {'prefilled tok':>14}")
+    for name, batch_pages in (("per-page", False), ("batched", True)):
+        result = run_mode(batch_pages, schemas, meta_rules, retrieval, args)
+        latencies = result["latencies"]
+        print(f"{name:<9} {statistics.median(latencies):9.2f} {percentile(latencies, 0.95):7.2f} "
+              f"{result['requests']:6d} {result['prompt_eval_tokens']:14d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare stage-by-stage and pipelined retrieval -> LLM execution.
+
+Retrieval is simulated with a fixed delay per page (measure yours with the
+timing prints of retrieve_rag and pass it as --retrieval-s) and the LLM is
+the stub Ollama server. "sequential" retrieves every page and then calls
+run_all, like the notebook; "pipelined" uses run_pipelined, so each page
+starts generating as soon as its retrieval is done. End-to-end latency
+should approach the longer of the two stages instead of their sum.
+
+Run from this directory:
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --retrieval-s 1.5 --tokens-per-s 40
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+import llm
+from llm_client import OllamaClient
+from stub_ollama_server import start_stub_server
+
+DEFAULT_RETRIEVAL = "../../../../data/retrieval/retrieval.json"
+
+
+def load_schemas(template: str) -> dict:
+    prompt_set = llm.load_llm_config().get('llm_prompts', {}).get(template, {})
+    schemas = {}
+    for key, path in prompt_set.items():
+        if key.startswith("page_") and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                schemas[int(key.split('_')[1])] = f.read()
+    return dict(sorted(schemas.items()))
+
+
+def simulated_retrieval(retrieval: dict, pages, delay_s: float):
+    """Stand-in for retrieve_rag: one page's result every delay_s seconds"""
+    def retrieve(on_result=None):
+        results = {}
+        for page in pages:
+            time.sleep(delay_s)
+            results[page] = retrieval[page]
+            if on_result:
+                on_result(page, retrieval[page])
+        return results
+    return retrieve
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Pipelined retrieval -> LLM benchmark")
+    arg_parser.add_argument("--template", default="ge_prompts")
+    arg_parser.add_argument("--retrieval", default=DEFAULT_RETRIEVAL)
+    arg_parser.add_argument("--retrieval-s", type=float, default=1.0, help="Simulated retrieval time per page")
+    arg_parser.add_argument("--parallel", type=int, default=2)
+    arg_parser.add_argument("--tokens-per-s", type=float, default=100.0)
+    args = arg_parser.parse_args()
+
+    schemas = load_schemas(args.template)
+    meta_rules = llm.load_llm_config().get('llm_prompts', {}).get('meta_rules', '')
+    with open(args.retrieval, 'r', encoding='utf-8') as f:
+        retrieval = {int(page): result for page, result in json.load(f).items()}
+    retrieve = simulated_retrieval(retrieval, list(schemas), args.retrieval_s)
+
+    server, url, _ = start_stub_server(parallel=args.parallel, tokens_per_s=args.tokens_per_s)
+    client = OllamaClient(url=url, max_concurrency=args.parallel)
+    llm.get_client = lambda: client
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results = retrieve()
+            retrieval_s = time.perf_counter() - start
+            llm.run_all(results, len(schemas), schemas, meta_rules=meta_rules, template=args.template,
+                        use_cache=False, batch_pages=False)
+            sequential_s = time.perf_counter() - start
+            llm_s = sequential_s - retrieval_s
+
+            start = time.perf_counter()
+            with llm.PagePipeline(schemas, meta_rules, template=args.template, use_cache=False) as pipeline:
+                retrieve(pipeline.submit)
+            pipelined_s = time.perf_counter() - start
+    finally:
+        client.close()
+        server.shutdown()
+
+    print(f"{len(schemas)} pages ({args.template}), retrieval {args.retrieval_s}s/page, {args.parallel} LLM slots")
+    print(f"retrieval stage {retrieval_s:.2f}s, LLM stage {llm_s:.2f}s")
+    print(f"sequential  {sequential_s:.2f}s (sum of stages)")
+    print(f"pipelined   {pipelined_s:.2f}s")
+    for page, timing in sorted(pipeline.timings.items()):
+        print(f"  page {page}: retrieved at {timing['retrieved_s']:.2f}s, output at {timing['done_s']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Measure the prefill saved by the stable system-prompt prefix.
+
+Runs the same pages for several jobs against the stub Ollama server, once with
+the original inline prompt (retrieved text before the schema) and once with the
+"system" layout (rules and schema as a fixed prefix, retrieved text last). Each
+job gets a different shuffle of the retrieved chunks, like different patients.
+The stub reuses the longest cached prompt prefix like llama.cpp slots and
+reports prompt_eval_count, so the table shows tokens prefilled per page after
+the first job.
+
+Run from this directory:
+    python benchmark_prompt_prefix.py
+    python benchmark_prompt_prefix.py --template ge_prompts --jobs 5
+"""
+
+import argparse
+import json
+import random
+import statistics
+
+from llm import (
+    PromptPrefixCache,
+    OllamaStream,
+    build_prompt,
+    build_user_prompt,
+    load_llm_config,
+)
+from llm_client import OllamaClient
+from stub_ollama_server import start_stub_server
+
+DEFAULT_RETRIEVAL = "../../../../data/retrieval/retrieval.json"
+
+
+def load_schemas(template: str) -> dict:
+    prompt_set = load_llm_config().get('llm_prompts', {}).get(template, {})
+    schemas = {}
+    for key, path in prompt_set.items():
+        if key.startswith("page_"):
+            with open(path, 'r', encoding='utf-8') as f:
+                schemas[int(key.split('_')[1])] = f.read()
+    return dict(sorted(schemas.items()))
+
+
+def job_texts(retrieval: dict, pages, seed: int) -> dict:
+    """Retrieved text per page with the chunks shuffled, so every job's text differs"""
+    rng = random.Random(seed)
+    texts = {}
+    for page in pages:
+        chunks = retrieval.get(str(page), retrieval.get(page, {})).get("aggregated_text", "").split("\n\n")
+        rng.shuffle(chunks)
+        texts[page] = "\n\n".join(chunks)
+    return texts
+
+
+def run_layout(layout: str, schemas: dict, meta_rules: str, retrieval: dict, jobs: int, template: str,
+               prefill_ms_per_token: float):
+    # Room for every page of two jobs, so a page can reuse its prefix from the previous job
+    server, url, state = start_stub_server(parallel=1, tokens_per_s=2000, prefill_ms_per_token=prefill_ms_per_token,
+                                           cache_slots=2 * len(schemas))
+    client = OllamaClient(url=url, max_concurrency=1)
+    prefixes = PromptPrefixCache()
+    per_page = {page: [] for page in schemas}
+    try:
+        for job in range(jobs):
+            texts = job_texts(retrieval, schemas, seed=job)
+            for page in schemas:
+                if layout == "system":
+                    system = prefixes.system_prompt(template, page, schemas, meta_rules)
+                    prompt = build_user_prompt(texts[page])
+                else:
+                    system, prompt = None, build_prompt(texts[page], page, schemas, meta_rules)
+                # Read to the final line, which carries the prefill statistics
+                stream = OllamaStream(prompt, stop_on_json_complete=False, job_id=f"job_{job}",
+                                      client=client, system=system)
+                for _ in stream:
+                    pass
+                per_page[page].append((stream.metrics["prompt_eval_count"], stream.metrics["prompt_eval_ms"]))
+    finally:
+        client.close()
+        server.shutdown()
+    return per_page, state.stats()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Prompt prefix reuse benchmark")
+    arg_parser.add_argument("--template", default="ntuc_prompts")
+    arg_parser.add_argument("--retrieval", default=DEFAULT_RETRIEVAL)
+    arg_parser.add_argument("--jobs", type=int, default=3)
+    arg_parser.add_argument("--prefill-ms-per-token", type=float, default=0.5,
+                            help="Stub prefill cost, roughly phi4 on one GPU")
+    args = arg_parser.parse_args()
+
+    schemas = load_schemas(args.template)
+    meta_rules = load_llm_config().get('llm_prompts', {}).get('meta_rules', '')
+    with open(args.retrieval, 'r', encoding='utf-8') as f:
+        retrieval = json.load(f)
+
+    results = {}
+    for layout in ("inline", "system"):
+        results[layout] = run_layout(layout, schemas, meta_rules, retrieval, args.jobs, args.template,
+                                     args.prefill_ms_per_token)
+
+    print(f"\nPrompt tokens prefilled per page, mean over jobs 2..{args.jobs} ({args.template})")
+    print(f"{'page':>4} {'inline tok':>11} {'system tok':>11} {'inline ms':>10} {'system ms':>10} {'saved ms':>9}")
+    for page in schemas:
+        row = []
+        for layout in ("inline", "system"):
+            warm = results[layout][0][page][1:] or results[layout][0][page]
+            row.append((statistics.mean(t for t, _ in warm), statistics.mean(ms for _, ms in warm)))
+        (inline_tok, inline_ms), (system_tok, system_ms) = row
+        print(f"{page:>4} {inline_tok:11.0f} {system_tok:11.0f} {inline_ms:10.1f} {system_ms:10.1f} "
+              f"{inline_ms - system_ms:9.1f}")
+
+    for layout, (_, stats) in results.items():
+        print(f"{layout:<7} total prompt tokens {stats['prompt_tokens']}, prefilled {stats['prompt_eval_tokens']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,44 @@
 
 # !ollama pull phi4
 
+import os
+import re
 import yaml
 import json
-import requests
+import time
+import hashlib
+import functools
+import threading
 from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 import concurrent.futures
+from llm_client import LLMBackend
+from llm_backends import get_llm_backend
+from response_cache import ResponseCache, get_response_cache, response_cache_key
+from page_batching import (
+    combined_retrieved_text,
+    combined_schema_text,
+    estimate_page,
+    page_namespace,
+    plan_page_batches,
+    split_batch_answer,
+)
+
+@functools.lru_cache(maxsize=None)
+def load_llm_config(config_path: str = "llm-config.yml") -> Dict:
+    """Load llm-config.yml once; an empty config if the file is not there"""
+    if not os.path.exists(config_path):
+        return {}
+    with open(config_path, 'r', encoding='utf-8') as file:
+        return yaml.safe_load(file) or {}
+
+def get_client() -> LLMBackend:
+    """Process-wide LLM backend selected by the 'llm_backend' section of llm-config.yml"""
+    return get_llm_backend(load_llm_config())
+
+def get_cache() -> ResponseCache:
+    """Process-wide LLM response cache configured by the 'response_cache' section of llm-config.yml"""
+    return get_response_cache(load_llm_config().get('response_cache'))
 
 # --- PROMPT BUILDER ---
 
@@ -46,48 +79,791 @@ JSON schema:
 
     return f"{system}\n\n{user}"
 
+def build_system_prompt(page_num: int, field_json_schemas: dict, meta_rules: str) -> str:
+    """Static part of a page prompt: meta rules, task and the page's JSON schema"""
+    schema = field_json_schemas.get(page_num, {})
+
+    task = f"""
+You will be given the retrieval results from RAG, where it details the most relevant sections of doctor's records for a specific patient in Singapore. They are excerpts from different sections found in the appointment notes with relevant dates and information, and come after this message as RETRIEVED TEXT.
+
+Task:
+- Fill the JSON schema below using ONLY information from the notes, and also include the confidence score which should reflect probability that YOUR answer is correct.
+- If no information exists, output "".
+- Try your best to fill in the JSON as completely as possible, even if it is not accurate (you may give it a low confidence score).
+- Return JSON only.
+
+Remember, return ONLY valid JSON. DO NOT include markdown, comments, or explanations. No comments at all.
+
+JSON schema:
+{schema}
+""".strip()
+
+    return f"{meta_rules.strip()}\n\n{task}"
+
+def build_user_prompt(i_txt: str) -> str:
+    """Per-job part of a page prompt: the retrieved text, placed after the static prefix"""
+    return f"""
+RETRIEVED TEXT:
+<<<
+{i_txt}
+>>>
+
+Fill the JSON schema above using ONLY the retrieved text. Return ONLY valid JSON.
+""".strip()
+
+def build_prompt_parts(i_txt: str, page_num: int, field_json_schemas: dict, meta_rules: str) -> Tuple[str, str]:
+    """
+    Split the page prompt into a static system prompt and the per-job prompt.
+
+    The system prompt (meta rules, task and schema) is identical for every job
+    on the same page, so the backend can reuse its prefilled KV cache; only the
+    retrieved text at the end differs between jobs.
+    """
+    return build_system_prompt(page_num, field_json_schemas, meta_rules), build_user_prompt(i_txt)
+
+def page_context_budgets(field_json_schemas: dict, meta_rules: str) -> Dict[int, int]:
+    """
+    Tokens left for each page's retrieved text once the rules, schema and answer are accounted for
+
+    Uses num_ctx and num_predict from the 'generation' options of llm-config.yml
+    and the character-based token estimate of 'generation.context_budget'. Pass
+    the result to retrieve_rag(token_budgets=...) so the context packer fits
+    every page into the model's window.
+
+    Args:
+        field_json_schemas: Dict mapping page number to its schema text
+        meta_rules: Rules placed before every page prompt
+
+    Returns:
+        Dict mapping page number to its token budget
+    """
+    generation = load_llm_config().get('generation', {})
+    options = generation.get('options') or {}
+    budget_config = generation.get('context_budget') or {}
+    chars_per_token = budget_config.get('chars_per_token', 3.5)
+    margin = budget_config.get('margin_tokens', 256)
+    available = options.get('num_ctx', 2048) - options.get('num_predict', 1024) - margin
+
+    budgets = {}
+    for page_num in field_json_schemas:
+        system, user = build_prompt_parts("", page_num, field_json_schemas, meta_rules)
+        overhead = (len(system) + len(user)) / chars_per_token
+        budgets[page_num] = max(int(available - overhead), 0)
+    return budgets
+
+class PromptPrefixCache:
+    """
+    System prompts kept per (template, page) across jobs.
+
+    Each entry is built once and reused byte for byte, so every job sends the
+    backend the same prefix for a page. The entry also records the prompt
+    tokens the backend reported prefilling, first request vs later ones.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, int], Dict] = {}
+        self._lock = threading.Lock()
+
+    def system_prompt(self, template: str, page_num: int, field_json_schemas: dict, meta_rules: str) -> str:
+        source_hash = hashlib.sha256(
+            f"{meta_rules}\x00{field_json_schemas.get(page_num, '')}".encode("utf-8")
+        ).hexdigest()
+        key = (template, page_num)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry["source_hash"] != source_hash:
+                # New page or the rules/schema changed: build a new prefix
+                entry = self._entries[key] = {
+                    "source_hash": source_hash,
+                    "system": build_system_prompt(page_num, field_json_schemas, meta_rules),
+                    "requests": 0,
+                    "first_prompt_eval_count": None,
+                    "last_prompt_eval_count": None,
+                }
+            entry["requests"] += 1
+            return entry["system"]
+
+    def record(self, template: str, page_num: int, prompt_eval_count: Optional[int]):
+        """Store the prompt tokens the backend actually evaluated for this page"""
+        if prompt_eval_count is None:
+            return
+        with self._lock:
+            entry = self._entries.get((template, page_num))
+            if entry is None:
+                return
+            if entry["first_prompt_eval_count"] is None:
+                entry["first_prompt_eval_count"] = prompt_eval_count
+            entry["last_prompt_eval_count"] = prompt_eval_count
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                f"{template}/page_{page_num}": {k: v for k, v in entry.items() if k not in ("system", "source_hash")}
+                for (template, page_num), entry in self._entries.items()
+            }
+
+PROMPT_PREFIXES = PromptPrefixCache()
+
+# --- STREAMING ---
+
+class JsonStreamParser:
+    """
+    Incremental scanner for the first top-level JSON object in a token stream.
+
+    Tracks string, escape and comment state (// and #, as in the page
+    templates and _strip_json_comments) so braces inside values do not count, records each top-level key as it starts, and reports when the
+    object closes so the caller can stop generation there.
+    """
+
+    def __init__(self, expected_keys: Optional[List[str]] = None):
+        self.expected_keys = list(expected_keys or [])
+        self.keys: List[str] = []
+        self.start = None
+        self.end = None
+        self._chunks: List[str] = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._in_comment = False
+        self._slash = False
+        self._string_chars = None
+        self._pending_key = None
+
+    @property
+    def complete(self) -> bool:
+        return self.end is not None
+
+    @property
+    def text(self) -> str:
+        """Everything fed so far"""
+        return "".join(self._chunks)
+
+    @property
+    def json_text(self) -> Optional[str]:
+        """The top-level object once it has closed"""
+        return self.text[self.start:self.end] if self.complete else None
+
+    def feed(self, text: str) -> bool:
+        """
+        Scan the next piece of the stream
+
+        Args:
+            text: Token text as it arrived
+
+        Returns:
+            True once the top-level object has closed
+        """
+        self._chunks.append(text)
+        if self.complete:
+            return True
+        for ch in text:
+            self._scan(ch)
+            self._pos += 1
+            if self.complete:
+                break
+        return self.complete
+
+    def _scan(self, ch: str):
+        if self.start is None:
+            # Skip markdown fences or prose before the object
+            if ch == '{':
+                self.start = self._pos
+                self._depth = 1
+            return
+
+        if self._in_comment:
+            self._in_comment = ch != '\n'
+            return
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._string_chars is not None:
+                    self._pending_key = "".join(self._string_chars)
+                    self._string_chars = None
+                return
+            if self._string_chars is not None:
+                self._string_chars.append(ch)
+            return
+
+        if ch == '/':
+            self._in_comment = self._slash
+            self._slash = not self._slash
+            return
+        self._slash = False
+        if ch == '#':
+            self._in_comment = True
+            return
+
+        if ch.isspace():
+            return
+        if ch == '"':
+            self._in_string = True
+            # Only strings directly inside the top-level object can be its keys
+            self._string_chars = [] if self._depth == 1 else None
+            return
+        if ch == ':' and self._depth == 1 and self._pending_key is not None:
+            self.keys.append(self._pending_key)
+        self._pending_key = None
+
+        if ch in '{[':
+            self._depth += 1
+        elif ch in '}]':
+            self._depth -= 1
+            if self._depth == 0:
+                self.end = self._pos + 1
+
+    def progress(self) -> Dict:
+        """Number of top-level fields fully generated, out of the schema's fields"""
+        keys_done = len(self.keys) if self.complete else max(len(self.keys) - 1, 0)
+        return {
+            "keys_done": keys_done,
+            "keys_expected": len(self.expected_keys),
+            "last_key": self.keys[-1] if self.keys else None,
+        }
+
+def schema_keys(schema_text: str) -> List[str]:
+    """Top-level field names of a page schema file (comments are ignored)"""
+    parser = JsonStreamParser()
+    parser.feed(schema_text)
+    return parser.keys
+
+def _strip_json_comments(text: str) -> str:
+    """Remove // and # comments outside of strings"""
+    out = []
+    in_string = escape = in_comment = False
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if in_comment:
+            if ch == '\n':
+                in_comment = False
+                out.append(ch)
+        elif in_string:
+            out.append(ch)
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '#' or (ch == '/' and text[i + 1:i + 2] == '/'):
+            in_comment = True
+        else:
+            if ch == '"':
+                in_string = True
+            out.append(ch)
+        i += 1
+    return "".join(out)
+
+def _template_to_json_schema(example) -> Dict:
+    """JSON schema of an example value from a page template"""
+    if isinstance(example, dict):
+        return {
+            "type": "object",
+            "properties": {key: _template_to_json_schema(value) for key, value in example.items()},
+            "required": list(example.keys()),
+        }
+    if isinstance(example, list):
+        return {"type": "array", "items": _template_to_json_schema(example[0]) if example else {}}
+    if isinstance(example, bool):
+        return {"type": "boolean"}
+    if isinstance(example, (int, float)):
+        return {"type": "number"}
+    return {"type": "string"}
+
+@functools.lru_cache(maxsize=None)
+def page_json_schema(schema_text: str) -> Optional[Dict]:
+    """
+    Build the JSON schema passed as Ollama's "format" from a page template
+
+    The templates are JSON examples with // or # guidance comments, so comments,
+    trailing commas and missing commas between members are tolerated.
+
+    Args:
+        schema_text: Contents of a page template file
+
+    Returns:
+        JSON schema dict, or None if the template cannot be read as JSON
+    """
+    start = schema_text.find('{')
+    if start == -1:
+        return None
+    text = _strip_json_comments(schema_text[start:])
+    text = re.sub(r",\s*([}\]])", r"\1", text)
+    text = re.sub(r'("|\d|\]|\}|true|false|null)([ \t]*\n\s*)(?=["{\[])', r"\1,\2", text)
+    try:
+        example = json.JSONDecoder().raw_decode(text)[0]
+    except json.JSONDecodeError as e:
+        print(f"Page template is not valid JSON ({e}); falling back to plain JSON mode")
+        return None
+    return _template_to_json_schema(example)
+
+def generation_settings(schema_text: str) -> Tuple[Optional[Dict], Optional[object]]:
+    """
+    Sampling options and output format for a page from the 'generation' section of llm-config.yml
+
+    Args:
+        schema_text: Contents of the page template file
+
+    Returns:
+        Tuple of the Ollama options dict (or None) and the format: the page's
+        JSON schema, "json" if no schema can be built, or None if structured
+        output is turned off
+    """
+    generation = load_llm_config().get('generation', {})
+    options = dict(generation.get('options') or {}) or None
+    output_format = None
+    if generation.get('structured_output', False):
+        output_format = page_json_schema(schema_text) or "json"
+    return options, output_format
+
+class OllamaStream:
+    """
+    Iterator over the tokens of one streamed /api/generate request.
+
+    The request goes to the configured LLMBackend (Ollama, llama.cpp or fake).
+    Tokens are yielded as they arrive and fed to a JsonStreamParser. Once the
+    top-level JSON object closes the stream is closed, which makes the backend
+    stop generating, so no trailing prose is produced. Timing is kept in
+    self.metrics (time to first token, tokens and tokens/sec).
+
+    With a ResponseCache, a request identical to an earlier completed one is
+    answered from the cache without reaching the backend (metrics["cached"]).
+    """
+
+    def __init__(self, prompt: str, expected_keys: Optional[List[str]] = None,
+                 stop_on_json_complete: bool = True, job_id: str = "default",
+                 client: Optional[LLMBackend] = None, model: Optional[str] = None,
+                 system: Optional[str] = None, cache: Optional[ResponseCache] = None,
+                 options: Optional[Dict] = None, output_format=None):
+        self.prompt = prompt
+        self.system = system
+        self.options = options
+        self.output_format = output_format
+        self.job_id = job_id
+        self.client = client
+        self.model = model
+        self.cache = cache
+        self.stop_on_json_complete = stop_on_json_complete
+        self.parser = JsonStreamParser(expected_keys)
+        self.metrics = {
+            "ttft_s": None,
+            "duration_s": None,
+            "tokens": 0,
+            "tokens_per_s": None,
+            "stopped_early": False,
+            "prompt_eval_count": None,
+            "prompt_eval_ms": None,
+            "cached": False,
+        }
+
+    @property
+    def text(self) -> str:
+        return self.parser.text
+
+    def __iter__(self) -> Iterator[str]:
+        client = self.client or get_client()
+        payload = {"prompt": self.prompt}
+        if self.system is not None:
+            payload["system"] = self.system
+        if self.model:
+            payload["model"] = self.model
+        if self.options:
+            payload["options"] = self.options
+        if self.output_format is not None:
+            payload["format"] = self.output_format
+        start = time.perf_counter()
+        first_token_at = None
+
+        cache_key = None
+        if self.cache is not None and self.cache.enabled:
+            cache_key = response_cache_key({"model": client.model, **payload})
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self.metrics["cached"] = True
+                self.parser.feed(cached)
+                self.metrics["ttft_s"] = self.metrics["duration_s"] = round(time.perf_counter() - start, 3)
+                yield cached
+                return
+
+        # Waits for a slot of the shared client, so TTFT includes queueing (also reported as queue_s)
+        lines = client.stream(payload, self.job_id, self.metrics)
+        finished = False
+        try:
+            for data in lines:
+                token = data.get("response")
+                if token:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        self.metrics["ttft_s"] = round(first_token_at - start, 3)
+                    self.metrics["tokens"] += 1
+                    complete = self.parser.feed(token)
+                    yield token
+                    if complete and self.stop_on_json_complete and not data.get("done"):
+                        # Closing the stream drops the connection and cancels generation
+                        self.metrics["stopped_early"] = True
+                        break
+                if data.get("done"):
+                    finished = True
+                    # Prefill statistics only come with the final line
+                    if "prompt_eval_count" in data:
+                        self.metrics["prompt_eval_count"] = data["prompt_eval_count"]
+                        self.metrics["prompt_eval_ms"] = round(data.get("prompt_eval_duration", 0) / 1e6, 1)
+                    break
+            # Only complete answers are reused: the backend sent "done" or the JSON object
+            # closed. A stream that ended early (dropped connection) would cache a partial answer
+            if cache_key is not None and (finished or self.parser.complete):
+                self.cache.put(cache_key, payload.get("model", client.model), self.text)
+        finally:
+            lines.close()
+            end = time.perf_counter()
+            self.metrics["duration_s"] = round(end - start, 3)
+            if first_token_at is not None and end > first_token_at:
+                self.metrics["tokens_per_s"] = round(self.metrics["tokens"] / (end - first_token_at), 1)
+
+def stream_ollama(prompt: str, expected_keys: Optional[List[str]] = None,
+                  stop_on_json_complete: bool = True, job_id: str = "default",
+                  system: Optional[str] = None, use_cache: bool = True, options: Optional[Dict] = None,
+                  output_format=None) -> OllamaStream:
+    """
+    Start a streamed generation; iterate the result for tokens, read .metrics afterwards
+
+    use_cache=False always queries the backend and does not store the answer.
+    options (temperature, seed, num_predict, num_ctx...) and output_format (a
+    JSON schema or "json") are passed to Ollama as "options" and "format".
+    """
+    return OllamaStream(prompt, expected_keys, stop_on_json_complete, job_id, system=system,
+                        cache=get_cache() if use_cache else None, options=options, output_format=output_format)
+
 # query phi4 model
-def query_ollama(prompt: str) -> str:
-    OLLAMA_URL = "http://localhost:11434/api/generate"
-
-    payload = {"model": "phi4", "prompt": prompt}
-    output = ""
-    with requests.post(OLLAMA_URL, json=payload, stream=True) as r:
-        for line in r.iter_lines():
-            if line:
-                data = json.loads(line.decode("utf-8"))
-                if "response" in data:
-                    output += data["response"]
-    return output
-
-def query_page(i, i_text, field_json_schema):
-    prompt = build_prompt(i_text, i, field_json_schema)
-    response = query_ollama(prompt)
-    return i, f"\n--- Page {i} ---\n{response}"
-
-def run_all(all_retrieval_results, n_pages, field_json_schema, use_multithreading=True):
+def query_ollama(prompt: str, job_id: str = "default", use_cache: bool = True) -> str:
+    return "".join(stream_ollama(prompt, job_id=job_id, use_cache=use_cache))
+
+def query_page(i, i_text, field_json_schema, meta_rules: str = "",
+               on_progress: Optional[Callable[[int, Dict], None]] = None, job_id: str = "default",
+               template: str = "default", use_cache: bool = True):
+    """
+    Query the LLM for one page, streaming progress as fields are generated
+
+    Args:
+        i: Page number
+        i_text: Retrieved text for the page
+        field_json_schema: Dict mapping page number to its schema text
+        meta_rules: Rules placed before every page prompt
+        on_progress: Optional callback(page, progress) called when the first token
+            arrives, whenever another top-level field is finished, and at the end
+        job_id: Job the request is scheduled under by the shared client
+        template: Template name (e.g. "ntuc_prompts"), part of the prompt prefix key
+        use_cache: If False, skip the response cache and always query the LLM
+
+    Returns:
+        Tuple of the page number and its tagged output
+    """
+    if load_llm_config().get('llm_prompts', {}).get('prompt_layout', 'system') == 'system':
+        # Static rules and schema as a reusable system prefix, retrieved text last
+        system = PROMPT_PREFIXES.system_prompt(template, i, field_json_schema, meta_rules)
+        prompt = build_user_prompt(i_text)
+    else:
+        system, prompt = None, build_prompt(i_text, i, field_json_schema, meta_rules)
+    schema_text = field_json_schema.get(i, "")
+    options, output_format = generation_settings(schema_text)
+    stream = stream_ollama(prompt, schema_keys(schema_text), job_id=job_id, system=system, use_cache=use_cache,
+                           options=options, output_format=output_format)
+
+    def report(status):
+        if on_progress:
+            on_progress(i, {"status": status, **stream.parser.progress(), **stream.metrics})
+
+    keys_done = -1
+    for _ in stream:
+        progress = stream.parser.progress()
+        if progress["keys_done"] != keys_done:
+            keys_done = progress["keys_done"]
+            report("generating")
+    report("done")
+    if system is not None and not stream.metrics["cached"]:
+        PROMPT_PREFIXES.record(template, i, stream.metrics["prompt_eval_count"])
+
+    metrics = stream.metrics
+    if metrics["cached"]:
+        print(f"Page {i}: served from response cache")
+        return i, f"\n--- Page {i} ---\n{stream.text}"
+    print(f"Page {i}: TTFT {metrics['ttft_s']}s, {metrics['tokens']} tokens, "
+          f"{metrics['tokens_per_s']} tok/s{' (stopped at end of JSON)' if metrics['stopped_early'] else ''}")
+    return i, f"\n--- Page {i} ---\n{stream.text}"
+
+def query_page_batch(pages: List[int], all_retrieval_results, field_json_schema, meta_rules: str = "",
+                     on_progress: Optional[Callable[[int, Dict], None]] = None, job_id: str = "default",
+                     template: str = "default", use_cache: bool = True) -> List[Tuple[int, str]]:
+    """
+    Query the LLM once for several small pages that share retrieved chunks
+
+    The pages' schemas are combined under page_<n> keys and their retrieved
+    chunks are sent once. The answer is split back into one tagged output per
+    page; a page missing from the answer is queried on its own.
+
+    Args:
+        pages: Page numbers in the batch
+        all_retrieval_results: Dict mapping page number to its retrieval result
+        field_json_schema: Dict mapping page number to its schema text
+        meta_rules, on_progress, job_id, template, use_cache: As for query_page
+
+    Returns:
+        List of (page number, tagged output) tuples
+    """
+    batch_key = "+".join(str(page) for page in pages)
+    batch_schemas = {batch_key: combined_schema_text(pages, field_json_schema)}
+    batch_text = combined_retrieved_text(pages, all_retrieval_results)
+    if load_llm_config().get('llm_prompts', {}).get('prompt_layout', 'system') == 'system':
+        system = PROMPT_PREFIXES.system_prompt(template, batch_key, batch_schemas, meta_rules)
+        prompt = build_user_prompt(batch_text)
+    else:
+        system, prompt = None, build_prompt(batch_text, batch_key, batch_schemas, meta_rules)
+    options, output_format = generation_settings(batch_schemas[batch_key])
+    stream = stream_ollama(prompt, [page_namespace(page) for page in pages], job_id=job_id, system=system,
+                           use_cache=use_cache, options=options, output_format=output_format)
+
+    def report(status):
+        if on_progress:
+            for page in pages:
+                on_progress(page, {"status": status, "batched_with": pages, **stream.parser.progress(),
+                                   **stream.metrics})
+
+    keys_done = -1
+    for _ in stream:
+        progress = stream.parser.progress()
+        if progress["keys_done"] != keys_done:
+            keys_done = progress["keys_done"]
+            report("generating")
+    if system is not None and not stream.metrics["cached"]:
+        PROMPT_PREFIXES.record(template, batch_key, stream.metrics["prompt_eval_count"])
+
+    metrics = stream.metrics
+    print(f"Pages {batch_key} (one call): TTFT {metrics['ttft_s']}s, {metrics['tokens']} tokens"
+          f"{' (from response cache)' if metrics['cached'] else ''}")
+
+    results = []
+    for page, answer in split_batch_answer(stream.text, pages).items():
+        if answer is None:
+            print(f"Page {page} missing from the combined answer; querying it on its own")
+            results.append(query_page(page, all_retrieval_results[page]["aggregated_text"], field_json_schema,
+                                      meta_rules, on_progress, job_id, template, use_cache))
+            continue
+        if on_progress:
+            on_progress(page, {"status": "done", "batched_with": pages, **stream.metrics})
+        results.append((page, f"\n--- Page {page} ---\n{answer}"))
+    return results
+
+def plan_page_calls(all_retrieval_results, n_pages, field_json_schema) -> List[List[int]]:
+    """
+    Group pages into LLM calls using the 'page_batching' section of llm-config.yml
+
+    Returns:
+        List of page lists; small pages that share most of their retrieved chunks
+        are grouped, every other page is a call of its own
+    """
+    batching = load_llm_config().get('page_batching', {})
+    chars_per_token = load_llm_config().get('generation', {}).get('context_budget', {}).get('chars_per_token', 3.5)
+    estimates = []
+    for i in range(1, n_pages + 1):
+        schema_text = field_json_schema.get(i, "")
+        estimates.append(estimate_page(i, schema_text, all_retrieval_results[i], schema_keys(schema_text),
+                                       chars_per_token))
+    return plan_page_batches(
+        estimates,
+        max_page_output_tokens=batching.get('max_page_output_tokens', 400),
+        max_prompt_tokens=batching.get('max_prompt_tokens', 6000),
+        max_output_tokens=batching.get('max_output_tokens', 1500),
+        max_pages=batching.get('max_pages', 3),
+        min_shared_chunks=batching.get('min_shared_chunks', 0.5),
+        chars_per_token=chars_per_token,
+    )
+
+def job_progress_hook(job: Dict, lock: Optional[threading.Lock] = None) -> Callable[[int, Dict], None]:
+    """
+    on_progress callback that records per-page partial progress in a job record
+
+    Each page's latest progress (fields done out of expected, tokens, TTFT)
+    goes to job["pages"][page] and the pages started and done to
+    job["progress"], so a status endpoint can return them while the job is still running, e.g.
+        on_progress=job_progress_hook(jobs[job_id])
+
+    Args:
+        job: The job record (e.g. the Flask server's jobs[job_id] dict)
+        lock: Lock guarding the record (one is created if not given)
+
+    Returns:
+        Callback to pass as on_progress to run_all, run_pipelined or query_page
+    """
+    lock = lock or threading.Lock()
+
+    def on_progress(page: int, progress: Dict):
+        with lock:
+            pages = job.setdefault("pages", {})
+            pages[page] = progress
+            job["progress"] = {
+                "pages_started": len(pages),
+                "pages_done": sum(p["status"] == "done" for p in pages.values()),
+            }
+
+    return on_progress
+
+def run_all(all_retrieval_results, n_pages, field_json_schema, use_multithreading=True, meta_rules: str = "",
+            on_progress: Optional[Callable[[int, Dict], None]] = None, job_id: str = "default",
+            template: str = "default", use_cache: bool = True, batch_pages: Optional[bool] = None):
+    """
+    Query every page and return the tagged outputs by page number
+
+    Page threads only wait on the shared client, which caps the requests in
+    flight across all jobs and serves jobs round robin.
+
+    on_progress(page, progress) receives per-page partial progress (fields done
+    out of expected, tokens, TTFT), e.g. for a Flask job status:
+        on_progress=job_progress_hook(jobs[job_id])
+    Pages answered from the response cache report "cached": True there;
+    use_cache=False forces every page to be regenerated.
+
+    With batch_pages (default: page_batching.enabled in llm-config.yml), small
+    pages sharing most of their retrieved chunks are answered by one call and
+    report "batched_with" in their progress.
+    """
+    cached_by_page = {}
+
+    def track(page, progress):
+        if progress["status"] == "done":
+            cached_by_page[page] = progress["cached"]
+        if on_progress:
+            on_progress(page, progress)
+
+    if batch_pages is None:
+        batch_pages = load_llm_config().get('page_batching', {}).get('enabled', False)
+    if batch_pages:
+        calls = plan_page_calls(all_retrieval_results, n_pages, field_json_schema)
+    else:
+        calls = [[i] for i in range(1, n_pages + 1)]
+
+    def run_call(pages):
+        if len(pages) > 1:
+            return query_page_batch(pages, all_retrieval_results, field_json_schema, meta_rules, track, job_id,
+                                    template, use_cache)
+        i = pages[0]
+        i_text = all_retrieval_results[i]["aggregated_text"]
+        return [query_page(i, i_text, field_json_schema, meta_rules, track, job_id, template, use_cache)]
+
     results = {}
     if use_multithreading:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=n_pages) as executor:
-            futures = []
-            for i in range(1, n_pages + 1):
-                i_text = all_retrieval_results[i]["aggregated_text"]
-                futures.append(executor.submit(query_page, i, i_text, field_json_schema))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(calls)) as executor:
+            futures = [executor.submit(run_call, pages) for pages in calls]
             for f in concurrent.futures.as_completed(futures):
-                i, output = f.result()
-                results[i] = output
+                results.update(f.result())
     else:
-        for i in range(1, n_pages + 1):
-            i_text = all_retrieval_results[i]["aggregated_text"]
-            i, output = query_page(i, i_text, field_json_schema)
-            results[i] = output
+        for pages in calls:
+            results.update(run_call(pages))
+    cached_pages = sum(cached_by_page.values())
+    if cached_pages:
+        print(f"{cached_pages}/{n_pages} pages served from the response cache")
     return results
 
+class PagePipeline:
+    """
+    Starts each page's LLM call as soon as its retrieval result arrives.
+
+    Pass submit as the on_result callback of retrieve_rag: after the one batched
+    encode/search, each page is submitted as soon as its chunks are grouped and
+    packed, so earlier pages are already generating on the thread pool while
+    later pages are still being aggregated (the pool only waits on the shared
+    LLM client). Every finished page is handed to on_output(page, tagged_output),
+    e.g. to post-process it right away; on_output calls are serialized. Cross-page batching does not
+    apply here since pages arrive one at a time.
+    """
+
+    def __init__(self, field_json_schema, meta_rules: str = "",
+                 on_progress: Optional[Callable[[int, Dict], None]] = None,
+                 on_output: Optional[Callable[[int, str], None]] = None, job_id: str = "default",
+                 template: str = "default", use_cache: bool = True, max_workers: Optional[int] = None):
+        self.field_json_schema = field_json_schema
+        self.meta_rules = meta_rules
+        self.on_progress = on_progress
+        self.on_output = on_output
+        self.job_id = job_id
+        self.template = template
+        self.use_cache = use_cache
+        self.results: Dict[int, str] = {}
+        # Seconds from start at which each page's retrieval arrived and its output was ready
+        self.timings: Dict[int, Dict] = {}
+        self._start = time.perf_counter()
+        self._futures = []
+        self._output_lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers or max(len(field_json_schema), 1)
+        )
+
+    def submit(self, page: int, retrieval_result: Dict):
+        """Queue the LLM call for a page whose retrieval has finished"""
+        self.timings[page] = {"retrieved_s": round(time.perf_counter() - self._start, 3)}
+        self._futures.append(self._executor.submit(self._run, page, retrieval_result["aggregated_text"]))
+
+    def _run(self, page: int, page_text: str):
+        i, output = query_page(page, page_text, self.field_json_schema, self.meta_rules, self.on_progress,
+                               self.job_id, self.template, self.use_cache)
+        with self._output_lock:
+            self.results[i] = output
+            self.timings[i]["done_s"] = round(time.perf_counter() - self._start, 3)
+            if self.on_output:
+                self.on_output(i, output)
+        return i, output
+
+    def wait(self) -> Dict[int, str]:
+        """Wait for every submitted page and return the tagged outputs by page number"""
+        try:
+            for future in concurrent.futures.as_completed(self._futures):
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.wait()
+        else:
+            self._executor.shutdown(wait=True)
+
+def run_pipelined(retrieve: Callable[[Callable[[int, Dict], None]], object], field_json_schema,
+                  meta_rules: str = "", on_progress: Optional[Callable[[int, Dict], None]] = None,
+                  on_output: Optional[Callable[[int, str], None]] = None, job_id: str = "default",
+                  template: str = "default", use_cache: bool = True) -> Dict[int, str]:
+    """
+    Run retrieval and the LLM as a pipeline instead of one stage after the other
+
+    Args:
+        retrieve: Function that takes an on_result(page, retrieval_result) callback and
+            calls it as each page's retrieval finishes, e.g.
+            lambda on_result: retrieve_rag(timeline, field_sets, on_result=on_result)
+        field_json_schema: Dict mapping page number to its schema text
+        on_output: Optional callback(page, tagged_output) for each finished page,
+            e.g. LLMOutputMerger.add_page from post-processing
+        meta_rules, on_progress, job_id, template, use_cache: As for run_all
+
+    Returns:
+        Dict mapping page number to its tagged output, like run_all
+    """
+    with PagePipeline(field_json_schema, meta_rules, on_progress, on_output, job_id, template, use_cache) as pipeline:
+        retrieve(pipeline.submit)
+    return pipeline.results
+
 if __name__ == "__main__":
     # --- Load configuration ---
-    with open("llm-config.yml", 'r', encoding='utf-8') as file:
-        config = yaml.safe_load(file)
-        llm_prompts = config.get('llm_prompts', {})
+    config = load_llm_config()
+    llm_prompts = config.get('llm_prompts', {})
 
     # Choose either "ntuc_prompts" or "ge_prompts"
     template_choice = "ntuc_prompts"
@@ -121,7 +897,7 @@ if __name__ == "__main__":
     with open(json_file_path, 'r', encoding='utf-8') as f:
         all_retrieval_results = json.load(f)
 
-    results = run_all(all_retrieval_results, n_pages, schema)
+    results = run_all(all_retrieval_results, n_pages, schema, meta_rules=META_RULES, template=template_choice)
 
     final_results = "\n".join([results[i] for i in sorted(results.keys())])
     output_path = Path(__file__).resolve().parent.parent.parent.parent.parent / "data" / "sample" / "llm-output.txt"
@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterator, Optional
+
+from llm_client import LLMBackend, get_llm_client
+
+
+def schema_example(schema: dict):
+    """Placeholder value matching a JSON schema"""
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {key: schema_example(value) for key, value in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [schema_example(schema.get("items") or {})]
+    if schema_type == "number":
+        return 0.5
+    if schema_type == "boolean":
+        return False
+    return "stub"
+
+
+class LlamaCppBackend(LLMBackend):
+    """
+    In-process GGUF engine (llama-cpp-python) for CPU-only nodes.
+
+    The model is loaded once and shared; llama.cpp contexts are not thread
+    safe, so requests run one at a time through the scheduler. A RAM prompt
+    cache keeps the KV state of recent prompts, so the static system prefix of
+    a page is only evaluated once. A JSON schema "format" is enforced with a
+    grammar, like Ollama's structured output.
+    """
+
+    name = "llama_cpp"
+
+    def __init__(self, model_path: str, n_ctx: int = 8192, n_threads: Optional[int] = None, n_gpu_layers: int = 0,
+                 prompt_cache_mb: int = 1024, queue_timeout: Optional[float] = None):
+        """
+        Load the model
+
+        Args:
+            model_path: Path of the .gguf file
+            n_ctx: Context window in tokens (num_ctx in requests cannot change it)
+            n_threads: CPU threads (None lets llama.cpp decide)
+            n_gpu_layers: Layers offloaded to a GPU, 0 for CPU only
+            prompt_cache_mb: Size of the RAM prompt cache, 0 to disable it
+            queue_timeout: Seconds a request may wait for the engine (None waits forever)
+        """
+        try:
+            import llama_cpp
+        except ImportError as e:
+            raise ImportError("The llama_cpp backend needs llama-cpp-python: pip install llama-cpp-python") from e
+
+        super().__init__(os.path.basename(model_path), max_concurrency=1, queue_timeout=queue_timeout)
+        self.model_path = model_path
+        self.llm = llama_cpp.Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_gpu_layers=n_gpu_layers,
+            verbose=False,
+        )
+        if prompt_cache_mb:
+            self.llm.set_cache(llama_cpp.LlamaRAMCache(capacity_bytes=prompt_cache_mb * 1024 ** 2))
+
+    def _generate(self, payload: Dict, metrics: Optional[Dict]) -> Iterator[Dict]:
+        options = payload.get("options") or {}
+        messages = []
+        if payload.get("system"):
+            messages.append({"role": "system", "content": payload["system"]})
+        messages.append({"role": "user", "content": payload.get("prompt", "")})
+
+        kwargs = {
+            "temperature": options.get("temperature", 0.8),
+            "max_tokens": options.get("num_predict") or None,
+        }
+        if options.get("seed") is not None:
+            kwargs["seed"] = options["seed"]
+        output_format = payload.get("format")
+        if isinstance(output_format, dict):
+            kwargs["response_format"] = {"type": "json_object", "schema": output_format}
+        elif output_format == "json":
+            kwargs["response_format"] = {"type": "json_object"}
+
+        start = time.perf_counter()
+        chunks = self.llm.create_chat_completion(messages=messages, stream=True, **kwargs)
+        eval_count = 0
+        try:
+            for chunk in chunks:
+                token = chunk["choices"][0].get("delta", {}).get("content")
+                if token:
+                    eval_count += 1
+                    yield {"model": self.model, "response": token, "done": False}
+        finally:
+            # Stops generation if the caller closed the stream early
+            chunks.close()
+        yield {
+            "model": self.model,
+            "response": "",
+            "done": True,
+            "eval_count": eval_count,
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+        }
+
+    def close(self):
+        self.llm.close()
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process backend for tests and benchmarks.
+
+    Answers a structured request with JSON shaped like its schema ("stub"
+    values, 0.5 confidence) and anything else with a fixed answer, streamed in
+    4-character tokens at tokens_per_s (0 for no delay). The final line reports
+    prompt_eval_count as the number of whitespace-separated prompt words.
+    """
+
+    name = "fake"
+
+    def __init__(self, answer: str = '{"field": {"value": "stub", "confidence": 0.5}}', tokens_per_s: float = 0.0,
+                 max_concurrency: int = 2, model: str = "fake"):
+        super().__init__(model, max_concurrency)
+        self.answer = answer
+        self.tokens_per_s = tokens_per_s
+        self.prompts = []
+        self._prompts_lock = threading.Lock()
+
+    def _generate(self, payload: Dict, metrics: Optional[Dict]) -> Iterator[Dict]:
+        with self._prompts_lock:
+            self.prompts.append(payload)
+        output_format = payload.get("format")
+        text = json.dumps(schema_example(output_format)) if isinstance(output_format, dict) else self.answer
+        tokens = [text[i:i + 4] for i in range(0, len(text), 4)]
+        for token in tokens:
+            if self.tokens_per_s:
+                time.sleep(1 / self.tokens_per_s)
+            yield {"model": self.model, "response": token, "done": False}
+        yield {
+            "model": self.model,
+            "response": "",
+            "done": True,
+            "prompt_eval_count": len(f"{payload.get('system') or ''} {payload.get('prompt') or ''}".split()),
+            "prompt_eval_duration": 0,
+            "eval_count": len(tokens),
+        }
+
+
+def create_llm_backend(llm_config: Optional[Dict] = None) -> LLMBackend:
+    """
+    Build the backend selected by the 'llm_backend' section of llm-config.yml
+
+    Args:
+        llm_config: Whole llm-config.yml; 'llm_backend.type' is "ollama", "llama_cpp" or "fake"
+
+    Returns:
+        OllamaClient, LlamaCppBackend or FakeBackend
+    """
+    llm_config = llm_config or {}
+    backend_config = llm_config.get('llm_backend') or {}
+    backend = backend_config.get('type', 'ollama')
+
+    if backend == 'ollama':
+        return get_llm_client(llm_config.get('ollama'))
+    if backend == 'llama_cpp':
+        llama_config = backend_config.get('llama_cpp') or {}
+        return LlamaCppBackend(
+            llama_config['model_path'],
+            n_ctx=llama_config.get('n_ctx', 8192),
+            n_threads=llama_config.get('n_threads'),
+            n_gpu_layers=llama_config.get('n_gpu_layers', 0),
+            prompt_cache_mb=llama_config.get('prompt_cache_mb', 1024),
+            queue_timeout=llama_config.get('queue_timeout'),
+        )
+    if backend == 'fake':
+        fake_config = backend_config.get('fake') or {}
+        return FakeBackend(
+            tokens_per_s=fake_config.get('tokens_per_s', 0.0),
+            max_concurrency=fake_config.get('max_concurrency', 2),
+        )
+    raise ValueError(f"Unknown LLM backend: {backend}")
+
+
+_backends: Dict[str, LLMBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_llm_backend(llm_config: Optional[Dict] = None) -> LLMBackend:
+    """Return the process-wide backend for the configured type, created (and loaded) on first use"""
+    llm_config = llm_config or {}
+    backend = (llm_config.get('llm_backend') or {}).get('type', 'ollama')
+    if backend == 'ollama':
+        # get_llm_client already keeps one client per endpoint
+        return create_llm_backend(llm_config)
+    with _backends_lock:
+        instance = _backends.get(backend)
+        if instance is None:
+            instance = _backends[backend] = create_llm_backend(llm_config)
+        return instance
@@ -0,0 +1,275 @@
+import json
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_URL = "http://localhost:11434/api/generate"
+DEFAULT_MODEL = "phi4"
+
+
+class FairScheduler:
+    """
+    Global limit on in-flight LLM requests, shared fairly between jobs.
+
+    Up to max_concurrency requests run at once. Waiting requests are queued per
+    job and slots are handed out round robin across jobs, so a job with many
+    pages cannot starve a job that arrived later with a few.
+    """
+
+    def __init__(self, max_concurrency: int = 2):
+        self.max_concurrency = max(1, max_concurrency)
+        self._active = 0
+        self._queues: Dict[str, deque] = {}
+        self._order = deque()
+        self._granted = set()
+        self._cond = threading.Condition()
+
+    def acquire(self, job_id: str = "default", timeout: Optional[float] = None) -> bool:
+        """
+        Wait for a slot
+
+        Args:
+            job_id: Job the request belongs to
+            timeout: Seconds to wait before giving up (None waits forever)
+
+        Returns:
+            True if a slot was acquired, False on timeout
+        """
+        with self._cond:
+            if self._active < self.max_concurrency and not self._order:
+                self._active += 1
+                return True
+
+            ticket = object()
+            queue = self._queues.get(job_id)
+            if queue is None:
+                queue = self._queues[job_id] = deque()
+                self._order.append(job_id)
+            queue.append(ticket)
+
+            if self._cond.wait_for(lambda: ticket in self._granted, timeout):
+                self._granted.discard(ticket)
+                return True
+
+            # Timed out: withdraw the ticket
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[job_id]
+                self._order.remove(job_id)
+            return False
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._grant()
+
+    def _grant(self):
+        while self._active < self.max_concurrency and self._order:
+            job_id = self._order.popleft()
+            queue = self._queues[job_id]
+            self._granted.add(queue.popleft())
+            self._active += 1
+            if queue:
+                # Back of the line, so the next slot goes to another job
+                self._order.append(job_id)
+            else:
+                del self._queues[job_id]
+        self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "waiting_jobs": len(self._queues),
+                "max_concurrency": self.max_concurrency,
+            }
+
+
+class LLMBackend(ABC):
+    """
+    Common interface of the LLM engines used by llm.py.
+
+    stream() takes an Ollama /api/generate style request (model, prompt,
+    system, options, format) and yields Ollama style lines ({"response": token,
+    "done": False} ... {"done": True, "prompt_eval_count": ...}), so streaming,
+    early stopping, page batching and the response cache work the same on
+    every engine. Requests wait for a slot of a shared FairScheduler, which
+    reports queue_s, and the request/retry/failure counters are kept here.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, max_concurrency: int = 1, queue_timeout: Optional[float] = None):
+        self.model = model
+        self.queue_timeout = queue_timeout
+        self.scheduler = FairScheduler(max_concurrency)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def stream(self, payload: Dict, job_id: str = "default", metrics: Optional[Dict] = None) -> Iterator[Dict]:
+        """
+        Run a generate request and yield each response line
+
+        Closing the generator early (e.g. once the answer is complete) stops the
+        generation and frees the slot.
+
+        Args:
+            payload: Request body; "model" defaults to the backend's model
+            job_id: Job used for fair scheduling
+            metrics: Optional dict that receives queue_s and retries
+
+        Returns:
+            Iterator over Ollama style response lines
+        """
+        payload = {"model": self.model, **payload, "stream": True}
+        queued_at = time.perf_counter()
+        if not self.scheduler.acquire(job_id, self.queue_timeout):
+            self._count("failures")
+            raise TimeoutError(f"No LLM slot available for job {job_id} within {self.queue_timeout}s")
+        if metrics is not None:
+            metrics["queue_s"] = round(time.perf_counter() - queued_at, 3)
+            metrics["retries"] = 0
+
+        self._count("requests")
+        try:
+            yield from self._generate(payload, metrics)
+        finally:
+            self.scheduler.release()
+
+    @abstractmethod
+    def _generate(self, payload: Dict, metrics: Optional[Dict]) -> Iterator[Dict]:
+        """Engine-specific generation, called while holding a slot"""
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        return {"backend": self.name, "model": self.model, **stats, **self.scheduler.stats()}
+
+    def close(self):
+        pass
+
+
+class OllamaClient(LLMBackend):
+    """
+    Shared client for the Ollama /api/generate endpoint.
+
+    All requests go through one keep-alive requests.Session and a FairScheduler,
+    so the number of in-flight requests stays at the backend's parallel slots
+    however many jobs run. Requests that fail before any output is received
+    (connection errors, timeouts, 429/5xx) are retried with exponential backoff.
+    """
+
+    name = "ollama"
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, url: str = DEFAULT_URL, model: str = DEFAULT_MODEL, max_concurrency: int = 2,
+                 connect_timeout: float = 5.0, read_timeout: float = 300.0, max_retries: int = 3,
+                 backoff_s: float = 1.0, queue_timeout: Optional[float] = None, keep_alive: Optional[str] = None):
+        """
+        Initialize the client
+
+        Args:
+            url: URL of /api/generate
+            model: Default model name
+            max_concurrency: Requests in flight at once (match OLLAMA_NUM_PARALLEL)
+            connect_timeout: Seconds to establish a connection
+            read_timeout: Seconds to wait for the next streamed line
+            max_retries: Retries after the first attempt
+            backoff_s: Base delay, doubled after every retry
+            queue_timeout: Seconds a request may wait for a slot (None waits forever)
+            keep_alive: How long Ollama keeps the model (and its cached prompt prefix) loaded
+        """
+        super().__init__(model, max_concurrency, queue_timeout)
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.keep_alive = keep_alive
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _generate(self, payload: Dict, metrics: Optional[Dict]) -> Iterator[Dict]:
+        """Send the streamed request and yield each decoded JSON line, retrying before the first one"""
+        if self.keep_alive is not None:
+            payload.setdefault("keep_alive", self.keep_alive)
+        attempt = 0
+        while True:
+            received = False
+            try:
+                with self.session.post(self.url, json=payload, stream=True, timeout=self.timeout) as r:
+                    if r.status_code in self.RETRY_STATUS:
+                        raise requests.HTTPError(f"{r.status_code} from {self.url}", response=r)
+                    r.raise_for_status()
+                    # chunk_size=None hands over each line as soon as it arrives
+                    for line in r.iter_lines(chunk_size=None):
+                        if line:
+                            received = True
+                            yield json.loads(line.decode("utf-8"))
+                return
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                retryable = not isinstance(e, requests.HTTPError) or (
+                    e.response is not None and e.response.status_code in self.RETRY_STATUS
+                )
+                # A partly streamed answer cannot be resumed, so only retry before the first line
+                if received or not retryable or attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.backoff_s * (2 ** attempt) * (0.5 + random.random())
+                attempt += 1
+                self._count("retries")
+                if metrics is not None:
+                    metrics["retries"] = attempt
+                print(f"LLM request failed ({e}); retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[tuple, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(client_config: Optional[Dict] = None) -> OllamaClient:
+    """
+    Return the process-wide client for the configured endpoint
+
+    Args:
+        client_config: 'ollama' section of llm-config.yml
+
+    Returns:
+        Shared OllamaClient, created on first use
+    """
+    client_config = client_config or {}
+    url = client_config.get("url", DEFAULT_URL)
+    model = client_config.get("model", DEFAULT_MODEL)
+    with _clients_lock:
+        client = _clients.get((url, model))
+        if client is None:
+            client = OllamaClient(
+                url=url,
+                model=model,
+                max_concurrency=client_config.get("max_concurrency", 2),
+                connect_timeout=client_config.get("connect_timeout", 5.0),
+                read_timeout=client_config.get("read_timeout", 300.0),
+                max_retries=client_config.get("max_retries", 3),
+                backoff_s=client_config.get("backoff_s", 1.0),
+                queue_timeout=client_config.get("queue_timeout"),
+                keep_alive=client_config.get("keep_alive"),
+            )
+            _clients[(url, model)] = client
+        return client
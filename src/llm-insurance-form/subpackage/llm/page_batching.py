@@ -0,0 +1,194 @@
+import json
+import math
+import re
+from typing import Dict, List, Optional
+
+DEFAULT_CHARS_PER_TOKEN = 3.5
+# Tokens of one {"value": ..., "confidence": ...} answer besides its key
+FIELD_ANSWER_TOKENS = 16
+
+
+def page_namespace(page_num: int) -> str:
+    """Top-level key that holds one page's answer in a combined prompt"""
+    return f"page_{page_num}"
+
+
+def estimate_page(page_num: int, schema_text: str, retrieval_result: Dict, field_keys: List[str],
+                  chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> Dict:
+    """
+    Estimate the prompt and answer size of one page
+
+    Args:
+        page_num: Page number
+        schema_text: Contents of the page template
+        retrieval_result: The page's retrieval result (aggregated_text, retrieved_chunks)
+        field_keys: Top-level field names of the page schema
+        chars_per_token: Characters per LLM token
+
+    Returns:
+        Dict with schema/retrieved/output token estimates and the retrieved chunks by id
+    """
+    chunks = {
+        chunk['chunk_id']: chunk['text']
+        for chunk in retrieval_result.get('retrieved_chunks', [])
+        if 'chunk_id' in chunk
+    }
+    if not chunks:
+        # Without chunk ids the page can only share text with itself
+        chunks = {f"page_{page_num}": retrieval_result.get('aggregated_text', '')}
+    return {
+        "page": page_num,
+        "schema_tokens": math.ceil(len(schema_text) / chars_per_token),
+        "retrieved_tokens": math.ceil(sum(len(text) for text in chunks.values()) / chars_per_token),
+        "output_tokens": sum(math.ceil(len(key) / chars_per_token) + FIELD_ANSWER_TOKENS for key in field_keys),
+        "fields": len(field_keys),
+        "chunks": chunks,
+    }
+
+
+def _batch_prompt_tokens(estimates: List[Dict], chars_per_token: float) -> int:
+    chunks = {}
+    for estimate in estimates:
+        chunks.update(estimate["chunks"])
+    retrieved = math.ceil(sum(len(text) for text in chunks.values()) / chars_per_token)
+    return sum(estimate["schema_tokens"] for estimate in estimates) + retrieved
+
+
+def _shared_fraction(estimate: Dict, batch: List[Dict]) -> float:
+    """Share of the page's retrieved chunks already in the batch"""
+    batch_ids = set()
+    for other in batch:
+        batch_ids.update(other["chunks"])
+    return len(batch_ids.intersection(estimate["chunks"])) / max(len(estimate["chunks"]), 1)
+
+
+def plan_page_batches(estimates: List[Dict], max_page_output_tokens: int = 400, max_prompt_tokens: int = 6000,
+                      max_output_tokens: int = 1500, max_pages: int = 3, min_shared_chunks: float = 0.5,
+                      chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> List[List[int]]:
+    """
+    Group pages into LLM calls
+
+    Only small pages (answer of at most max_page_output_tokens) are merged, and
+    only with pages whose retrieved chunks they largely share, so the combined
+    prompt costs little more than either page alone. Pages are added greedily,
+    in page order, to the first batch that stays within the prompt/answer limits.
+
+    Args:
+        estimates: Output of estimate_page for every page
+        max_page_output_tokens: Largest estimated answer of a page that may be merged
+        max_prompt_tokens: Limit on the combined schemas plus retrieved text
+        max_output_tokens: Limit on the combined answer
+        max_pages: Most pages in one call
+        min_shared_chunks: Share of a page's chunks that must already be in the batch
+        chars_per_token: Characters per LLM token
+
+    Returns:
+        List of batches, each a list of page numbers (single pages are their own batch)
+    """
+    batches: List[List[Dict]] = []
+    for estimate in sorted(estimates, key=lambda e: e["page"]):
+        placed = False
+        if estimate["output_tokens"] <= max_page_output_tokens:
+            for batch in batches:
+                if len(batch) >= max_pages or batch[0]["output_tokens"] > max_page_output_tokens:
+                    continue
+                if _shared_fraction(estimate, batch) < min_shared_chunks:
+                    continue
+                candidate = batch + [estimate]
+                if (_batch_prompt_tokens(candidate, chars_per_token) <= max_prompt_tokens
+                        and sum(e["output_tokens"] for e in candidate) <= max_output_tokens):
+                    batch.append(estimate)
+                    placed = True
+                    break
+        if not placed:
+            batches.append([estimate])
+    return [[estimate["page"] for estimate in batch] for batch in batches]
+
+
+def combined_retrieved_text(page_nums: List[int], retrieval_results: Dict) -> str:
+    """Union of the pages' retrieved chunks, each chunk once, in the order first seen"""
+    seen = set()
+    texts = []
+    for page_num in page_nums:
+        result = retrieval_results[page_num]
+        chunks = result.get('retrieved_chunks') or []
+        if not chunks:
+            texts.append(result.get('aggregated_text', ''))
+            continue
+        for chunk in chunks:
+            chunk_id = chunk.get('chunk_id')
+            if chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            texts.append(chunk['text'])
+    return "\n\n".join(texts)
+
+
+def combined_schema_text(page_nums: List[int], field_json_schemas: Dict) -> str:
+    """One JSON template with each page's template under its page_<n> key"""
+    parts = []
+    for page_num in page_nums:
+        schema_text = field_json_schemas.get(page_num, "")
+        start = schema_text.find('{')
+        body = schema_text[start:].strip() if start != -1 else schema_text.strip()
+        parts.append(f'"{page_namespace(page_num)}": {body}')
+    header = ("FIELD JSON WITH INLINE META (guidance in comments — DO NOT return comments). "
+              "Answer every page under its own key:")
+    return header + "\n\n{\n" + ",\n".join(parts) + "\n}"
+
+
+def _extract_object(text: str, start: int) -> Optional[str]:
+    """Balanced {...} starting at or after start, ignoring braces inside strings"""
+    start = text.find('{', start)
+    if start == -1:
+        return None
+    depth = 0
+    in_string = escape = False
+    for pos in range(start, len(text)):
+        ch = text[pos]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == '\\':
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return text[start:pos + 1]
+    return None
+
+
+def split_batch_answer(text: str, page_nums: List[int]) -> Dict[int, Optional[str]]:
+    """
+    Split a combined answer back into one JSON text per page
+
+    Args:
+        text: Raw answer of the combined prompt
+        page_nums: Pages in the batch
+
+    Returns:
+        Dict mapping page number to its answer as JSON text, or None if the page's
+        object could not be found (the caller should query that page on its own)
+    """
+    start = text.find('{')
+    try:
+        answer = json.JSONDecoder().raw_decode(text[start:])[0] if start != -1 else None
+    except json.JSONDecodeError:
+        answer = None
+
+    pages = {}
+    for page_num in page_nums:
+        key = page_namespace(page_num)
+        if isinstance(answer, dict) and isinstance(answer.get(key), dict):
+            pages[page_num] = json.dumps(answer[key], ensure_ascii=False)
+            continue
+        # Malformed combined answer: look for the page's own object
+        match = re.search(rf'"{re.escape(key)}"\s*:', text)
+        pages[page_num] = _extract_object(text, match.end()) if match else None
+    return pages
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+# The SQLite LRU base is shared with the embedding and OCR caches
+sys.path.append(str(Path(__file__).resolve().parent.parent / "helpers"))
+from sqlite_lru_cache import SQLiteLRUCache, get_shared_cache
+
+
+def response_cache_key(request: Dict) -> str:
+    """
+    Return the sha256 of everything that determines the answer
+
+    Args:
+        request: Generate request fields (model, system, prompt, options, format)
+
+    Returns:
+        Hex digest used as the cache key
+    """
+    fields = {key: request.get(key) for key in ("model", "system", "prompt", "options", "format")}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class ResponseCache(SQLiteLRUCache):
+    """
+    Persistent cache of LLM responses.
+
+    Responses are stored in SQLite keyed by the hash of the fully built request
+    (model, system prompt, prompt and generation options), so a retried job or a
+    re-run of the same patient files does not reach the GPU. Entries expire after
+    ttl_s and the least recently used ones are evicted once max_entries or
+    max_bytes is exceeded.
+    """
+
+    table = "responses"
+    columns = """
+        cache_key TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    """
+
+    def __init__(self, db_file: str = "./llm_response_cache.db", ttl_s: float = 7 * 24 * 3600,
+                 max_entries: int = 20000, max_bytes: int = 256 * 1024 ** 2, enabled: bool = True):
+        """
+        Initialize the cache
+
+        Args:
+            db_file: Path of the SQLite database file
+            ttl_s: Seconds a response stays valid (0 for no expiry)
+            max_entries: Maximum number of cached responses (0 for no limit)
+            max_bytes: Maximum total size of cached responses in bytes (0 for no limit)
+            enabled: If False every lookup is a miss and nothing is stored
+        """
+        self.ttl_s = ttl_s
+        self.expired = 0
+        super().__init__(db_file, max_entries, max_bytes, enabled)
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            cache_key: Output of response_cache_key
+
+        Returns:
+            The cached response text, or None on a miss or if it has expired
+        """
+        if not self.enabled:
+            self._count(misses=1)
+            return None
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is not None and self.ttl_s and now - row[1] > self.ttl_s:
+                self._conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                self._conn.commit()
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE cache_key = ?", (now, cache_key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, cache_key: str, model: str, response: str):
+        """Store a response and evict expired or old entries if needed"""
+        if not self.enabled:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, model, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            if self.ttl_s:
+                self._conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,))
+            self._evict()
+            self._conn.commit()
+
+    def stats(self) -> Dict:
+        """Return hit/miss/expiry counters and the current size of the cache"""
+        return dict(super().stats(), expired=self.expired)
+
+    def reset_stats(self):
+        super().reset_stats()
+        with self._lock:
+            self.expired = 0
+
+
+def get_response_cache(cache_config: Optional[Dict] = None) -> ResponseCache:
+    """
+    Return the process-wide cache for the configured database file
+
+    Args:
+        cache_config: 'response_cache' section of llm-config.yml
+
+    Returns:
+        Shared ResponseCache (a disabled one if the config turns it off)
+    """
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", True):
+        return ResponseCache(enabled=False)
+
+    db_file = cache_config.get("db_file", "./llm_response_cache.db")
+    return get_shared_cache(ResponseCache, db_file, lambda: ResponseCache(
+        db_file=db_file,
+        ttl_s=cache_config.get("ttl_hours", 168) * 3600,
+        max_entries=cache_config.get("max_entries", 20000),
+        max_bytes=cache_config.get("max_mb", 256) * 1024 ** 2,
+    ))
@@ -0,0 +1,252 @@
+"""
+Local stand-in for Ollama's streaming /api/generate endpoint.
+
+Streams a small JSON answer followed by trailing prose, one NDJSON line per
+token (or, when the request has a JSON schema "format", an answer shaped like
+that schema in 4-character tokens), with a prefill delay proportional to the prompt length and a fixed
+decode rate. Like Ollama it only runs --parallel requests at once and queues
+the rest, can fail a share of requests with 503 to exercise retries, and
+reports prompt_eval_count/eval_count in the final line. Like a KV prefix
+cache, it keeps the token sequences of the last --cache-slots prompts and only
+prefills the part of a new prompt after the longest cached prefix. GET /stats returns
+request, concurrency and cancellation counters (a stream closed by the client
+counts as in flight until the stub's next write fails).
+
+Run from this directory:
+    python stub_ollama_server.py --port 11434 --parallel 2
+Then point the 'ollama.url' of llm-config.yml at it (the default already does).
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import schema_example
+
+ANSWER_TOKENS = ['{"', 'field', '":', ' {"', 'value', '":', ' "', 'stub', '",', ' "', 'confidence', '":',
+                 ' 0', '.', '5', '}}']
+TRAILING_TOKENS = ['\n\n', 'This', ' answer', ' was', ' generated', ' by', ' the', ' stub', '.']
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing idle keep-alive connections are expected
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class StubState:
+    def __init__(self, parallel: int, cache_slots: int = None):
+        self.slots = threading.Semaphore(parallel)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prompt_tokens = 0
+        self.prompt_eval_tokens = 0
+        self.cache_size = cache_slots or parallel
+        self.prefix_cache = OrderedDict()
+
+    def prefill(self, tokens: list, use_cache: bool = True) -> int:
+        """Return how many tokens must be evaluated, reusing the longest cached prefix"""
+        with self.lock:
+            reused = 0
+            best_key = None
+            if use_cache:
+                for cached in self.prefix_cache:
+                    common = 0
+                    for a, b in zip(cached, tokens):
+                        if a != b:
+                            break
+                        common += 1
+                    if common > reused:
+                        reused, best_key = common, cached
+            if best_key is not None:
+                self.prefix_cache.move_to_end(best_key)
+            self.prefix_cache[tuple(tokens)] = None
+            while len(self.prefix_cache) > self.cache_size:
+                self.prefix_cache.popitem(last=False)
+
+            evaluated = len(tokens) - reused
+            self.prompt_tokens += len(tokens)
+            self.prompt_eval_tokens += evaluated
+            return evaluated
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "prompt_tokens": self.prompt_tokens,
+                "prompt_eval_tokens": self.prompt_eval_tokens,
+            }
+
+
+def prompt_tokens(body: dict) -> list:
+    """Rough tokens of everything the model would prefill, system prompt first"""
+    return f"<system> {body.get('system') or ''} <user> {body.get('prompt') or ''}".split()
+
+
+def answer_tokens(body: dict) -> list:
+    """Tokens of the answer: schema-shaped JSON for a structured request, else the fixed answer and prose"""
+    output_format = body.get("format")
+    if isinstance(output_format, dict):
+        text = json.dumps(schema_example(output_format))
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+    return ANSWER_TOKENS + TRAILING_TOKENS
+
+
+def make_handler(state: StubState, options: argparse.Namespace):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            if options.verbose:
+                super().log_message(format, *args)
+
+        def _send_json(self, status: int, body: dict):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(200, state.stats())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+
+            with state.lock:
+                state.requests += 1
+            if random.random() < options.fail_rate:
+                with state.lock:
+                    state.failed += 1
+                self._send_json(503, {"error": "server busy"})
+                return
+
+            # Requests beyond the parallel slots wait here, like Ollama's queue
+            with state.slots:
+                with state.lock:
+                    state.in_flight += 1
+                    state.max_in_flight = max(state.max_in_flight, state.in_flight)
+                try:
+                    self._generate(body)
+                finally:
+                    with state.lock:
+                        state.in_flight -= 1
+
+        def _generate(self, body: dict):
+            prompt_eval_count = state.prefill(prompt_tokens(body), options.prefix_cache)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+            start = time.perf_counter()
+            prefill_s = prompt_eval_count * options.prefill_ms_per_token / 1000
+            time.sleep(prefill_s)
+
+            tokens = answer_tokens(body)
+            try:
+                for token in tokens:
+                    line = {"model": body.get("model"), "response": token, "done": False}
+                    self._write_chunk((json.dumps(line) + "\n").encode("utf-8"))
+                    time.sleep(1 / options.tokens_per_s)
+                done = {
+                    "model": body.get("model"),
+                    "response": "",
+                    "done": True,
+                    "prompt_eval_count": prompt_eval_count,
+                    "prompt_eval_duration": int(prefill_s * 1e9),
+                    "eval_count": len(tokens),
+                    "eval_duration": int((time.perf_counter() - start - prefill_s) * 1e9),
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                }
+                self._write_chunk((json.dumps(done) + "\n").encode("utf-8"))
+                self._write_chunk(b"")
+            except (BrokenPipeError, ConnectionResetError):
+                # The client closed the stream early
+                with state.lock:
+                    state.cancelled += 1
+                self.close_connection = True
+
+    return Handler
+
+
+def start_stub_server(port: int = 0, parallel: int = 2, tokens_per_s: float = 50.0,
+                      prefill_ms_per_token: float = 0.5, fail_rate: float = 0.0, prefix_cache: bool = True,
+                      cache_slots: int = None, verbose: bool = False):
+    """
+    Start the stub in a background thread
+
+    cache_slots is the number of cached prompt prefixes (defaults to parallel).
+
+    Returns:
+        Tuple of the server (call .shutdown() to stop), its /api/generate URL and its StubState
+    """
+    options = argparse.Namespace(
+        tokens_per_s=tokens_per_s,
+        prefill_ms_per_token=prefill_ms_per_token,
+        fail_rate=fail_rate,
+        prefix_cache=prefix_cache,
+        verbose=verbose,
+    )
+    state = StubState(parallel, cache_slots)
+    server = StubServer(("127.0.0.1", port), make_handler(state, options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/api/generate", state
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Stub Ollama /api/generate server")
+    arg_parser.add_argument("--port", type=int, default=11434)
+    arg_parser.add_argument("--parallel", type=int, default=2, help="Requests generated at once")
+    arg_parser.add_argument("--tokens-per-s", type=float, default=50.0)
+    arg_parser.add_argument("--prefill-ms-per-token", type=float, default=0.5)
+    arg_parser.add_argument("--fail-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    arg_parser.add_argument("--cache-slots", type=int, default=None, help="Cached prompts (default: --parallel)")
+    arg_parser.add_argument("--no-prefix-cache", action="store_true", help="Prefill every prompt in full")
+    arg_parser.add_argument("--verbose", action="store_true")
+    args = arg_parser.parse_args()
+
+    server, url, state = start_stub_server(
+        args.port, args.parallel, args.tokens_per_s, args.prefill_ms_per_token, args.fail_rate,
+        not args.no_prefix_cache, args.cache_slots, args.verbose
+    )
+    print(f"Stub Ollama listening on {url} ({args.parallel} parallel slots)")
+    try:
+        while True:
+            time.sleep(10)
+            print(state.stats())
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark PDF opens, text extraction time and open file handles per upload.
+
+"separate opens" reproduces the previous flow, where the searchability check,
+classification and the parser each opened the PDF and extracted its text on
+their own. "document session" runs the same three steps from one
+DocumentSession. Open file handles are sampled from /proc/self/fd (Linux)
+after every file.
+
+Run from this directory:
+    python benchmark_document_session.py
+    python benchmark_document_session.py --pdf-dir "../../../../data/SCM Records" --repeat 5
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+import fitz
+
+from document_parser import LabResultParser, MedicalRecordsParser
+from document_session import DocumentSession
+from file_upload_processor import _classify_session
+
+DEFAULT_PDF_DIRS = [
+    "../../../../data/SCM Records",
+    "../../../../data/Test Multi File Upload/processed_pdfs",
+]
+
+fitz_opens = 0
+_fitz_open = fitz.open
+
+
+def counting_open(*args, **kwargs):
+    global fitz_opens
+    fitz_opens += 1
+    return _fitz_open(*args, **kwargs)
+
+
+def open_handles() -> int:
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def separate_opens(path: Path, parsers: dict):
+    doc = fitz.open(path)
+    searchable = len("".join(page.get_text("text") for page in doc).strip()) > 100
+    doc.close()
+
+    doc = fitz.open(path)
+    second_line = doc[0].get_text("text").lower().splitlines()[1:2]
+    file_type = "Lab Results" if second_line and "patient results" in second_line[0] else "Medical Records"
+
+    parsers[file_type].extract_text_no_header_footer(path)
+    return searchable, file_type
+
+
+def document_session(path: Path, parsers: dict):
+    with DocumentSession(path) as session:
+        searchable = session.is_searchable()
+        file_type = _classify_session(session)
+        parsers[file_type].extract_text_no_header_footer(path, session.page_texts())
+    return searchable, file_type
+
+
+def run(flow, paths, parsers, repeat: int) -> dict:
+    global fitz_opens
+    fitz_opens = 0
+    peak_handles = open_handles()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            flow(path, parsers)
+            peak_handles = max(peak_handles, open_handles())
+    return {
+        "seconds": time.perf_counter() - start,
+        "opens": fitz_opens,
+        "peak_handles": peak_handles,
+        "handles_after": open_handles(),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Single-open document session benchmark")
+    arg_parser.add_argument("--pdf-dir", action="append", help="Directory of PDFs (repeatable)")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    paths = sorted(path for pdf_dir in (args.pdf_dir or DEFAULT_PDF_DIRS) for path in Path(pdf_dir).glob("*.pdf"))
+    parsers = {"Medical Records": MedicalRecordsParser(), "Lab Results": LabResultParser()}
+    fitz.open = counting_open
+    # Some sample files have damaged streams; MuPDF's warnings would bury the table
+    fitz.TOOLS.mupdf_display_errors(False)
+
+    baseline_handles = open_handles()
+    results = {
+        "separate opens": run(separate_opens, paths, parsers, args.repeat),
+        "document session": run(document_session, paths, parsers, args.repeat),
+    }
+
+    pages = 0
+    for path in paths:
+        with _fitz_open(path) as doc:
+            pages += doc.page_count
+    print(f"{len(paths)} files, {pages} pages, x{args.repeat}; {baseline_handles} handles open at start")
+    print(f"{'flow':<18} {'seconds':>8} {'opens':>6} {'peak fds':>9} {'fds after':>10}")
+    for name, result in results.items():
+        print(f"{name:<18} {result['seconds']:8.2f} {result['opens']:6d} "
+              f"{result['peak_handles']:9d} {result['handles_after']:10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark OCR wall time: one task per file vs page-range tasks.
+
+Builds two scanned (image-only) upload sets from the pages of data/SCM Records:
+one large single scan of --pages pages, and the same pages as --small-files
+separate files. Each set is converted with split_pages=False (one file per
+worker) and split_pages=True (page ranges across the pool), and the wall time
+of convert_files_to_searchable_pdfs is printed. Needs tesseract on PATH.
+
+Run from this directory:
+    python benchmark_ocr.py
+    python benchmark_ocr.py --pages 80 --small-files 10 --workers 8
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+from multiprocessing import cpu_count
+from pathlib import Path
+
+import fitz
+
+from file_upload_processor import PDFUploadProcessor
+
+DEFAULT_SOURCE_DIR = "../../../../data/SCM Records"
+
+
+def render_scanned_pages(source_dir: Path, pages: int, dpi: int) -> list:
+    """Rasterize source pages (cycling through the files) into image-only pages"""
+    images = []
+    sources = sorted(source_dir.glob("*.pdf"))
+    while len(images) < pages:
+        for source in sources:
+            with fitz.open(source) as doc:
+                for page in doc:
+                    images.append((page.rect, page.get_pixmap(dpi=dpi)))
+                    if len(images) == pages:
+                        return images
+    return images
+
+
+def write_scan(images: list, path: Path):
+    with fitz.open() as doc:
+        for rect, pixmap in images:
+            page = doc.new_page(width=rect.width, height=rect.height)
+            page.insert_image(page.rect, pixmap=pixmap)
+        doc.save(path)
+
+
+def time_conversion(upload_dir: Path, split_pages: bool, workers: int, pages_per_task: int) -> float:
+    shutil.rmtree(upload_dir / "processed_pdfs", ignore_errors=True)
+    processor = PDFUploadProcessor(str(upload_dir), num_workers=workers, ocr_pages_per_task=pages_per_task)
+    start = time.perf_counter()
+    processor.convert_files_to_searchable_pdfs(multi=True, split_pages=split_pages)
+    return time.perf_counter() - start
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="OCR parallelism benchmark")
+    arg_parser.add_argument("--source-dir", default=DEFAULT_SOURCE_DIR)
+    arg_parser.add_argument("--pages", type=int, default=40)
+    arg_parser.add_argument("--small-files", type=int, default=10)
+    arg_parser.add_argument("--workers", type=int, default=cpu_count())
+    arg_parser.add_argument("--pages-per-task", type=int, default=4)
+    arg_parser.add_argument("--dpi", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    if shutil.which("tesseract") is None:
+        print("tesseract is not installed; OCR cannot run (apt-get install tesseract-ocr)")
+        return
+
+    images = render_scanned_pages(Path(args.source_dir), args.pages, args.dpi)
+    with tempfile.TemporaryDirectory() as tmp:
+        large_dir = Path(tmp) / "large"
+        small_dir = Path(tmp) / "small"
+        large_dir.mkdir()
+        small_dir.mkdir()
+        write_scan(images, large_dir / "large_scan.pdf")
+        per_file = max(1, len(images) // args.small_files)
+        for i in range(0, len(images), per_file):
+            write_scan(images[i:i + per_file], small_dir / f"scan_{i // per_file:03d}.pdf")
+
+        results = []
+        for name, upload_dir in (("1 large file", large_dir), (f"{args.small_files} small files", small_dir)):
+            for split_pages in (False, True):
+                seconds = time_conversion(upload_dir, split_pages, args.workers, args.pages_per_task)
+                results.append((name, "page ranges" if split_pages else "whole files", seconds))
+
+    print(f"\n{len(images)} scanned pages, {args.workers} workers, {args.pages_per_task} pages per task")
+    print(f"{'upload':<16} {'mode':<12} {'wall s':>7}")
+    for name, mode, seconds in results:
+        print(f"{name:<16} {mode:<12} {seconds:7.1f}")
+
+
+if __name__ == "__main__":
+    main()
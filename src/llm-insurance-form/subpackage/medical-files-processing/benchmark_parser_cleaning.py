@@ -0,0 +1,94 @@
+"""
+Microbenchmark of MedicalRecordsParser's header/footer filtering and abbreviation expansion.
+
+Builds a long record by repeating the pages of a searchable SCM record up to
+--pages pages, then times extract_text_no_header_footer and normalize_formatting
+(over every DMO section) against the previous per-pattern loops, and checks
+that both give the same text.
+
+Run from this directory:
+    python benchmark_parser_cleaning.py
+    python benchmark_parser_cleaning.py --pages 800 --repeat 5
+"""
+
+import argparse
+import re
+import time
+from typing import List
+
+import fitz
+
+from document_parser import MedicalRecordsParser
+
+DEFAULT_PDF = "../../../../data/Test Multi File Upload/processed_pdfs/OCR_Redacted - SCM_Patient 2_2.pdf"
+
+
+def legacy_strip_header_footer(parser: MedicalRecordsParser, page_texts: List[str]) -> str:
+    """Previous implementation: every pattern lowercased and tested per line"""
+    pages = []
+    for text in page_texts:
+        text = text.replace("#—! ", "")
+        lines = []
+        for line in text.splitlines():
+            line_lower = line.lower()
+            if any(p.lower() in line_lower for p in parser.hospital_patterns):
+                continue
+            if any(p.lower() in line_lower for p in parser.footer_patterns):
+                continue
+            lines.append(line)
+        pages.append("\n".join(lines).strip())
+    return "\n\n".join(pages)
+
+
+def legacy_normalize_formatting(parser: MedicalRecordsParser, text: str) -> str:
+    """Previous implementation: one re.sub over the text per abbreviation"""
+    text = parser._date_normalize_re.sub(
+        lambda m: f"{m.group(3)}-{parser.month_abbr_to_num(m.group(2))}-{int(m.group(1)):02d}",
+        text,
+    )
+    for abbr, full in parser.abbr_map.items():
+        text = re.sub(rf"\b{re.escape(abbr)}\b", full, text)
+    text = text.replace("\n", " ")
+    return parser._non_ascii_re.sub("", text)
+
+
+def best_of(repeat: int, fn, *args):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Header/footer and abbreviation microbenchmark")
+    arg_parser.add_argument("--pdf", default=DEFAULT_PDF, help="Searchable medical record PDF")
+    arg_parser.add_argument("--pages", type=int, default=400)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    with fitz.open(args.pdf) as doc:
+        source_pages = [page.get_text("text") for page in doc]
+    page_texts = [source_pages[i % len(source_pages)] for i in range(args.pages)]
+    parser = MedicalRecordsParser()
+
+    old_s, old_text = best_of(args.repeat, legacy_strip_header_footer, parser, page_texts)
+    new_s, new_text = best_of(args.repeat, parser.extract_text_no_header_footer, args.pdf, page_texts)
+    assert old_text == new_text, "header/footer filtering changed the text"
+
+    sections = [parser.remove_admin_noise(sec) for sec in parser.extract_dmo_sections(new_text)]
+    old_norm_s, old_norm = best_of(args.repeat, lambda: [legacy_normalize_formatting(parser, s) for s in sections])
+    new_norm_s, new_norm = best_of(args.repeat, lambda: [parser.normalize_formatting(s) for s in sections])
+    assert old_norm == new_norm, "abbreviation expansion changed the text"
+
+    lines = sum(text.count("\n") + 1 for text in page_texts)
+    chars = sum(len(s) for s in sections)
+    print(f"{args.pages} pages, {lines} lines, {len(sections)} DMO sections ({chars} chars), best of {args.repeat}")
+    print(f"{'step':<22} {'before s':>9} {'after s':>9} {'speedup':>8}")
+    print(f"{'header/footer filter':<22} {old_s:9.4f} {new_s:9.4f} {old_s / new_s:7.1f}x")
+    print(f"{'normalize_formatting':<22} {old_norm_s:9.4f} {new_norm_s:9.4f} {old_norm_s / new_norm_s:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Benchmark regex compilation in the document parsers.
+
+Builds a long lab report and a long medical record by repeating the pages of
+searchable sample files, then runs lab test parsing (parse_all_tests plus
+normalize_test_details per test) and subsection splitting (split_into_subsections
+per DMO section) with the previous per-call patterns and with the patterns the
+parsers now compile once. Prints the time, the number of pattern lookups in re's
+cache (re._compile calls) and the number of actual compilations, and checks
+that both versions give the same results. Parser construction is counted too:
+a second parser with the same config reuses the first one's compiled patterns.
+
+Run from this directory:
+    python benchmark_parser_regex.py
+    python benchmark_parser_regex.py --pages 600 --repeat 5
+"""
+
+import argparse
+import re
+import time
+from typing import Dict, List
+
+import fitz
+
+import document_parser
+from document_parser import LabResultParser, MedicalRecordsParser
+
+DEFAULT_LAB_PDF = "../../../../data/Lab Results/Converted/Redacted - Lab Results_Patient2_Converted.pdf"
+DEFAULT_RECORD_PDF = "../../../../data/Test Multi File Upload/processed_pdfs/OCR_Redacted - SCM_Patient 2_2.pdf"
+
+counts = {"lookups": 0, "compiles": 0}
+_re_compile = re._compile
+_sre_compile = re._compiler.compile
+
+
+def counting_lookup(*args, **kwargs):
+    counts["lookups"] += 1
+    return _re_compile(*args, **kwargs)
+
+
+def counting_compile(*args, **kwargs):
+    counts["compiles"] += 1
+    return _sre_compile(*args, **kwargs)
+
+
+# --- Previous implementations: patterns rebuilt on every call ---
+def legacy_clean_test_name(parser: LabResultParser, raw_header: str) -> str:
+    stopwords = "|".join(parser.config["test_detection"]["name_stopwords"])
+    match = re.match(rf"(.*?)(?:\s+(?:{stopwords})|$)", raw_header, re.IGNORECASE)
+    clean_name = match.group(1).strip() if match and match.group(1) else raw_header
+    return re.sub(r"\s+", " ", clean_name).strip()
+
+
+def legacy_parse_all_tests(parser: LabResultParser, text: str) -> List[Dict[str, str]]:
+    datetime_pattern = re.compile(parser._REGEX_DATETIME_PATTERN, re.DOTALL)
+    date_pattern = re.compile(parser._REGEX_DATE_PATTERN)
+    parts = datetime_pattern.split(text)
+    tests = []
+    for i in range(1, len(parts), 2):
+        stamp = parts[i].strip()
+        body = parts[i + 1].strip() if i + 1 < len(parts) else ""
+        date_match = date_pattern.match(stamp)
+        date = date_match.group(1) if date_match else "UNKNOWN"
+        test_name = legacy_clean_test_name(parser, body.split("\n", 1)[0].strip())
+        if test_name and body:
+            tests.append({"date": date, "test_name": test_name, "raw_details": body})
+
+    aggregated = []
+    current = tests[0] if tests else None
+
+    def key(d, n):
+        return d + "-" + re.sub(r"[,\s\.]", "", n).lower()
+
+    for next_test in tests[1:]:
+        if key(current["date"], current["test_name"]) == key(next_test["date"], next_test["test_name"]):
+            current["raw_details"] += "\n\n" + next_test["raw_details"]
+        else:
+            aggregated.append(current)
+            current = next_test
+    if current:
+        aggregated.append(current)
+    return aggregated
+
+
+def legacy_normalize_test_details(parser: LabResultParser, text: str) -> str:
+    cleanup_words = "|".join(parser.config["cleanup_words"])
+    text = re.sub(rf"({cleanup_words})\s*", " ", text, flags=re.IGNORECASE)
+    text = re.sub(r"\s*\n\s*", "\n", text)
+    return re.sub(r" {2,}", " ", text).strip()
+
+
+def legacy_split_into_subsections(parser: MedicalRecordsParser, text: str) -> Dict[str, str]:
+    headers = parser.subsection_headers
+    normalized_headers = {h.upper(): h for h in headers}
+    pattern = "(" + "|".join([re.escape(h) + ":?" for h in headers]) + ")"
+    parts = re.split(pattern, text, flags=re.IGNORECASE)
+    subsections, buffer = {}, []
+    current_header = "General"
+    for part in parts:
+        candidate = part.strip().rstrip(":")
+        if candidate.upper() in normalized_headers:
+            if buffer:
+                content = " ".join(buffer).strip()
+                if content:
+                    subsections[current_header] = content
+                buffer = []
+            current_header = normalized_headers[candidate.upper()]
+        else:
+            buffer.append(part)
+    if buffer:
+        content = " ".join(buffer).strip()
+        if content:
+            subsections[current_header] = content
+    return {k: v for k, v in subsections.items() if v.strip()}
+
+
+def measure(repeat: int, fn):
+    counts.update(lookups=0, compiles=0)
+    re.purge()
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, counts["lookups"], counts["compiles"], result
+
+
+def repeated_pages(pdf_path: str, pages: int) -> List[str]:
+    with fitz.open(pdf_path) as doc:
+        source_pages = [page.get_text("text") for page in doc]
+    return [source_pages[i % len(source_pages)] for i in range(pages)]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Parser regex compilation benchmark")
+    arg_parser.add_argument("--lab-pdf", default=DEFAULT_LAB_PDF)
+    arg_parser.add_argument("--record-pdf", default=DEFAULT_RECORD_PDF)
+    arg_parser.add_argument("--pages", type=int, default=300)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    args = arg_parser.parse_args()
+
+    re._compile = counting_lookup
+    re._compiler.compile = counting_compile
+
+    document_parser.compile_medical_records_patterns.cache_clear()
+    document_parser.compile_lab_result_patterns.cache_clear()
+    re.purge()
+    init_rows = []
+    for label in ("first parsers", "second parsers"):
+        counts.update(lookups=0, compiles=0)
+        lab_parser, record_parser = LabResultParser(), MedicalRecordsParser()
+        init_rows.append((label, counts["lookups"], counts["compiles"]))
+
+    lab_text = lab_parser.extract_text_no_header_footer(args.lab_pdf, repeated_pages(args.lab_pdf, args.pages))
+    record_text = record_parser.extract_text_no_header_footer(
+        args.record_pdf, repeated_pages(args.record_pdf, args.pages)
+    )
+    sections = [
+        record_parser.normalize_formatting(record_parser.remove_admin_noise(sec))
+        for sec in record_parser.extract_dmo_sections(record_text)
+    ]
+
+    def lab_before():
+        tests = legacy_parse_all_tests(lab_parser, lab_text)
+        return [legacy_normalize_test_details(lab_parser, t["raw_details"]) for t in tests]
+
+    def lab_after():
+        tests = lab_parser.parse_all_tests(lab_text)
+        return [lab_parser.normalize_test_details(t["raw_details"]) for t in tests]
+
+    rows = []
+    results = {}
+    for name, fn in (
+        ("lab tests (before)", lab_before),
+        ("lab tests (after)", lab_after),
+        ("subsections (before)", lambda: [legacy_split_into_subsections(record_parser, s) for s in sections]),
+        ("subsections (after)", lambda: [record_parser.split_into_subsections(s) for s in sections]),
+    ):
+        seconds, lookups, compiles, results[name] = measure(args.repeat, fn)
+        rows.append((name, seconds, lookups, compiles))
+
+    assert results["lab tests (before)"] == results["lab tests (after)"], "lab parsing changed"
+    assert results["subsections (before)"] == results["subsections (after)"], "subsection splitting changed"
+
+    print(f"{args.pages} pages each: {len(results['lab tests (after)'])} lab tests, "
+          f"{len(sections)} DMO sections; best of {args.repeat}, counts over all runs")
+    print(f"{'step':<22} {'seconds':>8} {'lookups':>8} {'compiles':>9}")
+    for name, seconds, lookups, compiles in rows:
+        print(f"{name:<22} {seconds:8.4f} {lookups:8d} {compiles:9d}")
+    for label, lookups, compiles in init_rows:
+        print(f"{label + ' init':<22} {'':>8} {lookups:8d} {compiles:9d}")
+
+
+if __name__ == "__main__":
+    main()
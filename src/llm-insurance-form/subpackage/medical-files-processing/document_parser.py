@@ -1,13 +1,76 @@
 import json
 import re
 from collections import defaultdict
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, List, NamedTuple, Optional, Pattern, Tuple, Union
 
 import fitz
 import yaml
 
 
+# --- CONFIG-DERIVED PATTERNS (compiled once per distinct config) ---
+# The builders below are cached on the (hashable) config values, so every parser
+# instance with the same config in a process shares one set of compiled patterns.
+# Pool workers build them in their initializer, or inherit them when forked.
+
+
+class MedicalRecordsPatterns(NamedTuple):
+    header_footer: Optional[Pattern]
+    abbreviation: Optional[Pattern]
+    subsection_split: Pattern
+
+
+class LabResultPatterns(NamedTuple):
+    test_name: Pattern
+    cleanup_words: Pattern
+
+
+@lru_cache(maxsize=None)
+def compile_medical_records_patterns(
+    line_patterns: Tuple[str, ...], abbreviations: Tuple[str, ...], subsection_headers: Tuple[str, ...]
+) -> MedicalRecordsPatterns:
+    """Compile the config-derived patterns of MedicalRecordsParser."""
+    return MedicalRecordsPatterns(
+        # REGEX: One alternation of every lowercased header/footer pattern, so each
+        # line is checked in a single pass (same result as a substring test per pattern)
+        header_footer=(
+            re.compile("|".join(re.escape(p.lower()) for p in line_patterns))
+            if line_patterns
+            else None
+        ),
+        # REGEX: One alternation of every abbreviation (longest first) as whole words,
+        # expanded in a single pass with a dict lookup (e.g. '\b(?:URTI|ANC|...)\b')
+        abbreviation=(
+            re.compile(
+                r"\b(?:"
+                + "|".join(re.escape(a) for a in sorted(abbreviations, key=len, reverse=True))
+                + r")\b"
+            )
+            if abbreviations
+            else None
+        ),
+        # REGEX: Split pattern built from config headers, e.g. (Header 1:?|Header 2:?)
+        subsection_split=re.compile(
+            "(" + "|".join([re.escape(h) + ":?" for h in subsection_headers]) + ")",
+            re.IGNORECASE,
+        ),
+    )
+
+
+@lru_cache(maxsize=None)
+def compile_lab_result_patterns(
+    name_stopwords: Tuple[str, ...], cleanup_words: Tuple[str, ...]
+) -> LabResultPatterns:
+    """Compile the config-derived patterns of LabResultParser."""
+    return LabResultPatterns(
+        # REGEX: Match and capture the test name (group 1), stopping before any defined stopword
+        test_name=re.compile(rf"(.*?)(?:\s+(?:{'|'.join(name_stopwords)})|$)", re.IGNORECASE),
+        # REGEX: Cleanup words (defined in YAML) followed by optional whitespace
+        cleanup_words=re.compile(rf"({'|'.join(cleanup_words)})\s*", re.IGNORECASE),
+    )
+
+
 class MedicalRecordsParser:
     # --- REGEX PATTERNS (Centralized) ---
 
@@ -95,26 +158,39 @@ class MedicalRecordsParser:
         self.month_map = norm.get("month_map", {})
         self.abbr_map = norm.get("abbreviation_map", {})
 
+        # --- Config-derived patterns, shared by every parser with this config ---
+        patterns = compile_medical_records_patterns(
+            tuple(self.hospital_patterns + self.footer_patterns),
+            tuple(self.abbr_map),
+            tuple(self.subsection_headers),
+        )
+        self._header_footer_re = patterns.header_footer
+        self._abbreviation_re = patterns.abbreviation
+        self._subsection_split_re = patterns.subsection_split
+        self._normalized_subsection_headers = {h.upper(): h for h in self.subsection_headers}
+        # REGEX: Removes leading non-word characters before matching a DMO header
+        self._leading_non_word_re = re.compile(r"^[^\w]*")
+
     # -------------------------
     # PDF TEXT EXTRACTION / CLEANING
     # -------------------------
-    def extract_text_no_header_footer(self, pdf_path: Union[str, Path]) -> str:
-        doc = fitz.open(pdf_path)
+    def extract_text_no_header_footer(
+        self, pdf_path: Union[str, Path], page_texts: Optional[List[str]] = None
+    ) -> str:
+        """page_texts (one string per page) skips reading the PDF when the text is already extracted."""
+        if page_texts is None:
+            with fitz.open(pdf_path) as doc:
+                page_texts = [page.get_text("text") for page in doc]
         pages: List[str] = []
+        header_footer_re = self._header_footer_re
 
-        for page in doc:
-            text = page.get_text("text")
+        for text in page_texts:
             text = text.replace("#—! ", "")
 
-            # filter out hospital header and footer lines (using simple string contains)
+            # filter out hospital header and footer lines (simple string contains, all patterns at once)
             lines = []
             for line in text.splitlines():
-                line_lower = line.lower()
-                # skip hospital header lines
-                if any(p.lower() in line_lower for p in self.hospital_patterns):
-                    continue
-                # skip footer lines
-                if any(p.lower() in line_lower for p in self.footer_patterns):
+                if header_footer_re is not None and header_footer_re.search(line.lower()):
                     continue
                 lines.append(line)
             pages.append("\n".join(lines).strip())
@@ -124,8 +200,8 @@ class MedicalRecordsParser:
     # HELPERS: header/junk detection
     # -------------------------
     def match_dmo_section_header(self, line: str) -> Optional[re.Match]:
-        # REGEX: Removes leading non-word characters before matching header
-        clean_line = re.sub(r"^[^\w]*", "", line)
+        # REGEX: Uses pre-compiled pattern to remove leading non-word characters
+        clean_line = self._leading_non_word_re.sub("", line)
 
         # REGEX: Uses pre-compiled DMO header pattern
         match = self.DMO_HEADER_REGEX.search(clean_line)
@@ -200,15 +276,10 @@ class MedicalRecordsParser:
     # SUBSECTION SPLITTING
     # -------------------------
     def split_into_subsections(self, text: str) -> Dict[str, str]:
-        headers = self.subsection_headers
-        normalized_headers = {h.upper(): h for h in headers}
+        normalized_headers = self._normalized_subsection_headers
 
-        # REGEX: Dynamically builds a split pattern from config headers
-        # e.g., (Header 1:?|Header 2:?)
-        pattern = "(" + "|".join([re.escape(h) + ":?" for h in headers]) + ")"
-
-        # REGEX: Splits the text by the dynamic header pattern
-        parts = re.split(pattern, text, flags=re.IGNORECASE)
+        # REGEX: Splits the text by the pre-compiled header pattern built from config
+        parts = self._subsection_split_re.split(text)
         subsections, buffer = {}, []
         current_header = "General"
 
@@ -260,9 +331,9 @@ class MedicalRecordsParser:
             lambda m: f"{m.group(3)}-{self.month_abbr_to_num(m.group(2))}-{int(m.group(1)):02d}",
             text,
         )
-        for abbr, full in self.abbr_map.items():
-            # REGEX: Dynamically builds regex to replace abbreviations (e.g., '\bSOB\b')
-            text = re.sub(rf"\b{re.escape(abbr)}\b", full, text)
+        if self._abbreviation_re is not None:
+            # REGEX: Uses pre-compiled alternation to expand all abbreviations in one pass
+            text = self._abbreviation_re.sub(lambda m: self.abbr_map[m.group(0)], text)
 
         text = text.replace("\n", " ")
         # REGEX: Uses pre-compiled pattern to remove non-ASCII chars
@@ -303,8 +374,10 @@ class MedicalRecordsParser:
     # -------------------------
     # TIMELINE BUILDER
     # -------------------------
-    def build_timeline(self, pdf_path: Union[str, Path]) -> Dict[str, List[Dict]]:
-        raw_text = self.extract_text_no_header_footer(pdf_path)
+    def build_timeline(
+        self, pdf_path: Union[str, Path], page_texts: Optional[List[str]] = None
+    ) -> Dict[str, List[Dict]]:
+        raw_text = self.extract_text_no_header_footer(pdf_path, page_texts)
         dmo_sections = self.extract_dmo_sections(raw_text)
 
         timeline = defaultdict(list)
@@ -359,7 +432,7 @@ class LabResultParser:
     # -----------------------------------------------------------
 
     def __init__(self, config_path: Union[str, Path] = "document_parser_config.yaml"):
-        """Initialize parser and load YAML config."""
+        """Initialize parser, load YAML config, and pre-compile regex patterns."""
         with open(config_path, "r", encoding="utf-8") as f:
             self.config = yaml.safe_load(f).get("lab_results_config", {})
 
@@ -379,23 +452,44 @@ class LabResultParser:
             for pat in self._REGEX_FOOTER_PATTERNS
         ]
 
+        # Fixed patterns of text cleanup, test splitting and detail normalization
+        self._non_ascii_re = re.compile(r"[^\x00-\x7F\n\r]+")
+        self._blank_lines_re = re.compile(r"\n\s*\n\s*\n+")
+        self._multi_space_re = re.compile(r" {2,}")
+        self._whitespace_re = re.compile(r"\s+")
+        self._line_break_re = re.compile(r"\s*\n\s*")
+        self._test_key_re = re.compile(r"[,\s\.]")
+        self._datetime_re = re.compile(self._REGEX_DATETIME_PATTERN, re.DOTALL)
+        self._date_re = re.compile(self._REGEX_DATE_PATTERN)
+
+        # Config-derived patterns, shared by every parser with this config
+        patterns = compile_lab_result_patterns(
+            tuple(self.config["test_detection"]["name_stopwords"]),
+            tuple(self.config["cleanup_words"]),
+        )
+        self._test_name_re = patterns.test_name
+        self._cleanup_words_re = patterns.cleanup_words
+
     # =====================================================
     # 1. PDF TEXT CLEANING
     # =====================================================
-    def extract_text_no_header_footer(self, pdf_path: Union[str, Path]) -> str:
+    def extract_text_no_header_footer(
+        self, pdf_path: Union[str, Path], page_texts: Optional[List[str]] = None
+    ) -> str:
         """
         Extract PDF text while removing headers and footers.
+        page_texts (one string per page) skips reading the PDF when the text is already extracted.
         """
-        doc = fitz.open(pdf_path)
+        if page_texts is None:
+            with fitz.open(pdf_path) as doc:
+                page_texts = [page.get_text("text") for page in doc]
         pages = []
 
         # Header and footer patterns are already compiled in __init__
         header_patterns = self._compiled_header_patterns
         footer_patterns = self._compiled_footer_patterns
 
-        for page in doc:
-            text = page.get_text("text")
-
+        for text in page_texts:
             # Remove headers
             for pat in header_patterns:
                 text = pat.sub("", text)
@@ -406,11 +500,11 @@ class LabResultParser:
 
             # Cleanup text
             # REGEX: Removes non-standard ASCII characters
-            text = re.sub(r"[^\x00-\x7F\n\r]+", "", text)
+            text = self._non_ascii_re.sub("", text)
             # REGEX: Collapses three or more consecutive newline/whitespace blocks into two newlines
-            text = re.sub(r"\n\s*\n\s*\n+", "\n\n", text)
+            text = self._blank_lines_re.sub("\n\n", text)
             # REGEX: Collapses two or more consecutive spaces into a single space
-            text = re.sub(r" {2,}", " ", text)
+            text = self._multi_space_re.sub(" ", text)
 
             pages.append(text.strip())
 
@@ -423,13 +517,12 @@ class LabResultParser:
         """
         Normalize and clean test names extracted from lab results.
         """
-        stopwords = "|".join(self.config["test_detection"]["name_stopwords"])
-        # REGEX: Match and capture the test name (group 1), stopping before any defined stopword
-        match = re.match(rf"(.*?)(?:\s+(?:{stopwords})|$)", raw_header, re.IGNORECASE)
+        # REGEX: Uses pre-compiled pattern to capture the test name (group 1) before any stopword
+        match = self._test_name_re.match(raw_header)
 
         clean_name = match.group(1).strip() if match and match.group(1) else raw_header
         # REGEX: Collapse multiple spaces after stopword removal
-        clean_name = re.sub(r"\s+", " ", clean_name).strip()
+        clean_name = self._whitespace_re.sub(" ", clean_name).strip()
 
         return clean_name
 
@@ -440,10 +533,9 @@ class LabResultParser:
         """
         Split and group all lab test sections by date.
         """
-        # REGEX: Pattern to split text blocks by date and time (from internal constant)
-        datetime_pattern = re.compile(self._REGEX_DATETIME_PATTERN, re.DOTALL)
-        # REGEX: Pattern to extract just the date part (from internal constant)
-        date_pattern = re.compile(self._REGEX_DATE_PATTERN)
+        # REGEX: Pre-compiled patterns to split by date and time, and to extract the date part
+        datetime_pattern = self._datetime_re
+        date_pattern = self._date_re
 
         # REGEX: Split the entire document text, capturing the datetime stamp as a delimiter
         parts = datetime_pattern.split(text)
@@ -470,7 +562,7 @@ class LabResultParser:
 
         def key(d, n):
             # REGEX: Normalizes test name by removing commas, spaces, and periods for stable comparison
-            return d + "-" + re.sub(r"[,\s\.]", "", n).lower()
+            return d + "-" + self._test_key_re.sub("", n).lower()
 
         for next_test in tests[1:]:
             if key(current["date"], current["test_name"]) == key(
@@ -492,23 +584,24 @@ class LabResultParser:
         """
         Clean up test detail text.
         """
-        cleanup_words = "|".join(self.config["cleanup_words"])
         # REGEX: Substitute all cleanup words (defined in YAML) with a single space
-        text = re.sub(rf"({cleanup_words})\s*", " ", text, flags=re.IGNORECASE)
+        text = self._cleanup_words_re.sub(" ", text)
         # REGEX: Collapse empty lines/lines with only whitespace
-        text = re.sub(r"\s*\n\s*", "\n", text)
+        text = self._line_break_re.sub("\n", text)
         # REGEX: Collapse multiple spaces
-        text = re.sub(r" {2,}", " ", text).strip()
+        text = self._multi_space_re.sub(" ", text).strip()
         return text
 
     # =====================================================
     # 5. TIMELINE BUILDER
     # =====================================================
-    def build_timeline(self, pdf_path: Union[str, Path]) -> Dict[str, List[Dict]]:
+    def build_timeline(
+        self, pdf_path: Union[str, Path], page_texts: Optional[List[str]] = None
+    ) -> Dict[str, List[Dict]]:
         """
         Build chronological test results timeline.
         """
-        raw_text = self.extract_text_no_header_footer(pdf_path)
+        raw_text = self.extract_text_no_header_footer(pdf_path, page_texts)
         tests = self.parse_all_tests(raw_text)
 
         # 1. Group all individual tests into a temporary dictionary by date.
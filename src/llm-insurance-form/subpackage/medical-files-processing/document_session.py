@@ -0,0 +1,74 @@
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import fitz
+
+
+class DocumentSession:
+    """
+    One open PDF and the text of its pages, for the whole life of a file in the pipeline.
+
+    The document is opened on first use and each page's text is extracted once,
+    then shared by searchability checks, classification and parsing. Use it as a
+    context manager (or call close) so the file handle is released as soon as
+    the file is done instead of whenever the garbage collector gets to it.
+    """
+
+    def __init__(self, pdf_path: Union[str, Path], page_texts: Optional[List[str]] = None):
+        """
+        Args:
+            pdf_path: The PDF to read
+            page_texts: Text of every page if already known (e.g. from the OCR
+                cache); the document is then only opened if .doc is accessed
+        """
+        self.pdf_path = Path(pdf_path)
+        self._doc: Optional[fitz.Document] = None
+        self._page_texts: Optional[List[str]] = page_texts
+        self.open_s = 0.0
+        self.extract_s = 0.0
+
+    def __enter__(self) -> "DocumentSession":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def doc(self) -> fitz.Document:
+        """The open fitz.Document, opened on first access"""
+        if self._doc is None:
+            start = time.perf_counter()
+            self._doc = fitz.open(self.pdf_path)
+            self.open_s += time.perf_counter() - start
+        return self._doc
+
+    def page_texts(self) -> List[str]:
+        """Text of every page, extracted on the first call"""
+        if self._page_texts is None:
+            doc = self.doc
+            start = time.perf_counter()
+            self._page_texts = [page.get_text("text") for page in doc]
+            self.extract_s += time.perf_counter() - start
+        return self._page_texts
+
+    def page_text(self, page_index: int) -> str:
+        """Text of one page"""
+        return self.page_texts()[page_index]
+
+    def is_searchable(self, min_chars: int = 100) -> bool:
+        """True if the document has more than min_chars characters of text in total"""
+        return len("".join(self.page_texts()).strip()) > min_chars
+
+    def stats(self) -> Dict:
+        return {
+            "pages": len(self._page_texts) if self._page_texts is not None else None,
+            "open_s": self.open_s,
+            "extract_s": self.extract_s,
+        }
+
+    def close(self):
+        """Release the file handle; cached page texts stay available"""
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
@@ -1,59 +1,202 @@
+import atexit
 import json
 import shutil
+import threading
 import time
 from collections import defaultdict
+from functools import partial
 from multiprocessing import Pool, cpu_count
 from pathlib import Path
-from typing import Any, Dict, List, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
 import fitz
 import ocrmypdf
+import yaml
 
 from document_parser import LabResultParser, MedicalRecordsParser
+from document_session import DocumentSession
+from ocr_cache import file_sha256, get_ocr_cache, ocr_cache_key
+
+# Tesseract/ocrmypdf settings; part of the OCR cache key
+OCR_SETTINGS = {"tesseract_pagesegmode": 6, "tesseract_oem": 3, "optimize": 1}
+
+DEFAULT_PARSER_CONFIG = "document_parser_config.yaml"
+
+
+def load_ocr_cache_config(config_path: str = DEFAULT_PARSER_CONFIG) -> Dict[str, Any]:
+    """Return the 'ocr_cache' section of the pipeline config (empty, i.e. disabled, if missing)."""
+    with open(config_path, "r", encoding="utf-8") as f:
+        return (yaml.safe_load(f) or {}).get("ocr_cache", {})
 
 
 # --- Multiprocessing Worker Function (Global Scope) ---
 def _is_pdf_searchable(file_path: Union[str, Path]) -> bool:
     """Helper to check if a PDF has a text layer."""
     try:
-        doc = fitz.open(file_path)
-        # Join text from all pages and strip whitespace
-        text = "".join(page.get_text("text") for page in doc).strip()
-        doc.close()
-        return len(text) > 100
+        with DocumentSession(file_path) as session:
+            return session.is_searchable()
     except Exception as e:
         print(f"Error checking searchability for {Path(file_path).name}: {e}")
         return False
 
 
+def _image_coverage(page: fitz.Page) -> float:
+    """Fraction of the page area covered by placed images, capped at 1."""
+    page_area = abs(page.rect)
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        covered += abs(fitz.Rect(info["bbox"]) & page.rect)
+    return min(1.0, covered / page_area)
+
+
+def _analyze_pdf_pages(
+    file_path: Union[str, Path],
+    min_text_density: float = 2.0,
+    min_image_coverage: float = 0.3,
+) -> List[Dict[str, Any]]:
+    """Decide per page whether the existing text layer is usable or the page needs OCR.
+
+    A page is OCR'd when it has fewer than min_text_density characters per square
+    inch of text and images cover at least min_image_coverage of it. Sparse pages
+    without images (blank or divider pages) are kept as they are.
+
+    Returns:
+        One dict per page: page (1-based), decision ("text" or "ocr"), chars,
+        text_density, image_coverage, analyze_s and ocr_s (filled in once the page
+        is OCR'd). Empty if the file cannot be read.
+    """
+    pages = []
+    try:
+        with fitz.open(file_path) as doc:
+            for page_index, page in enumerate(doc):
+                start = time.perf_counter()
+                chars = len("".join(page.get_text("text").split()))
+                area_sq_in = abs(page.rect) / (72 * 72)
+                text_density = chars / area_sq_in if area_sq_in else 0.0
+                image_coverage = _image_coverage(page)
+                needs_ocr = text_density < min_text_density and image_coverage >= min_image_coverage
+                pages.append({
+                    "page": page_index + 1,
+                    "decision": "ocr" if needs_ocr else "text",
+                    "chars": chars,
+                    "text_density": round(text_density, 2),
+                    "image_coverage": round(image_coverage, 3),
+                    "analyze_s": time.perf_counter() - start,
+                    "ocr_s": 0.0,
+                })
+    except Exception as e:
+        print(f"Error analyzing pages of {Path(file_path).name}: {e}")
+        return []
+    return pages
+
+
 def _convert_scanned_pdf(
-    file_path: Union[str, Path], save_path: Union[str, Path]
+    file_path: Union[str, Path],
+    save_path: Union[str, Path],
+    jobs: Optional[int] = None,
+    force: bool = False,
 ) -> None:
-    """Convert a scanned PDF into a searchable/selectable PDF using OCR."""
+    """Convert a scanned PDF into a searchable/selectable PDF using OCR.
+
+    jobs limits ocrmypdf's own worker processes (None uses every core). Pages
+    that already have some text are skipped unless force is set, which
+    rasterizes and OCRs every page.
+    """
     print(f"Starting OCR for: {Path(file_path).name}...")
+    text_mode = {"force_ocr": True} if force else {"skip_text": True}
     ocrmypdf.ocr(
         file_path,
         save_path,
-        skip_text=True,
-        tesseract_pagesegmode=6,
-        tesseract_oem=3,
-        optimize=1,
+        **text_mode,
+        **OCR_SETTINGS,
         progress_bar=False,
+        jobs=jobs,
     )
     print(f"File converted successfully and saved to: {Path(save_path).name}")
 
 
-def _process_ocr_task(task_data: Tuple[Path, Path]) -> Tuple[str, Path, bool]:
+def _plan_page_ranges(pages: List[int], pages_per_task: int) -> List[Tuple[int, int]]:
+    """Group page indices into runs of consecutive pages, at most pages_per_task long.
+
+    Returns:
+        List of inclusive (from_page, to_page) ranges in page order.
+    """
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1 and page - ranges[-1][0] < pages_per_task:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def _ocr_page_range(
+    task_data: Tuple[Path, int, int, int, Path, int]
+) -> Tuple[str, int, Optional[Path], float]:
     """
-    Worker function for parallel OCR processing.
+    Worker function that OCRs one page range of a file.
 
     Args:
-        task_data: (original_file_path, output_directory_path)
+        task_data: (file_path, part_index, from_page, to_page, parts_directory, ocrmypdf_jobs)
+
+    Returns:
+        Tuple: (original_filename, part_index, searchable_part_path or None on failure, seconds)
+    """
+    file_path, part_index, from_page, to_page, parts_dir, jobs = task_data
+    part_path = parts_dir / f"{file_path.stem}_part{part_index:04d}.pdf"
+    ocr_part_path = parts_dir / f"{file_path.stem}_part{part_index:04d}_ocr.pdf"
+    start = time.perf_counter()
+    try:
+        with fitz.open(file_path) as source, fitz.open() as part:
+            part.insert_pdf(source, from_page=from_page, to_page=to_page)
+            part.save(part_path)
+        # The range only holds pages judged scanned, including ones with a stray text stamp
+        _convert_scanned_pdf(part_path, ocr_part_path, jobs=jobs, force=True)
+        return (file_path.name, part_index, ocr_part_path, time.perf_counter() - start)
+    except Exception as e:
+        print(f"ERROR: Failed to OCR pages {from_page + 1}-{to_page + 1} of {file_path.name}. Error: {e}")
+        return (file_path.name, part_index, None, time.perf_counter() - start)
+
+
+def _merge_ocr_parts(
+    file_path: Path, parts: List[Tuple[int, int, Path]], save_path: Path
+) -> None:
+    """Rebuild a file in page order, taking OCR'd page ranges from their parts
+    and every other page (already searchable) from the original.
+
+    Args:
+        file_path: Original PDF.
+        parts: (from_page, to_page, searchable_part_path) for every OCR'd range.
+        save_path: Where to write the merged searchable PDF.
+    """
+    with fitz.open(file_path) as source, fitz.open() as merged:
+        next_page = 0
+        for from_page, to_page, part_path in sorted(parts):
+            if from_page > next_page:
+                # Pages between OCR'd ranges already have a text layer
+                merged.insert_pdf(source, from_page=next_page, to_page=from_page - 1)
+            with fitz.open(part_path) as part:
+                merged.insert_pdf(part)
+            next_page = to_page + 1
+        if next_page < source.page_count:
+            merged.insert_pdf(source, from_page=next_page, to_page=source.page_count - 1)
+        merged.save(save_path, garbage=3, deflate=True)
+
+
+def _process_ocr_task(task_data: Tuple[Path, Path, Optional[int]]) -> Tuple[str, Path, bool]:
+    """
+    Worker function for parallel OCR processing of whole files.
+
+    Args:
+        task_data: (original_file_path, output_directory_path[, ocrmypdf_jobs])
 
     Returns:
         Tuple: (original_filename, searchable_path, was_ocr_successful)
     """
-    original_file_path, output_path = task_data
+    original_file_path, output_path = task_data[:2]
+    jobs = task_data[2] if len(task_data) > 2 else None
     original_name = original_file_path.name
 
     if not original_file_path.exists():
@@ -72,7 +215,7 @@ def _process_ocr_task(task_data: Tuple[Path, Path]) -> Tuple[str, Path, bool]:
         # Not searchable, run OCR
         ocr_target_path = output_path / f"OCR_{original_name}"
         try:
-            _convert_scanned_pdf(original_file_path, ocr_target_path)
+            _convert_scanned_pdf(original_file_path, ocr_target_path, jobs=jobs)
             return (original_name, ocr_target_path, True)
         except Exception as e:
             print(f"ERROR: Failed to OCR {original_name}. Error: {e}")
@@ -80,12 +223,10 @@ def _process_ocr_task(task_data: Tuple[Path, Path]) -> Tuple[str, Path, bool]:
             return (original_name, original_file_path, False)
 
 
-def _classify_file_type(file_path: Path) -> str:
-    """Global function to classify file type by examining content."""
+def _classify_session(session: DocumentSession) -> str:
+    """Classify an open document by the keywords on its first page."""
     try:
-        doc = fitz.open(file_path)
-        # Check first page for keywords
-        first_page_text = doc[0].get_text("text").lower()
+        first_page_text = session.page_text(0).lower()
         second_line = (
             first_page_text.splitlines()[1]
             if len(first_page_text.splitlines()) > 1
@@ -96,30 +237,59 @@ def _classify_file_type(file_path: Path) -> str:
         else:
             return "Medical Records"
     except Exception as e:
-        print(f"Error classifying {file_path.name}: {e}")
+        print(f"Error classifying {session.pdf_path.name}: {e}")
         return "Unknown"
 
 
-def _process_single_file(file_data: Tuple[str, Path, str]) -> Dict[str, Any]:
+def _classify_file_type(file_path: Path) -> str:
+    """Global function to classify file type by examining content."""
+    with DocumentSession(file_path) as session:
+        return _classify_session(session)
+
+
+# --- Worker State: parsers built once per process ---
+_worker_parser_config = DEFAULT_PARSER_CONFIG
+_worker_parsers: Dict[str, Union[MedicalRecordsParser, LabResultParser]] = {}
+
+
+def _init_worker(parser_config_path: str = DEFAULT_PARSER_CONFIG) -> None:
+    """Pool initializer: load the parser config and compile its patterns once per process."""
+    global _worker_parser_config
+    if _worker_parsers and parser_config_path == _worker_parser_config:
+        return
+    _worker_parser_config = parser_config_path
+    _worker_parsers["Medical Records"] = MedicalRecordsParser(parser_config_path)
+    _worker_parsers["Lab Results"] = LabResultParser(parser_config_path)
+
+
+def _get_parser(file_type: str) -> Union[MedicalRecordsParser, LabResultParser]:
+    """Return this process's parser for a file type, building the parsers on first use."""
+    if not _worker_parsers:
+        _init_worker(_worker_parser_config)
+    return _worker_parsers[file_type]
+
+
+def _process_single_file(
+    file_data: Tuple[str, Path, str, Optional[List[str]]]
+) -> Dict[str, Any]:
     """
     Function executed by each worker process (or sequentially) to run the
     appropriate parsing pipeline. Must be outside the class for multiprocessing.
 
     Args:
-        file_data (Tuple[str, Path, str]): (original_filename, searchable_path, file_type)
+        file_data: (original_filename, searchable_path, file_type[, page_texts]);
+            page_texts is the already extracted text of each page, if any.
 
     Returns:
         Dict[str, Any]: Dictionary containing the filename, type, and structured data.
     """
-    original_filename, searchable_path, file_type = file_data
+    original_filename, searchable_path, file_type = file_data[:3]
+    page_texts = file_data[3] if len(file_data) > 3 else None
 
     try:
-        if file_type == "Lab Results":
-            parser = LabResultParser()
-            structured_data = parser.build_timeline(searchable_path)
-        elif file_type == "Medical Records":
-            parser = MedicalRecordsParser()
-            structured_data = parser.build_timeline(searchable_path)
+        if file_type in ("Lab Results", "Medical Records"):
+            parser = _get_parser(file_type)
+            structured_data = parser.build_timeline(searchable_path, page_texts)
         else:
             structured_data = {"error": "Unknown file type, skipped parsing."}
 
@@ -136,6 +306,196 @@ def _process_single_file(file_data: Tuple[str, Path, str]) -> Dict[str, Any]:
         }
 
 
+def _extract_and_parse_file(
+    file_path: Path, page_texts: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Worker function that classifies and parses one searchable PDF from a single
+    DocumentSession, so the file is opened and its text extracted only once.
+
+    Args:
+        file_path: The searchable PDF.
+        page_texts: Text of each page if already known (restored from the OCR
+            cache), in which case the PDF is not opened for extraction.
+
+    Returns:
+        Dict[str, Any]: Result of _process_single_file.
+    """
+    try:
+        with DocumentSession(file_path, page_texts) as session:
+            page_texts = session.page_texts()
+            file_type = _classify_session(session)
+    except Exception as e:
+        print(f"Error reading {file_path.name}: {e}")
+        return _process_single_file((file_path.name, file_path, "Unknown"))
+
+    print(f"Classified {file_path.name} as {file_type}")
+    return _process_single_file((file_path.name, file_path, file_type, page_texts))
+
+
+def _file_ocr_metrics(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Per-file OCR metrics from the page decisions of _analyze_pdf_pages."""
+    return {
+        "pages": pages,
+        "ocr_pages": sum(page["decision"] == "ocr" for page in pages),
+        "analyze_s": sum(page["analyze_s"] for page in pages),
+        "ocr_s": 0.0,
+    }
+
+
+def _record_ocr_cost(
+    file_metrics: Dict[str, Any], from_page: int, to_page: int, seconds: float
+) -> None:
+    """Add the time of one OCR'd page range to a file's metrics, spread over its pages."""
+    file_metrics["ocr_s"] += seconds
+    for page in file_metrics["pages"][from_page:to_page + 1]:
+        page["ocr_s"] = seconds / (to_page - from_page + 1)
+
+
+def _conversion_failed(file_path: Path) -> Dict[str, Any]:
+    """Result of an upload that could not be made searchable."""
+    return {
+        "original_filename": file_path.name,
+        "file_type": "Unknown",
+        "structured_data": {"error": "Conversion failed, skipped parsing."},
+    }
+
+
+def _run_upload_task(task: Tuple) -> Tuple:
+    """
+    Worker function for one task of PDFUploadProcessor.iter_process_files.
+
+    Args:
+        task: ("parse", upload_name, searchable_path, cached page_texts or None) for
+            a file that is ready to parse, or ("ocr", upload_name, _ocr_page_range
+            task data) for one page range of a scanned file.
+
+    Returns:
+        Tuple: (kind, upload_name, result of _extract_and_parse_file or _ocr_page_range)
+    """
+    kind, upload_name = task[:2]
+    if kind == "parse":
+        return kind, upload_name, _extract_and_parse_file(task[2], task[3])
+    return kind, upload_name, _ocr_page_range(task[2])
+
+
+# --- Timeline Merging ---
+class PatientTimelineMerger:
+    """
+    Builds the combined patient timeline one parsed file at a time.
+
+    Results can be added in any order (e.g. as files finish in parallel); the
+    timeline is assembled in source-file order, so it does not depend on which
+    file finished first.
+    """
+
+    def __init__(self) -> None:
+        self._events_by_file: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+
+    def add_file(self, result: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Converts one file's parsed records into timeline events and keeps them.
+
+        Args:
+            result: Output of _process_single_file (original_filename, file_type, structured_data).
+
+        Returns:
+            Dict: {date: events} added by this file (empty if it was skipped).
+        """
+        file_type = result.get("file_type")
+        structured_data = result.get("structured_data", {})
+        original_filename = result.get("original_filename")
+
+        # Skip files with errors or missing data
+        if not structured_data or "error" in structured_data:
+            print(
+                f"Skipping {original_filename} due to previous parsing error or empty data."
+            )
+            return {}
+
+        file_events: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        # Iterate over the date keys, where the value is expected to be a list of records
+        for date, records_list in structured_data.items():
+
+            # Ensure the data structure is a list of records
+            if not isinstance(records_list, list):
+                print(
+                    f"Warning: Data for {original_filename} on {date} is not a list and was skipped."
+                )
+                continue
+
+            for raw_record in records_list:
+                if file_type == "Lab Results":
+                    # For Lab Results, we add the record under a 'tests' key
+                    event = {
+                        "record_type": file_type,
+                        "source_file": original_filename,
+                        # The raw_record is expected to be a dict of lab results
+                        "tests": [raw_record],
+                    }
+
+                elif file_type == "Medical Records":
+                    # For Medical Records, we merge the raw note data directly into the event
+                    event = {
+                        "record_type": file_type,
+                        "source_file": original_filename,
+                        **raw_record,
+                    }
+                # Future implementations for other file types can be added here in elif blocks
+                else:
+                    continue
+
+                file_events[date].append(event)
+
+        self._events_by_file[original_filename] = dict(file_events)
+        return dict(file_events)
+
+    def timeline(self) -> Dict[str, List[Dict[str, Any]]]:
+        """The combined timeline of every file added so far, keyed by date."""
+        unified_timeline: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for original_filename in sorted(self._events_by_file):
+            for date, events in self._events_by_file[original_filename].items():
+                unified_timeline[date].extend(events)
+        return dict(unified_timeline)
+
+    def __len__(self) -> int:
+        return len(self._events_by_file)
+
+
+# --- Persistent Worker Pools ---
+_worker_pools: Dict[Tuple[int, str], Any] = {}
+_worker_pools_lock = threading.Lock()
+
+
+def get_worker_pool(num_workers: int, parser_config_path: str = DEFAULT_PARSER_CONFIG):
+    """
+    Return the process-wide pool of num_workers workers, started on first use.
+
+    Workers are initialized once with pre-built parsers and reused by every
+    stage and every PDFUploadProcessor, so a job does not pay for forking and
+    re-importing fitz/ocrmypdf.
+    """
+    key = (num_workers, str(parser_config_path))
+    with _worker_pools_lock:
+        pool = _worker_pools.get(key)
+        if pool is None:
+            pool = Pool(num_workers, initializer=_init_worker, initargs=(parser_config_path,))
+            _worker_pools[key] = pool
+        return pool
+
+
+def shutdown_worker_pools() -> None:
+    """Stop every persistent worker pool (also run at interpreter exit)."""
+    with _worker_pools_lock:
+        for pool in _worker_pools.values():
+            pool.terminate()
+            pool.join()
+        _worker_pools.clear()
+
+
+atexit.register(shutdown_worker_pools)
+
+
 # --- Main File Processor Class ---
 class PDFUploadProcessor:
     """
@@ -145,6 +505,11 @@ class PDFUploadProcessor:
     3. Extract and parse content from the PDFs.
     4. Combine structured data into a unified patient timeline.
 
+    Steps 1-3 can run as separate stages (convert_files_to_searchable_pdfs, then
+    extract_and_parse_documents) or streamed file by file (process_files). Parallel
+    work goes to a persistent pool of num_workers processes that is shared by
+    every processor with the same settings.
+
     Attributes:
         input_dir (Path): Directory containing uploaded PDF files.
         output_dir (Path): Directory to save processed searchable PDFs.
@@ -152,12 +517,45 @@ class PDFUploadProcessor:
         structured_data_results (List[Dict[str, Any]]): List to store structured data results
     """
 
-    def __init__(self, uploaded_files_directory: str) -> None:
+    def __init__(
+        self,
+        uploaded_files_directory: str,
+        num_workers: Optional[int] = None,
+        ocr_pages_per_task: int = 8,
+        min_text_density: float = 2.0,
+        min_image_coverage: float = 0.3,
+        ocr_cache_config: Optional[Dict[str, Any]] = None,
+        parser_config_path: str = DEFAULT_PARSER_CONFIG,
+    ) -> None:
         """
         Initializes the processor.
+
+        Args:
+            uploaded_files_directory: Directory containing the uploaded PDFs.
+            num_workers: Worker processes for the parallel stages (default: cpu_count()).
+            ocr_pages_per_task: Most pages of one file OCR'd by a single worker task.
+            min_text_density: Characters per square inch below which a page's text layer is unusable.
+            min_image_coverage: Image-covered fraction from which such a page is treated as scanned.
+            ocr_cache_config: enabled, db_file, max_entries and max_mb of the OCR result cache
+                (default: the 'ocr_cache' section of parser_config_path, shipped disabled).
+            parser_config_path: YAML config of the document parsers and the OCR cache.
         """
         self.input_dir = Path(uploaded_files_directory)
+        self.num_workers = num_workers or cpu_count()
+        self.ocr_pages_per_task = ocr_pages_per_task
+        self.min_text_density = min_text_density
+        self.min_image_coverage = min_image_coverage
+        self.parser_config_path = parser_config_path
         self.output_dir = self.input_dir / "processed_pdfs"
+        # Per-file OCR decisions and costs of the last conversion
+        self.ocr_metrics: Dict[str, Dict[str, Any]] = {}
+        if ocr_cache_config is None:
+            ocr_cache_config = load_ocr_cache_config(parser_config_path)
+        self.ocr_cache = get_ocr_cache(ocr_cache_config)
+        # OCR cache hits and misses of the last conversion (the cache itself is shared by every job)
+        self.ocr_cache_stats: Dict[str, int] = {"hits": 0, "misses": 0}
+        # Page texts of the outputs restored from the OCR cache, keyed by output path
+        self.restored_page_texts: Dict[Path, List[str]] = {}
 
         if not self.input_dir.is_dir():
             raise ValueError(
@@ -171,11 +569,31 @@ class PDFUploadProcessor:
 
         # Removed self.searchable_files
         self.structured_data_results: List[Dict[str, Any]] = []
+        # Timeline merged while results stream in (None until a run fills it)
+        self.timeline_merger: Optional[PatientTimelineMerger] = None
+
+    def _pool(self):
+        """The persistent worker pool for this processor's settings, started on first use."""
+        return get_worker_pool(self.num_workers, self.parser_config_path)
 
-    def convert_files_to_searchable_pdfs(self, multi: bool = False) -> None:
+    def convert_files_to_searchable_pdfs(
+        self, multi: bool = False, split_pages: bool = True
+    ) -> None:
         """
         Processes all uploaded files, performing OCR if they are not already searchable,
         and saves them to the output directory.
+
+        With split_pages, every page is checked for a usable text layer and only the
+        scanned pages are OCR'd, as page ranges spread across the worker pool, then
+        merged back in order with the other pages; decisions and costs are recorded
+        in self.ocr_metrics. Otherwise each file is one task, OCR'd whole unless its
+        combined text is long enough. In parallel mode each ocrmypdf call gets
+        cpu_count() // num_workers jobs, so cores are not oversubscribed.
+
+        With the OCR cache enabled, OCR'd outputs are cached by the sha256 of the
+        upload and the OCR settings, so a file that was converted before is restored
+        without running tesseract; its cached page texts are then reused by
+        extract_and_parse_documents.
         """
         output_path = self.output_dir
         output_path.mkdir(parents=True, exist_ok=True)
@@ -185,27 +603,176 @@ class PDFUploadProcessor:
             f"\n--- Starting OCR Conversion Process (Output Dir: {output_path.resolve()}, Parallel={multi}) ---"
         )
 
+        self.ocr_metrics = {}
+        started_at = time.time()
+        cache_keys = self._restore_cached_ocr(output_path, split_pages)
         task_data = [
             (file_path, output_path)
             for file_path in self.uploaded_files
-            if file_path.exists()
+            if file_path in cache_keys
         ]
 
-        if multi:
-            num_processes = cpu_count()
-            print(f"Using {num_processes} worker processes for OCR.")
-            with Pool(num_processes) as pool:
-                # Run for the side-effect of saving files to disk
-                _ = pool.map(_process_ocr_task, task_data)
+        if split_pages:
+            self._convert_by_page_ranges([file_path for file_path, _ in task_data], output_path, multi)
+        elif multi and task_data:
+            num_processes = self.num_workers
+            jobs = max(1, cpu_count() // num_processes)
+            print(f"Using {num_processes} worker processes for OCR ({jobs} ocrmypdf jobs each).")
+            # Run for the side-effect of saving files to disk
+            _ = self._pool().map(_process_ocr_task, [data + (jobs,) for data in task_data])
         else:
             for data in task_data:
                 _ = _process_ocr_task(data)  # Run for side-effect
 
+        self._store_ocr_results(cache_keys, output_path, started_at)
         print("--- OCR Conversion Process Complete ---")
         print(
             f"Files are now available in the output directory ({output_path.name}) for parsing."
         )
 
+    def _ocr_params(self, split_pages: bool) -> Dict[str, Any]:
+        """Settings that change the OCR output of a file, for the cache key"""
+        params: Dict[str, Any] = dict(OCR_SETTINGS, split_pages=split_pages)
+        if split_pages:
+            params.update(min_text_density=self.min_text_density, min_image_coverage=self.min_image_coverage)
+        return params
+
+    def _restore_cached_ocr(
+        self, output_path: Path, split_pages: bool
+    ) -> Dict[Path, Optional[str]]:
+        """
+        Copy cached OCR outputs of the uploads into the output directory and keep
+        their page texts in self.restored_page_texts.
+
+        Returns:
+            Dict: {file_path: cache_key} for every upload that still has to be
+            converted (cache_key is None if the file could not be hashed).
+        """
+        params = self._ocr_params(split_pages)
+        self.ocr_cache_stats = {"hits": 0, "misses": 0}
+        self.restored_page_texts = {}
+        cache_keys = {}
+        for file_path in self.uploaded_files:
+            if not file_path.exists():
+                continue
+            try:
+                cache_key = ocr_cache_key(file_sha256(file_path), params)
+            except OSError as e:
+                print(f"Error hashing {file_path.name}: {e}")
+                cache_keys[file_path] = None
+                continue
+            ocr_path = output_path / f"OCR_{file_path.name}"
+            page_texts = self.ocr_cache.get(cache_key, ocr_path)
+            if page_texts is not None:
+                print(f"Restored OCR output of {file_path.name} from cache.")
+                self.ocr_metrics[file_path.name] = {"cached": True}
+                self.ocr_cache_stats["hits"] += 1
+                self.restored_page_texts[ocr_path] = page_texts
+            else:
+                cache_keys[file_path] = cache_key
+        return cache_keys
+
+    def _store_ocr_results(
+        self, cache_keys: Dict[Path, Optional[str]], output_path: Path, started_at: float
+    ) -> None:
+        """Cache the OCR output of every file that was converted in this run."""
+        for file_path, cache_key in cache_keys.items():
+            self._store_ocr_result(file_path, cache_key, output_path, started_at)
+        self._print_ocr_cache_stats()
+
+    def _store_ocr_result(
+        self, file_path: Path, cache_key: Optional[str], output_path: Path, started_at: float
+    ) -> None:
+        """Cache the OCR output of one file, if it was OCR'd in this run (a cache miss)."""
+        ocr_path = output_path / f"OCR_{file_path.name}"
+        # Skip digital files (copied, not OCR'd) and outputs left over from an earlier run
+        if not ocr_path.exists() or ocr_path.stat().st_mtime < started_at:
+            return
+        self.ocr_cache_stats["misses"] += 1
+        if cache_key is None:
+            return
+        try:
+            self.ocr_cache.put(cache_key, file_path.name, ocr_path)
+        except Exception as e:
+            print(f"Error caching OCR output of {file_path.name}: {e}")
+
+    def _print_ocr_cache_stats(self) -> None:
+        stats = self.ocr_cache.stats()
+        if stats["enabled"]:
+            hits = self.ocr_cache_stats["hits"]
+            lookups = hits + self.ocr_cache_stats["misses"]
+            print(
+                f"OCR cache: {hits} of {lookups} OCR'd files restored "
+                f"(hit rate {hits / lookups if lookups else 0.0:.0%}), {stats['entries']} entries, "
+                f"{stats['bytes'] / 1024 ** 2:.1f} MB"
+            )
+
+    def _convert_by_page_ranges(
+        self, file_paths: List[Path], output_path: Path, multi: bool
+    ) -> None:
+        """OCR only the scanned pages, as page-range tasks, and merge each file back into one PDF."""
+        analyze = partial(
+            _analyze_pdf_pages,
+            min_text_density=self.min_text_density,
+            min_image_coverage=self.min_image_coverage,
+        )
+        if multi:
+            page_analyses = self._pool().map(analyze, file_paths)
+        else:
+            page_analyses = [analyze(file_path) for file_path in file_paths]
+
+        # Files without scanned pages are copied as-is; scanned pages are split into ranges
+        ocr_tasks = []
+        parts_dir = output_path / "ocr_parts"
+        for file_path, pages in zip(file_paths, page_analyses):
+            if not pages:
+                continue
+            self.ocr_metrics[file_path.name] = _file_ocr_metrics(pages)
+            scanned = [page["page"] - 1 for page in pages if page["decision"] == "ocr"]
+            if not scanned:
+                try:
+                    shutil.copy2(file_path, output_path / file_path.name)
+                except Exception as e:
+                    print(f"ERROR: Failed to copy {file_path.name}. Error: {e}")
+                continue
+            print(f"{file_path.name}: {len(scanned)} of {len(pages)} pages need OCR.")
+            ranges = _plan_page_ranges(scanned, self.ocr_pages_per_task)
+            for part_index, (from_page, to_page) in enumerate(ranges):
+                ocr_tasks.append((file_path, part_index, from_page, to_page, parts_dir))
+
+        if not ocr_tasks:
+            return
+
+        parts_dir.mkdir(parents=True, exist_ok=True)
+        if multi:
+            num_processes = min(self.num_workers, len(ocr_tasks))
+            jobs = max(1, cpu_count() // num_processes)
+            print(
+                f"OCR of {len(ocr_tasks)} page ranges using {num_processes} worker processes "
+                f"({jobs} ocrmypdf jobs each)."
+            )
+            part_results = self._pool().map(_ocr_page_range, [task + (jobs,) for task in ocr_tasks])
+        else:
+            part_results = [_ocr_page_range(task + (cpu_count(),)) for task in ocr_tasks]
+
+        # Merge the parts of each file back in page order, spreading each part's cost over its pages
+        parts_by_file: Dict[Path, List[Tuple[int, int, Optional[Path]]]] = defaultdict(list)
+        for task, (_, _, part_path, seconds) in zip(ocr_tasks, part_results):
+            file_path, _, from_page, to_page, _ = task
+            parts_by_file[file_path].append((from_page, to_page, part_path))
+            _record_ocr_cost(self.ocr_metrics[file_path.name], from_page, to_page, seconds)
+
+        for file_path, parts in parts_by_file.items():
+            if any(part_path is None for _, _, part_path in parts):
+                print(f"ERROR: Failed to OCR {file_path.name}; it will not be parsed.")
+                continue
+            try:
+                _merge_ocr_parts(file_path, parts, output_path / f"OCR_{file_path.name}")
+            except Exception as e:
+                print(f"ERROR: Failed to merge OCR output of {file_path.name}. Error: {e}")
+
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
     def extract_and_parse_documents(self, multi: bool = False) -> List[Dict[str, Any]]:
         """
         Classifies, extracts, and parses PDFs by reading files directly from the output directory.
@@ -221,43 +788,175 @@ class PDFUploadProcessor:
 
         print(f"\n--- Starting Content Extraction & Parsing (Parallel={multi}) ---")
 
-        # 1. Classification (Using the global function _classify_file_type)
-        files_for_classification = [path for path in searchable_files_paths]
-        print("Starting Classification...")
-
-        if multi:
-            num_processes = cpu_count()
-            with Pool(num_processes) as pool:
-                classified_types = pool.map(
-                    _classify_file_type, files_for_classification
-                )
-        else:
-            classified_types = [
-                _classify_file_type(path) for path in files_for_classification
-            ]
-
-        # 2. Prepare files for Parsing
-        files_to_process = []
-        for file_path, file_type in zip(files_for_classification, classified_types):
-            original_name = file_path.name
-            print(f"Classified {original_name} as {file_type}")
-            files_to_process.append((original_name, file_path, file_type))
-
-        # 3. Parsing (Using existing global worker _process_single_file)
+        # Each file is classified and parsed by one task that opens it once
+        # (not at all if its page texts were restored from the OCR cache)
+        task_data = [
+            (file_path, self.restored_page_texts.get(file_path)) for file_path in searchable_files_paths
+        ]
         if multi:
-            num_processes = cpu_count()
-            print(f"Starting Parallel Parsing using {num_processes} worker processes.")
-            with Pool(num_processes) as pool:
-                all_results = pool.map(_process_single_file, files_to_process)
+            print(f"Starting Parallel Classification & Parsing using {self.num_workers} worker processes.")
+            all_results = self._pool().starmap(_extract_and_parse_file, task_data)
         else:
-            all_results = [
-                _process_single_file(file_data) for file_data in files_to_process
-            ]
+            _init_worker(self.parser_config_path)
+            all_results = [_extract_and_parse_file(*data) for data in task_data]
 
         print("--- Content Extraction & Parsing Complete ---")
         self.structured_data_results = all_results
+        self.timeline_merger = None
         return all_results
 
+    def iter_process_files(self, multi: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Runs OCR -> classification -> parsing per uploaded file and yields each
+        file's result as soon as that file is done.
+
+        The pages of every file that is not restored from the OCR cache are checked
+        first. Then one stream of tasks runs on the pool (imap_unordered): files that
+        are ready (digital, or restored from the cache and parsed from their cached
+        page texts) are parsed by one task each, and the scanned pages of the other
+        files are OCR'd as page ranges of at most ocr_pages_per_task pages, spread
+        across the workers like convert_files_to_searchable_pdfs. When the last range
+        of a file arrives, the file is merged, parsed and yielded here, so ready
+        files do not wait for a slow scan and a long scan still uses every worker.
+
+        Each result is merged into self.timeline_merger on arrival, and the events it
+        added can be read with timeline_merger.add_file's return value or the partial
+        timeline_merger.timeline() (e.g. to start chunking and embedding early).
+
+        Yields:
+            Dict[str, Any]: Result of one file (original_filename, file_type, structured_data).
+        """
+        output_path = self.output_dir
+        output_path.mkdir(parents=True, exist_ok=True)
+        parts_dir = output_path / "ocr_parts"
+        print(f"\n--- Starting File Processing (Output Dir: {output_path.resolve()}, Parallel={multi}) ---")
+
+        self.ocr_metrics = {}
+        self.structured_data_results = []
+        self.timeline_merger = PatientTimelineMerger()
+        started_at = time.time()
+        cache_keys = self._restore_cached_ocr(output_path, split_pages=True)
+        # Merged scans are parsed here, and everything is in sequential mode
+        _init_worker(self.parser_config_path)
+
+        # Page decisions of the files still to convert
+        to_convert = [file_path for file_path in self.uploaded_files if file_path in cache_keys]
+        analyze = partial(
+            _analyze_pdf_pages,
+            min_text_density=self.min_text_density,
+            min_image_coverage=self.min_image_coverage,
+        )
+        if multi and to_convert:
+            page_analyses = self._pool().map(analyze, to_convert)
+        else:
+            page_analyses = [analyze(file_path) for file_path in to_convert]
+        analyses = dict(zip(to_convert, page_analyses))
+
+        ready = []  # (kind, upload_name, ...) tasks for files that only need parsing
+        failed = []  # uploads that cannot be converted
+        ocr_tasks = []  # page ranges of scanned files
+        pending_parts: Dict[str, List[Tuple[int, int, Optional[Path]]]] = {}
+        ranges_left: Dict[str, int] = {}
+        for file_path in self.uploaded_files:
+            if file_path not in cache_keys:
+                if file_path.exists():
+                    # Restored from the OCR cache; only classification and parsing are left
+                    ocr_path = output_path / f"OCR_{file_path.name}"
+                    ready.append(("parse", file_path.name, ocr_path, self.restored_page_texts.get(ocr_path)))
+                continue
+            pages = analyses[file_path]
+            if not pages:
+                failed.append(file_path)
+                continue
+            self.ocr_metrics[file_path.name] = _file_ocr_metrics(pages)
+            scanned = [page["page"] - 1 for page in pages if page["decision"] == "ocr"]
+            if not scanned:
+                try:
+                    shutil.copy2(file_path, output_path / file_path.name)
+                    ready.append(("parse", file_path.name, output_path / file_path.name, None))
+                except Exception as e:
+                    print(f"ERROR: Failed to copy {file_path.name}. Error: {e}")
+                    failed.append(file_path)
+                continue
+            print(f"{file_path.name}: {len(scanned)} of {len(pages)} pages need OCR.")
+            ranges = _plan_page_ranges(scanned, self.ocr_pages_per_task)
+            pending_parts[file_path.name] = []
+            ranges_left[file_path.name] = len(ranges)
+            for part_index, (from_page, to_page) in enumerate(ranges):
+                ocr_tasks.append((file_path, part_index, from_page, to_page, parts_dir))
+
+        ocr_tasks_by_part = {(task[0].name, task[1]): task for task in ocr_tasks}
+        if ocr_tasks:
+            parts_dir.mkdir(parents=True, exist_ok=True)
+        if multi:
+            jobs = max(1, cpu_count() // min(self.num_workers, max(len(ocr_tasks), 1)))
+            print(
+                f"Using {self.num_workers} worker processes: {len(ready)} files to parse, "
+                f"{len(ocr_tasks)} page ranges to OCR ({jobs} ocrmypdf jobs each)."
+            )
+        else:
+            jobs = cpu_count()
+        # Ready files first, so their results stream out while the scans are OCR'd
+        tasks = ready + [("ocr", task[0].name, task + (jobs,)) for task in ocr_tasks]
+        if multi and tasks:
+            outputs = self._pool().imap_unordered(_run_upload_task, tasks)
+        else:
+            outputs = (_run_upload_task(task) for task in tasks)
+
+        def finish(upload_name: str, result: Dict[str, Any]) -> Dict[str, Any]:
+            upload_path = self.input_dir / upload_name
+            if upload_path in cache_keys:
+                self._store_ocr_result(upload_path, cache_keys[upload_path], output_path, started_at)
+            self.structured_data_results.append(result)
+            self.timeline_merger.add_file(result)
+            return result
+
+        try:
+            for file_path in failed:
+                yield finish(file_path.name, _conversion_failed(file_path))
+            for kind, upload_name, output in outputs:
+                if kind == "parse":
+                    yield finish(upload_name, output)
+                    continue
+
+                # One OCR'd page range; the file is done once all of its ranges are
+                _, part_index, part_path, seconds = output
+                file_path, _, from_page, to_page, _ = ocr_tasks_by_part[(upload_name, part_index)]
+                _record_ocr_cost(self.ocr_metrics[upload_name], from_page, to_page, seconds)
+                pending_parts[upload_name].append((from_page, to_page, part_path))
+                ranges_left[upload_name] -= 1
+                if ranges_left[upload_name]:
+                    continue
+
+                parts = pending_parts.pop(upload_name)
+                searchable_path = output_path / f"OCR_{upload_name}"
+                if any(path is None for _, _, path in parts):
+                    print(f"ERROR: Failed to OCR {upload_name}; it will not be parsed.")
+                    yield finish(upload_name, _conversion_failed(file_path))
+                    continue
+                try:
+                    _merge_ocr_parts(file_path, parts, searchable_path)
+                except Exception as e:
+                    print(f"ERROR: Failed to merge OCR output of {upload_name}. Error: {e}")
+                    yield finish(upload_name, _conversion_failed(file_path))
+                    continue
+                yield finish(upload_name, _extract_and_parse_file(searchable_path))
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+            self._print_ocr_cache_stats()
+            print("--- File Processing Complete ---")
+
+    def process_files(self, multi: bool = False) -> List[Dict[str, Any]]:
+        """
+        Runs iter_process_files to the end.
+
+        Returns:
+            List[Dict[str, Any]]: The parsed results, also kept in structured_data_results.
+        """
+        for _ in self.iter_process_files(multi):
+            pass
+        return self.structured_data_results
+
     def create_combined_patient_timeline(self) -> Dict[str, List[Dict[str, Any]]]:
         """
         Combines the structured JSON outputs from all files into a single chronological
@@ -265,6 +964,7 @@ class PDFUploadProcessor:
 
         This logic correctly handles the input structure of {date: list_of_raw_records}
         for both Medical Records and Lab Results, ensuring each event has correct metadata.
+        Events are merged per file by PatientTimelineMerger, in source-file order.
         """
         if not self.structured_data_results:
             print(
@@ -274,53 +974,13 @@ class PDFUploadProcessor:
 
         print("\n--- Starting Unified Patient Timeline Creation ---")
 
-        # Unified timeline will map date string -> list of events/records
-        unified_timeline: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
-
-        for result in self.structured_data_results:
-            file_type = result.get("file_type")
-            structured_data = result.get("structured_data", {})
-            original_filename = result.get("original_filename")
-
-            # Skip files with errors or missing data
-            if not structured_data or "error" in structured_data:
-                print(
-                    f"Skipping {original_filename} due to previous parsing error or empty data."
-                )
-                continue
-
-            # Iterate over the date keys, where the value is expected to be a list of records
-            for date, records_list in structured_data.items():
-
-                # Ensure the data structure is a list of records
-                if not isinstance(records_list, list):
-                    print(
-                        f"Warning: Data for {original_filename} on {date} is not a list and was skipped."
-                    )
-                    continue
+        # Results streamed by iter_process_files are already merged
+        if self.timeline_merger is None:
+            self.timeline_merger = PatientTimelineMerger()
+            for result in self.structured_data_results:
+                self.timeline_merger.add_file(result)
 
-                for raw_record in records_list:
-                    if file_type == "Lab Results":
-                        # For Lab Results, we add the record under a 'tests' key
-                        event = {
-                            "record_type": file_type,
-                            "source_file": original_filename,
-                            # The raw_record is expected to be a dict of lab results
-                            "tests": [raw_record],
-                        }
-
-                    elif file_type == "Medical Records":
-                        # For Medical Records, we merge the raw note data directly into the event
-                        event = {
-                            "record_type": file_type,
-                            "source_file": original_filename,
-                            **raw_record,
-                        }
-                    # Future implementations for other file types can be added here in elif blocks
-
-                    unified_timeline[date].append(event)
-
-        final_timeline = dict(unified_timeline)
+        final_timeline = self.timeline_merger.timeline()
 
         print("--- Unified Patient Timeline Creation Complete ---")
 
@@ -348,8 +1008,7 @@ if __name__ == "__main__":
     processor = PDFUploadProcessor(
         "../../../data/test multi file"
     )  # Change to directory with test files
-    processor.convert_files_to_searchable_pdfs(multi=flag)
-    processor.extract_and_parse_documents(multi=flag)
+    processor.process_files(multi=flag)
     processor.create_combined_patient_timeline()
     end_time = time.time()
     print(f"Total processing time: {end_time - start_time} seconds for multi={flag}")
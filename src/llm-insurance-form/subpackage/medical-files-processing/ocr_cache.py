@@ -0,0 +1,165 @@
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import fitz
+
+# The SQLite LRU base is shared with the embedding and LLM response caches
+sys.path.append(str(Path(__file__).resolve().parent.parent / "helpers"))
+from sqlite_lru_cache import SQLiteLRUCache, get_shared_cache
+
+# Explicit home of the cache database, instead of whatever the working directory is
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent / "cache"
+DEFAULT_DB_FILE = str(DEFAULT_CACHE_DIR / "ocr_cache.db")
+
+
+def file_sha256(file_path: Union[str, Path]) -> str:
+    """Return the sha256 hex digest of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ocr_cache_key(input_sha256: str, params: Dict) -> str:
+    """
+    Return the cache key of one OCR conversion
+
+    Args:
+        input_sha256: sha256 of the uploaded PDF bytes
+        params: Everything else that changes the output (tesseract_pagesegmode, tesseract_oem,
+            optimize, and the page selection settings)
+
+    Returns:
+        Hex digest used as the cache key
+    """
+    fields = {"input": input_sha256, "params": params}
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class OCRCache(SQLiteLRUCache):
+    """
+    Persistent cache of OCR results.
+
+    The searchable PDF produced for an upload is stored in SQLite together with
+    the text of each of its pages, keyed by the sha256 of the input bytes and the
+    OCR parameters, so a re-upload of the same hospital file (another insurer
+    template, a retried job, a second reviewer) skips tesseract. The least
+    recently used entries are evicted once max_entries or max_bytes is exceeded.
+    """
+
+    table = "ocr_results"
+    columns = """
+        cache_key TEXT PRIMARY KEY,
+        source_name TEXT NOT NULL,
+        pdf BLOB NOT NULL,
+        page_texts TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        created_at REAL NOT NULL,
+        last_access REAL NOT NULL
+    """
+
+    def __init__(self, db_file: str = DEFAULT_DB_FILE, max_entries: int = 5000,
+                 max_bytes: int = 2 * 1024 ** 3, enabled: bool = True):
+        """
+        Initialize the cache
+
+        Args:
+            db_file: Path of the SQLite database file
+            max_entries: Maximum number of cached files (0 for no limit)
+            max_bytes: Maximum total size of cached PDFs and text in bytes (0 for no limit)
+            enabled: If False every lookup is a miss and nothing is stored
+        """
+        super().__init__(db_file, max_entries, max_bytes, enabled)
+
+    def _lookup(self, cache_key: str):
+        if not self.enabled:
+            self._count(misses=1)
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pdf, page_texts FROM ocr_results WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE ocr_results SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row
+
+    def get(self, cache_key: str, save_path: Union[str, Path]) -> Optional[List[str]]:
+        """
+        Write a cached searchable PDF to save_path and return its page texts
+
+        Args:
+            cache_key: Output of ocr_cache_key
+            save_path: Where to write the PDF on a hit
+
+        Returns:
+            Text of each page of the searchable PDF (to parse it without
+            re-extracting), or None on a miss
+        """
+        row = self._lookup(cache_key)
+        if row is None:
+            return None
+        pdf, page_texts = row
+        with open(save_path, "wb") as f:
+            f.write(pdf)
+        return json.loads(page_texts)
+
+    def put(self, cache_key: str, source_name: str, pdf_path: Union[str, Path]):
+        """Store a searchable PDF with its page texts and evict old entries if needed"""
+        if not self.enabled:
+            return
+
+        with open(pdf_path, "rb") as f:
+            pdf = f.read()
+        with fitz.open(pdf_path) as doc:
+            page_texts = json.dumps([page.get_text("text") for page in doc], ensure_ascii=False)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_results "
+                "(cache_key, source_name, pdf, page_texts, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (cache_key, source_name, pdf, page_texts, len(pdf) + len(page_texts.encode("utf-8")), now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+
+def get_ocr_cache(cache_config: Optional[Dict] = None) -> OCRCache:
+    """
+    Return the process-wide cache for the configured database file
+
+    The cache stores copies of patient PDFs and their text, so it is only on
+    when the config enables it.
+
+    Args:
+        cache_config: 'ocr_cache' section of document_parser_config.yaml
+            (enabled, db_file, max_entries and max_mb); a relative db_file is
+            placed under DEFAULT_CACHE_DIR
+
+    Returns:
+        Shared OCRCache (a disabled one unless the config turns it on)
+    """
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", False):
+        return OCRCache(enabled=False)
+
+    db_file = str(DEFAULT_CACHE_DIR / cache_config.get("db_file", "ocr_cache.db"))
+    return get_shared_cache(OCRCache, db_file, lambda: OCRCache(
+        db_file=db_file,
+        max_entries=cache_config.get("max_entries", 5000),
+        max_bytes=cache_config.get("max_mb", 2048) * 1024 ** 2,
+    ))
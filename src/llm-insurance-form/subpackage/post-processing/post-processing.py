@@ -1,13 +1,30 @@
 import re
 import json
+import threading
+from collections import Counter
 from pathlib import Path
+from typing import Optional
 
-def process_llm_output(input_text: str) -> dict:
+# How page outputs were parsed: "parsed" on the first json.loads (structured output),
+# "repaired" through the cleanup/repair fallback, "failed" if no JSON could be recovered
+PARSE_COUNTS = Counter()
+_parse_counts_lock = threading.Lock()
+
+def get_parse_counts() -> dict:
+    """Return the process-wide parse/repair counters"""
+    with _parse_counts_lock:
+        return dict(PARSE_COUNTS)
+
+def process_llm_output(input_text: str, stats: Optional[dict] = None) -> dict:
     """
     Cleans an LLM output text file and converts it into a single flattened JSON file.
 
+    Pages whose output is already valid JSON are parsed directly; only the others
+    go through the regex cleanup and brace repair, which is counted in PARSE_COUNTS.
+
     Args:
         input_text (str): raw LLM text.
+        stats (dict, optional): receives this call's "parsed"/"repaired"/"failed" page counts.
 
     Returns:
         dict: The merged and flattened JSON object.
@@ -107,37 +124,90 @@ def process_llm_output(input_text: str) -> dict:
                     v = f"{dd}/{mm}/20{yy}"
             fixed[k] = v
         return fixed
-    # --- Read + clean ---
-    cleaned = clean_llm_output(input_text)
-    json_chunks = extract_json_objects(cleaned)
+    def repair_objects(text: str) -> list:
+        cleaned = clean_llm_output(text)
+        objs = []
+        for chunk in extract_json_objects(cleaned):
+            fixed = repair_json(chunk)
+            try:
+                objs.append(json.loads(fixed))
+            except json.JSONDecodeError:
+                try:
+                    first = fixed.find('{')
+                    last = fixed.rfind('}')
+                    if first != -1 and last != -1 and last > first:
+                        candidate = repair_json(fixed[first:last+1])
+                        objs.append(json.loads(candidate))
+                except Exception:
+                    continue
+        return objs
 
+    # --- Parse each page, repairing only when needed ---
+    counts = Counter()
     merged = {}
     all_keys = set()
 
-    for i, chunk in enumerate(json_chunks, 1):
-        fixed = repair_json(chunk)
+    for section in re.split(r"--- Page \d+ ---", input_text):
+        if not section.strip():
+            continue
         try:
-            obj = json.loads(fixed)
+            obj = json.loads(section)
+            objs = [obj] if isinstance(obj, dict) else []
         except json.JSONDecodeError:
-            try:
-                first = fixed.find('{')
-                last = fixed.rfind('}')
-                if first != -1 and last != -1 and last > first:
-                    candidate = repair_json(fixed[first:last+1])
-                    obj = json.loads(candidate)
-                else:
-                    continue
-            except Exception:
-                continue
-
-        flat = flatten_json(obj)
-        merged.update(flat)
-        all_keys.update(flat.keys())
+            objs = []
+        if objs:
+            counts["parsed"] += 1
+        else:
+            objs = repair_objects(section)
+            counts["repaired" if objs else "failed"] += 1
+
+        for obj in objs:
+            flat = flatten_json(obj)
+            merged.update(flat)
+            all_keys.update(flat.keys())
+
+    with _parse_counts_lock:
+        PARSE_COUNTS.update(counts)
+    if stats is not None:
+        stats.update(counts)
+    if counts["repaired"] or counts["failed"]:
+        print(f"LLM output: {counts['parsed']} pages parsed directly, {counts['repaired']} repaired, "
+              f"{counts['failed']} unreadable")
 
     merged = fix_short_dates(merged)
 
     return merged
 
+class LLMOutputMerger:
+    """
+    Post-processes page outputs as they arrive and merges them in page order.
+
+    Use add_page as the on_output callback of llm.run_pipelined, so each page
+    is cleaned and flattened while the remaining pages are still generating.
+    result() gives the same dict as process_llm_output on the joined outputs.
+    """
+
+    def __init__(self):
+        self.pages = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def add_page(self, page: int, page_output: str):
+        """Clean and flatten one page's tagged LLM output"""
+        stats = {}
+        flat = process_llm_output(page_output, stats)
+        with self._lock:
+            self.pages[page] = flat
+            self.stats.update(stats)
+
+    def result(self) -> dict:
+        """Merged and flattened JSON of all pages added so far"""
+        merged = {}
+        with self._lock:
+            for page in sorted(self.pages):
+                merged.update(self.pages[page])
+        return merged
+
 if __name__ == "__main__":
         file_path = Path(__file__).resolve().parent.parent.parent.parent.parent / "data" / "sample" / "llm-output.json"
         with open(file_path, "r", encoding="utf-8") as f:
@@ -0,0 +1,158 @@
+"""
+Measure the memory used by the chunk pipeline before and after the ChunkTable.
+
+"before" rebuilds the previous representation (a TextChunk per chunk with its
+own metadata dict, a prepared dict per chunk with another metadata copy, and an
+embedded dict per chunk holding a Python list of floats). "after" runs the
+current process_all_medical_records -> prepare_chunks_for_embedding ->
+ChunkTable.set_embeddings path. Both use the same large multi-file timeline
+(every converted SCM record plus the multi-file upload, copied --copies times
+as separate source files) and the same random float32 matrix in place of the
+encoder output, so only the chunk representation differs.
+
+Run from this directory:
+    python benchmark_chunk_memory.py
+    python benchmark_chunk_memory.py --copies 50
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+from rag import (
+    TextChunk,
+    TextChunker,
+    clean_text,
+    ensure_nltk_data,
+    prepare_chunks_for_embedding,
+    process_all_medical_records,
+    word_tokenize,
+)
+
+DEFAULT_TIMELINES = [
+    "../../../../data/SCM Records/Converted/*.json",
+    "../../../../data/Test Multi File Upload/processed_pdfs/combined_patient_timeline.json",
+]
+
+
+def build_large_timeline(patterns, copies: int) -> dict:
+    """Merge every timeline into one, tagging each copy of each file as its own source_file"""
+    paths = sorted(path for pattern in patterns for path in glob.glob(pattern))
+    timeline = {}
+    for copy in range(copies):
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                file_timeline = json.load(f)
+            for date, records in file_timeline.items():
+                for record in records:
+                    if isinstance(record, dict):
+                        source_file = record.get("source_file") or os.path.basename(path)
+                        timeline.setdefault(date, []).append({**record, "source_file": f"{copy}_{source_file}"})
+    return timeline
+
+
+def legacy_pipeline(timeline: dict, chunk_size: int, overlap: int, embeddings: np.ndarray):
+    """The list-of-dicts pipeline the ChunkTable replaced (NLTK chunking mode)"""
+    chunker = TextChunker(chunk_size=chunk_size, overlap=overlap)
+    all_chunks = []
+    for date, records in timeline.items():
+        for record_idx, record in enumerate(records):
+            if record.get("record_type", "") == "Lab Results":
+                doctor, section_type, subsections, allergies = "", "Lab Results", [], ""
+                text_content = {}
+                for test in record.get("tests", []):
+                    text_content.update(test.get("lab results", {}))
+            else:
+                doctor = record.get("doctor", "")
+                section_type = record.get("section_type", "")
+                subsections = record.get("subsections", [])
+                allergies = record.get("allergies") or ""
+                text_content = record.get("text", {})
+            if not isinstance(text_content, dict):
+                continue
+
+            for category, category_text in text_content.items():
+                if not category_text or not category_text.strip():
+                    continue
+                cleaned_text = clean_text(category_text)
+                tokens_len = len(word_tokenize(cleaned_text))
+                base_metadata = {
+                    "date": date, "doctor": doctor, "section_type": section_type, "text_category": category,
+                    "subsections": subsections, "allergies": allergies, "record_index": record_idx,
+                    "source_file": record.get("source_file", ""),
+                }
+                if tokens_len <= chunk_size:
+                    category_chunks = [TextChunk(text=cleaned_text, word_count=tokens_len)]
+                else:
+                    category_chunks = chunker.chunk_by_fixed_size(cleaned_text)
+                for chunk_idx, chunk in enumerate(category_chunks, 1):
+                    chunk.metadata = {**base_metadata, "chunk": chunk_idx, "total_chunks": len(category_chunks)}
+                all_chunks.extend(category_chunks)
+
+    prepared_chunks = [
+        {
+            "id": f"{chunk.metadata['date']}_{chunk.metadata['text_category']}_chunk_{chunk.metadata['chunk']}_{i}",
+            "text": chunk.metadata["date"] + ", " + chunk.metadata["text_category"] + ": " + chunk.text,
+            "metadata": {**chunk.metadata},
+        }
+        for i, chunk in enumerate(all_chunks)
+    ]
+    embedded_chunks = [
+        {**chunk, "embedding": embedding.tolist(), "embedding_model": "benchmark",
+         "embedding_dimension": len(embedding)}
+        for chunk, embedding in zip(prepared_chunks, embeddings[:len(prepared_chunks)])
+    ]
+    # retrieve_rag kept all three lists alive until the end of the job
+    return all_chunks, prepared_chunks, embedded_chunks
+
+
+def table_pipeline(timeline: dict, chunk_size: int, overlap: int, embeddings: np.ndarray):
+    table = prepare_chunks_for_embedding(process_all_medical_records(timeline, chunk_size, overlap))
+    table.set_embeddings(embeddings[:len(table)], "benchmark")
+    return table
+
+
+def measure(name: str, pipeline, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = pipeline(*args)
+    seconds = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    print(f"{name:<7} {seconds:7.2f} s   retained {current / 1e6:8.1f} MB   "
+          f"peak {peak / 1e6:8.1f} MB   live blocks {blocks:10d}")
+    return result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Chunk pipeline memory benchmark")
+    arg_parser.add_argument("--copies", type=int, default=20, help="Copies of every timeline file")
+    arg_parser.add_argument("--chunk-size", type=int, default=256)
+    arg_parser.add_argument("--overlap", type=int, default=8)
+    arg_parser.add_argument("--dim", type=int, default=768)
+    args = arg_parser.parse_args()
+
+    ensure_nltk_data()
+    timeline = build_large_timeline(DEFAULT_TIMELINES, args.copies)
+    n_records = sum(len(records) for records in timeline.values())
+
+    # Both pipelines get the same stand-in encoder output
+    n_chunks = len(process_all_medical_records(timeline, args.chunk_size, args.overlap))
+    embeddings = np.random.default_rng(0).standard_normal((n_chunks, args.dim)).astype(np.float32)
+    print(f"\nTimeline: {n_records} records, {n_chunks} chunks, {args.dim}-dim embeddings\n")
+
+    # Embeddings are allocated before tracing starts, so only the chunk representation is measured
+    legacy = measure("before", legacy_pipeline, timeline, args.chunk_size, args.overlap, embeddings)
+    del legacy
+    table = measure("after", table_pipeline, timeline, args.chunk_size, args.overlap, embeddings)
+    del table
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Compare the NLTK and tokenizer chunking modes of process_all_medical_records.
+
+For every timeline in data/SCM Records/Converted it reports chunking
+throughput, the number of chunks, and how many prepared chunks would be
+truncated by the encoder (more than max_seq_len wordpieces including the
+special tokens).
+
+Run from this directory:
+    python benchmark_chunking.py
+    python benchmark_chunking.py --tokenizer /path/to/local/tokenizer --repeat 5
+"""
+
+import argparse
+import glob
+import json
+import os
+import time
+
+from transformers import AutoTokenizer
+
+from rag import (
+    DEFAULT_EMBEDDING_MODEL,
+    DEFAULT_MAX_SEQ_LEN,
+    ensure_nltk_data,
+    prepare_chunks_for_embedding,
+    process_all_medical_records,
+)
+
+DEFAULT_DATA_DIR = "../../../../data/SCM Records/Converted"
+
+
+def count_truncated(chunks, tokenizer, max_seq_len: int) -> int:
+    texts = prepare_chunks_for_embedding(chunks).texts
+    if not texts:
+        return 0
+    lengths = [len(ids) for ids in tokenizer(texts, add_special_tokens=True, verbose=False)['input_ids']]
+    return sum(length > max_seq_len for length in lengths)
+
+
+def time_mode(timeline, chunk_size, overlap, tokenizer, max_seq_len, repeat):
+    best = float("inf")
+    chunks = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = process_all_medical_records(timeline, chunk_size, overlap, tokenizer, max_seq_len)
+        best = min(best, time.perf_counter() - start)
+    return best, chunks
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="NLTK vs tokenizer chunking benchmark")
+    arg_parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    arg_parser.add_argument("--tokenizer", default=DEFAULT_EMBEDDING_MODEL,
+                            help="Model name or local path of the encoder's tokenizer")
+    arg_parser.add_argument("--chunk-size", type=int, default=256)
+    arg_parser.add_argument("--overlap", type=int, default=8)
+    arg_parser.add_argument("--max-seq-len", type=int, default=DEFAULT_MAX_SEQ_LEN)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Best of N runs per timeline")
+    args = arg_parser.parse_args()
+
+    ensure_nltk_data()
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    totals = {"nltk": [0.0, 0, 0], "tokenizer": [0.0, 0, 0]}
+    total_chars = 0
+
+    print(f"{'timeline':<40} {'mode':<10} {'ms':>9} {'chunks':>7} {'truncated':>10}")
+    for path in sorted(glob.glob(os.path.join(args.data_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            timeline = json.load(f)
+        total_chars += len(json.dumps(timeline))
+
+        for mode, mode_tokenizer in (("nltk", None), ("tokenizer", tokenizer)):
+            seconds, chunks = time_mode(
+                timeline, args.chunk_size, args.overlap, mode_tokenizer, args.max_seq_len, args.repeat
+            )
+            truncated = count_truncated(chunks, tokenizer, args.max_seq_len)
+            totals[mode][0] += seconds
+            totals[mode][1] += len(chunks)
+            totals[mode][2] += truncated
+            print(f"{os.path.basename(path)[:40]:<40} {mode:<10} {seconds * 1000:9.1f} {len(chunks):7d} {truncated:10d}")
+
+    print()
+    for mode, (seconds, n_chunks, truncated) in totals.items():
+        throughput = total_chars / seconds / 1e6 if seconds else 0.0
+        print(f"{mode:<10} total {seconds * 1000:9.1f} ms  {throughput:6.2f} MB/s  "
+              f"{n_chunks} chunks, {truncated} truncated")
+
+
+if __name__ == "__main__":
+    main()
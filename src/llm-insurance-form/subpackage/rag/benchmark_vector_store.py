@@ -0,0 +1,109 @@
+"""
+Compare the per-job latency of the Milvus Lite and NumPy vector store backends.
+
+Each simulated job does what retrieve_rag does with the store: connect, create
+the collection, insert every chunk of the timeline, load it and run one batched
+search for all field set queries. Chunk texts and metadata come from a real
+timeline; the vectors are random unit vectors, since store latency does not
+depend on their content and this keeps the encoder out of the measurement.
+
+Run from this directory:
+    python benchmark_vector_store.py
+    python benchmark_vector_store.py "../../../../data/SCM Records/Converted/Patient 1 Medical Records.json" --jobs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+from rag import (
+    MilvusVectorStore,
+    NumpyVectorStore,
+    ensure_nltk_data,
+    prepare_chunks_for_embedding,
+    process_all_medical_records,
+)
+
+DEFAULT_TIMELINE = "../../../../data/Test Multi File Upload/processed_pdfs/combined_patient_timeline.json"
+
+
+def build_embedded_chunks(timeline_path: str, embedding_dim: int, seed: int = 0):
+    with open(timeline_path, "r", encoding="utf-8") as f:
+        timeline = json.load(f)
+
+    chunks = prepare_chunks_for_embedding(process_all_medical_records(timeline, 256, 8))
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((len(chunks), embedding_dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks.set_embeddings(vectors)
+    return chunks
+
+
+def count_queries(config_path: str = "rag_config.yml", template: str = "ntuc") -> int:
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    field_sets = config.get("rag_queries", {}).get(template, {})
+    return sum(len(queries) for queries in field_sets.values())
+
+
+def run_job(store, embedded_chunks, query_vectors, embedding_dim: int, top_k: int) -> float:
+    start = time.perf_counter()
+    store.connect()
+    store.create_collection(embedding_dim)
+    store.insert_embeddings(embedded_chunks)
+    store.load_collection()
+    store.get_collection_stats()
+    store.search_similar_batch(query_vectors, top_k=top_k)
+    return time.perf_counter() - start
+
+
+def summarize(name: str, timings):
+    timings_ms = sorted(t * 1000 for t in timings)
+    p95 = timings_ms[int(round(0.95 * (len(timings_ms) - 1)))]
+    print(
+        f"{name:<8} first job {timings[0] * 1000:8.1f} ms   "
+        f"median {statistics.median(timings_ms):8.1f} ms   p95 {p95:8.1f} ms"
+    )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    arg_parser.add_argument("timeline", nargs="?", default=DEFAULT_TIMELINE)
+    arg_parser.add_argument("--jobs", type=int, default=5, help="Jobs to simulate per backend")
+    arg_parser.add_argument("--dim", type=int, default=768)
+    arg_parser.add_argument("--top-k", type=int, default=2)
+    args = arg_parser.parse_args()
+
+    ensure_nltk_data()
+    embedded_chunks = build_embedded_chunks(args.timeline, args.dim)
+    n_queries = count_queries()
+    query_vectors = np.random.default_rng(1).standard_normal((n_queries, args.dim)).astype(np.float32)
+    print(f"Timeline: {len(embedded_chunks)} chunks, {n_queries} queries, {args.jobs} jobs per backend\n")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        milvus_store = MilvusVectorStore("benchmark_embeddings", os.path.join(tmp_dir, "milvus_benchmark.db"))
+        results["milvus"] = [
+            run_job(milvus_store, embedded_chunks, query_vectors, args.dim, args.top_k)
+            for _ in range(args.jobs)
+        ]
+
+    numpy_store = NumpyVectorStore("benchmark_embeddings")
+    results["numpy"] = [
+        run_job(numpy_store, embedded_chunks, query_vectors, args.dim, args.top_k)
+        for _ in range(args.jobs)
+    ]
+
+    print("\nPer-job vector store latency (connect + create + insert + search)")
+    for name, timings in results.items():
+        summarize(name, timings)
+
+
+if __name__ == "__main__":
+    main()
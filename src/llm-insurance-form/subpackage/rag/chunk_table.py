@@ -0,0 +1,239 @@
+import uuid
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+# Record-level metadata shared by every chunk of one record, in the order stored in ChunkTable.records
+RECORD_FIELDS = ("date", "doctor", "section_type", "subsections", "allergies", "record_index", "source_file")
+
+
+class ChunkRow:
+    """Lightweight view of one row of a ChunkTable; nothing is copied until an attribute is read"""
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "ChunkTable", row: int):
+        self._table = table
+        self._row = row
+
+    @property
+    def id(self) -> str:
+        return self._table.ids[self._row]
+
+    @property
+    def text(self) -> str:
+        """Chunk text without the "date, category: " prefix"""
+        return self._table.chunk_text(self._row)
+
+    @property
+    def embedding_text(self) -> str:
+        return self._table.texts[self._row]
+
+    @property
+    def word_count(self) -> int:
+        return self._table.word_counts[self._row]
+
+    @property
+    def metadata(self) -> Dict:
+        return self._table.metadata(self._row)
+
+    @property
+    def embedding(self) -> Optional[np.ndarray]:
+        """Row of the embedding matrix (a view, not a copy)"""
+        if self._table.embeddings is None:
+            return None
+        return self._table.embeddings[self._row]
+
+    def __repr__(self):
+        return f"ChunkRow(id={self.id!r}, word_count={self.word_count}, text={self.text[:40]!r})"
+
+
+class ChunkTable:
+    """
+    Columnar store of the chunks of one timeline.
+
+    Record-level metadata (date, doctor, subsections, ...) is stored once per
+    record and referenced by row, repeated strings such as text categories are
+    interned, and the embeddings of all chunks live in one float32 matrix. The
+    same table flows from chunking through embedding into the vector store, so
+    there is no per-chunk metadata dict and no Python list of floats per vector.
+    """
+
+    def __init__(self):
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self._interned = {}
+
+        self.records: List[tuple] = []
+        # Texts are stored in their embedding form "<date>, <category>: <chunk>"
+        self.texts: List[str] = []
+        self.text_starts = array('I')
+        self.word_counts = array('I')
+        self.record_rows = array('I')
+        self.categories = array('I')
+        self.chunk_numbers = array('I')
+        self.total_chunks = array('I')
+        self.ids: List[str] = []
+
+        self.embeddings: Optional[np.ndarray] = None
+        self.embedding_model: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def __getitem__(self, row: int) -> ChunkRow:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return ChunkRow(self, row)
+
+    def __iter__(self) -> Iterator[ChunkRow]:
+        return (ChunkRow(self, row) for row in range(len(self)))
+
+    @property
+    def embedding_dim(self) -> Optional[int]:
+        return None if self.embeddings is None else self.embeddings.shape[1]
+
+    def _intern(self, value):
+        """Return one shared object for equal values (lists are stored as tuples)"""
+        if isinstance(value, list):
+            value = tuple(value)
+        try:
+            return self._interned.setdefault(value, value)
+        except TypeError:
+            # Unhashable values (e.g. nested dicts) are kept as they are
+            return value
+
+    def _string_id(self, value: str) -> int:
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = len(self._strings)
+            self._strings.append(value)
+            self._string_ids[value] = string_id
+        return string_id
+
+    def add_record(self, date: str, doctor: str, section_type: str, subsections, allergies: str,
+                   record_index: int, source_file: str) -> int:
+        """Store the metadata of one record and return its row in self.records"""
+        self.records.append((
+            self._intern(date),
+            self._intern(doctor),
+            self._intern(section_type),
+            self._intern(subsections),
+            self._intern(allergies),
+            record_index,
+            self._intern(source_file),
+        ))
+        return len(self.records) - 1
+
+    def append(self, text: str, word_count: int, record_row: int, category: str,
+               chunk_number: int = 1, total_chunks: int = 1) -> int:
+        """
+        Add one chunk of a record
+
+        Args:
+            text: Chunk text
+            word_count: Number of tokens in the chunk
+            record_row: Row returned by add_record
+            category: Text category of the chunk
+            chunk_number: 1-based position of the chunk within its category
+            total_chunks: Number of chunks the category was split into
+
+        Returns:
+            Row of the new chunk
+        """
+        prefix = f"{self.records[record_row][0]}, {category}: "
+        self.texts.append(prefix + text)
+        self.text_starts.append(len(prefix))
+        self.word_counts.append(word_count)
+        self.record_rows.append(record_row)
+        self.categories.append(self._string_id(category))
+        self.chunk_numbers.append(chunk_number)
+        self.total_chunks.append(total_chunks)
+        return len(self.texts) - 1
+
+    def chunk_text(self, row: int) -> str:
+        return self.texts[row][self.text_starts[row]:]
+
+    def date(self, row: int) -> str:
+        return self.records[self.record_rows[row]][0]
+
+    def category(self, row: int) -> str:
+        return self._strings[self.categories[row]]
+
+    def dates(self) -> List[str]:
+        records = self.records
+        return [records[record_row][0] for record_row in self.record_rows]
+
+    def metadata(self, row: int) -> Dict:
+        """Build the metadata dict of one chunk on demand"""
+        metadata = dict(zip(RECORD_FIELDS, self.records[self.record_rows[row]]))
+        if isinstance(metadata["subsections"], tuple):
+            metadata["subsections"] = list(metadata["subsections"])
+        metadata["text_category"] = self.category(row)
+        metadata["chunk"] = self.chunk_numbers[row]
+        metadata["total_chunks"] = self.total_chunks[row]
+        return metadata
+
+    def assign_ids(self, id_prefix: str = ""):
+        """Give every chunk a unique id from its date, category, chunk number and row"""
+        self.ids = [
+            f"{id_prefix}{self.date(row)}_{self.category(row)}_chunk_{self.chunk_numbers[row]}_{row}"
+            for row in range(len(self))
+        ]
+
+    def set_embeddings(self, embeddings: np.ndarray, model_name: Optional[str] = None):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or embeddings.shape[0] != len(self):
+            raise ValueError(f"Expected {len(self)} embeddings, got shape {embeddings.shape}")
+        self.embeddings = embeddings
+        self.embedding_model = model_name
+
+    def extend(self, other: "ChunkTable"):
+        """Append the chunks, ids and embeddings of another table"""
+        if len(self) and len(other) and (self.embeddings is None) != (other.embeddings is None):
+            raise ValueError("Cannot extend: only one of the tables has embeddings")
+
+        record_offset = len(self.records)
+        for record in other.records:
+            self.add_record(*record)
+
+        category_map = [self._string_id(value) for value in other._strings]
+        self.texts.extend(other.texts)
+        self.text_starts.extend(other.text_starts)
+        self.word_counts.extend(other.word_counts)
+        self.record_rows.extend(record_row + record_offset for record_row in other.record_rows)
+        self.categories.extend(category_map[category] for category in other.categories)
+        self.chunk_numbers.extend(other.chunk_numbers)
+        self.total_chunks.extend(other.total_chunks)
+        self.ids.extend(other.ids)
+
+        if other.embeddings is not None:
+            if self.embeddings is None:
+                self.embeddings = other.embeddings
+            else:
+                self.embeddings = np.vstack([self.embeddings, other.embeddings])
+            self.embedding_model = self.embedding_model or other.embedding_model
+
+    @classmethod
+    def from_dicts(cls, embedded_chunks: List[Dict]) -> "ChunkTable":
+        """Build a table from the list-of-dicts format (id, text, metadata, embedding)"""
+        table = cls()
+        vectors = []
+        for chunk in embedded_chunks:
+            metadata = chunk.get('metadata', {})
+            record_row = table.add_record(*(metadata.get(field, '') for field in RECORD_FIELDS))
+            table.texts.append(chunk['text'])
+            table.text_starts.append(0)
+            table.word_counts.append(metadata.get('word_count', 0))
+            table.record_rows.append(record_row)
+            table.categories.append(table._string_id(metadata.get('text_category', '')))
+            table.chunk_numbers.append(metadata.get('chunk', 1))
+            table.total_chunks.append(metadata.get('total_chunks', 1))
+            table.ids.append(str(chunk.get('id', uuid.uuid4())))
+            if 'embedding' in chunk:
+                vectors.append(chunk['embedding'])
+        if vectors:
+            table.set_embeddings(np.asarray(vectors, dtype=np.float32))
+        return table
@@ -0,0 +1,223 @@
+import math
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN) -> int:
+    """Rough LLM token count of a text (clinical notes run at about 3.5 characters per token)"""
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def _date_sort_key(date) -> tuple:
+    """Chronological sort key for a timeline date ("20-Jun-2025"); unparsable dates go last"""
+    date = str(date or '').strip()
+    for fmt in ("%d-%b-%Y", "%Y-%m-%d"):
+        try:
+            return (0, datetime.strptime(date, fmt), "")
+        except ValueError:
+            continue
+    return (1, datetime.min, date)
+
+
+def _chunk_sequence(chunk: Dict) -> tuple:
+    """
+    Key of the chunk sequence a chunk was cut from (one category of one record)
+
+    Chunk ids are "<prefix><date>_<category>_chunk_<n>_<row>", and the chunks of
+    one category are added on consecutive rows, so row - n is the same for every
+    chunk of that sequence. Falls back to the "date, category: " text prefix.
+    """
+    head, sep, tail = str(chunk.get('chunk_id', '')).rpartition("_chunk_")
+    number, _, row = tail.partition("_")
+    if sep and number.isdigit() and row.isdigit():
+        return head, int(row) - int(number)
+    return f"{chunk.get('date', '')}_{_split_prefix(chunk)[0]}", -1
+
+
+def _split_prefix(chunk: Dict):
+    """Split a retrieved text into its "date, category: " prefix and the chunk body"""
+    text = chunk.get('text', '')
+    date = str(chunk.get('date', ''))
+    if date and text.startswith(f"{date}, "):
+        colon = text.find(": ", len(date) + 2)
+        if colon != -1:
+            return text[:colon + 2], text[colon + 2:]
+    return "", text
+
+
+class ContextPacker:
+    """
+    Pack retrieved chunks into a page's LLM token budget.
+
+    Chunks hit by several queries are merged (keeping the best score), then
+    taken in order of score (earlier date first on ties). A chunk is dropped if
+    it is a near-duplicate of one already packed, and words repeated from the
+    neighbouring chunk of the same record and category (the chunking overlap)
+    are trimmed.
+    Chunks that no longer fit are skipped, so smaller lower-scored chunks can
+    still fill the rest of the budget. The packed chunks are returned in date
+    order so the LLM reads the notes chronologically.
+    """
+
+    def __init__(self, token_budget: int, count_tokens: Optional[Callable[[str], int]] = None,
+                 near_duplicate_threshold: float = 0.9, min_overlap_words: int = 4, separator: str = "\n\n"):
+        """
+        Initialize the packer
+
+        Args:
+            token_budget: Tokens available for the retrieved text of the page
+            count_tokens: Token counter for the LLM (defaults to estimate_tokens)
+            near_duplicate_threshold: Word-set Jaccard similarity above which a chunk counts as a duplicate
+            min_overlap_words: Shortest repeated run of words trimmed between neighbouring chunks
+            separator: Text placed between packed chunks
+        """
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens or estimate_tokens
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.min_overlap_words = min_overlap_words
+        self.separator = separator
+
+    def _merge_hits(self, chunks: List[Dict]) -> List[Dict]:
+        merged = {}
+        for chunk in chunks:
+            existing = merged.get(chunk['chunk_id'])
+            if existing is None:
+                merged[chunk['chunk_id']] = dict(chunk, query_hits=1)
+            else:
+                existing['query_hits'] += 1
+                existing['score'] = max(existing['score'], chunk['score'])
+        return list(merged.values())
+
+    def _is_near_duplicate(self, words: set, packed_word_sets: List[set]) -> bool:
+        for other in packed_word_sets:
+            union = len(words | other)
+            if union and len(words & other) / union >= self.near_duplicate_threshold:
+                return True
+        return False
+
+    def _overlap(self, before: List[str], after: List[str]) -> int:
+        """Length of the longest run of words that ends `before` and starts `after`"""
+        for size in range(min(len(before), len(after)), self.min_overlap_words - 1, -1):
+            if before[-size:] == after[:size]:
+                return size
+        return 0
+
+    def _trim_overlap(self, chunk: Dict, body_words: List[str], packed: List[Dict]) -> List[str]:
+        sequence = _chunk_sequence(chunk)
+        for other in packed:
+            if other['_sequence'] != sequence:
+                continue
+            distance = chunk.get('chunk_number', 0) - other.get('chunk_number', 0)
+            if distance == 1:
+                # Repeats the end of the previous chunk: drop it from the start
+                size = self._overlap(other['_words'], body_words)
+                body_words = body_words[size:]
+            elif distance == -1:
+                # Repeats the start of the next chunk: drop it from the end
+                size = self._overlap(body_words, other['_words'])
+                body_words = body_words[:len(body_words) - size]
+        return body_words
+
+    def pack(self, chunks: List[Dict]) -> Dict:
+        """
+        Choose the chunks to send for one page
+
+        Args:
+            chunks: Retrieved chunks (text, score, date, chunk_number, chunk_id), possibly repeated across queries
+
+        Returns:
+            Dict with the packed 'chunks', their 'aggregated_text' and packing 'stats'
+        """
+        candidates = self._merge_hits(chunks)
+        candidates.sort(key=lambda c: (-c['score'], _date_sort_key(c.get('date'))))
+
+        separator_tokens = self.count_tokens(self.separator)
+        packed = []
+        packed_word_sets = []
+        tokens_used = 0
+        stats = {
+            "token_budget": self.token_budget,
+            "candidates": len(candidates),
+            "packed": 0,
+            "dropped_duplicate": 0,
+            "dropped_budget": 0,
+            "tokens_used": 0,
+            "tokens_dropped": 0,
+            "tokens_trimmed": 0,
+        }
+
+        for chunk in candidates:
+            prefix, body = _split_prefix(chunk)
+            words = body.split()
+            original_tokens = self.count_tokens(chunk['text'])
+
+            if self._is_near_duplicate(set(words), packed_word_sets):
+                stats["dropped_duplicate"] += 1
+                stats["tokens_dropped"] += original_tokens
+                continue
+
+            trimmed = self._trim_overlap(chunk, words, packed)
+            if not trimmed:
+                stats["dropped_duplicate"] += 1
+                stats["tokens_dropped"] += original_tokens
+                continue
+            text = prefix + " ".join(trimmed) if len(trimmed) < len(words) else chunk['text']
+            tokens = self.count_tokens(text) + (separator_tokens if packed else 0)
+
+            if tokens_used + tokens > self.token_budget:
+                stats["dropped_budget"] += 1
+                stats["tokens_dropped"] += original_tokens
+                continue
+
+            stats["tokens_trimmed"] += max(original_tokens - self.count_tokens(text), 0)
+            tokens_used += tokens
+            packed.append(dict(chunk, text=text, _words=words, _sequence=_chunk_sequence(chunk)))
+            packed_word_sets.append(set(words))
+
+        # Chronological order for the prompt
+        packed.sort(key=lambda c: (_date_sort_key(c.get('date')), c['_sequence'], c.get('chunk_number', 0)))
+        for chunk in packed:
+            del chunk['_words'], chunk['_sequence']
+
+        stats["packed"] = len(packed)
+        stats["tokens_used"] = tokens_used
+        return {
+            'chunks': packed,
+            'aggregated_text': self.separator.join(chunk['text'] for chunk in packed),
+            'stats': stats,
+        }
+
+
+def build_packers(field_sets: Dict, packing_config: Optional[Dict] = None,
+                  token_budgets: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    Create a ContextPacker per field set from the 'context_packing' section of rag_config.yml
+
+    Args:
+        field_sets: Dict mapping field set key (page number) to its queries
+        packing_config: 'context_packing' section of rag_config.yml
+        token_budgets: Optional dict mapping field set key to its token budget,
+            e.g. from the LLM's context window minus the page's rules and schema
+
+    Returns:
+        Dict mapping field set key to its packer, or None if packing is disabled
+    """
+    packing_config = packing_config or {}
+    if not packing_config.get('enabled', False):
+        return None
+
+    chars_per_token = packing_config.get('chars_per_token', DEFAULT_CHARS_PER_TOKEN)
+    count_tokens = lambda text: estimate_tokens(text, chars_per_token)
+    default_budget = packing_config.get('default_token_budget', 4096)
+    token_budgets = token_budgets or {}
+    return {
+        key: ContextPacker(
+            token_budgets.get(key, default_budget),
+            count_tokens,
+            packing_config.get('near_duplicate_threshold', 0.9),
+            packing_config.get('min_overlap_words', 4),
+        )
+        for key in field_sets
+    }
@@ -0,0 +1,148 @@
+import hashlib
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# The SQLite LRU base is shared with the LLM response and OCR caches
+sys.path.append(str(Path(__file__).resolve().parent.parent / "helpers"))
+from sqlite_lru_cache import SQLiteLRUCache, get_shared_cache
+
+
+def hash_text(text: str) -> str:
+    """Return the sha256 hex digest of a prepared chunk text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache(SQLiteLRUCache):
+    """
+    Persistent, content-addressed store of chunk embeddings.
+
+    Vectors are stored as float32 blobs in SQLite, keyed by
+    (sha256 of the prepared chunk text, model name, max_seq_len), so a
+    resubmitted patient or one extra PDF only sends unseen chunks to the encoder.
+    The least recently used entries are evicted once max_entries or max_bytes
+    is exceeded.
+    """
+
+    table = "embeddings"
+    columns = """
+        text_hash TEXT NOT NULL,
+        model_name TEXT NOT NULL,
+        max_seq_len INTEGER NOT NULL,
+        dim INTEGER NOT NULL,
+        vector BLOB NOT NULL,
+        last_access REAL NOT NULL,
+        PRIMARY KEY (text_hash, model_name, max_seq_len)
+    """
+    size_sql = "LENGTH(vector)"
+
+    def __init__(self, db_file: str = "./embedding_cache.db", max_entries: int = 200000,
+                 max_bytes: int = 1024 ** 3, enabled: bool = True):
+        """
+        Initialize the cache
+
+        Args:
+            db_file: Path of the SQLite database file
+            max_entries: Maximum number of cached vectors (0 for no limit)
+            max_bytes: Maximum total size of cached vectors in bytes (0 for no limit)
+            enabled: If False every lookup is a miss and nothing is stored
+        """
+        super().__init__(db_file, max_entries, max_bytes, enabled)
+
+    def get_many(self, texts: List[str], model_name: str, max_seq_len: int) -> Dict[int, np.ndarray]:
+        """
+        Look up cached embeddings for a list of texts
+
+        Args:
+            texts: Prepared chunk texts
+            model_name: Name of the embedding model
+            max_seq_len: Maximum sequence length of the encoder
+
+        Returns:
+            Dict mapping the index of each cached text to its float32 vector
+        """
+        if not self.enabled or not texts:
+            self._count(misses=len(texts))
+            return {}
+
+        hashes = [hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Query in batches to stay under SQLite's host parameter limit
+            unique_hashes = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model_name = ? AND max_seq_len = ? AND text_hash IN ({placeholders})",
+                    [model_name, max_seq_len, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? "
+                    "WHERE text_hash = ? AND model_name = ? AND max_seq_len = ?",
+                    [(now, text_hash, model_name, max_seq_len) for text_hash in found],
+                )
+                self._conn.commit()
+
+        cached = {i: found[text_hash] for i, text_hash in enumerate(hashes) if text_hash in found}
+        self._count(hits=len(cached), misses=len(texts) - len(cached))
+        return cached
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray, model_name: str, max_seq_len: int):
+        """
+        Store embeddings for a list of texts and evict old entries if needed
+
+        Args:
+            texts: Prepared chunk texts
+            embeddings: Array of shape (len(texts), dim)
+            model_name: Name of the embedding model
+            max_seq_len: Maximum sequence length of the encoder
+        """
+        if not self.enabled or len(texts) == 0:
+            return
+
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        now = time.time()
+        rows = [
+            (hash_text(text), model_name, max_seq_len, embedding.shape[0], embedding.tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings "
+                "(text_hash, model_name, max_seq_len, dim, vector, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+
+def get_embedding_cache(cache_config: Optional[Dict] = None) -> EmbeddingCache:
+    """
+    Return the process-wide cache for the configured database file
+
+    Args:
+        cache_config: 'embedding_cache' section of rag_config.yml
+
+    Returns:
+        Shared EmbeddingCache (a disabled one if the config turns it off)
+    """
+    cache_config = cache_config or {}
+    if not cache_config.get("enabled", True):
+        return EmbeddingCache(enabled=False)
+
+    db_file = cache_config.get("db_file", "./embedding_cache.db")
+    return get_shared_cache(EmbeddingCache, db_file, lambda: EmbeddingCache(
+        db_file=db_file,
+        max_entries=cache_config.get("max_entries", 200000),
+        max_bytes=cache_config.get("max_mb", 1024) * 1024 ** 2,
+    ))
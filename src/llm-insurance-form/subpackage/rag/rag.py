@@ -1,16 +1,28 @@
 import yaml
 import os
 import re
-from typing import List, Dict
+import json
+import hashlib
+import time
+import queue
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
 from dataclasses import dataclass
 from sentence_transformers import SentenceTransformer
 from sentence_transformers import models
+import numpy as np
 import torch
 import nltk
 from nltk.tokenize import word_tokenize
+from embedding_cache import EmbeddingCache, get_embedding_cache
+from chunk_table import ChunkTable
+from context_packer import ContextPacker, build_packers
 import warnings
 warnings.filterwarnings('ignore')
 
+DEFAULT_EMBEDDING_MODEL = "emilyalsentzer/Bio_ClinicalBERT"
+DEFAULT_MAX_SEQ_LEN = 384
+
 # Check and download required NLTK data
 def ensure_nltk_data():
     """Download NLTK tokenizer data with fallback for different versions"""
@@ -107,7 +119,93 @@ class TextChunker:
         
         return chunks
 
-def process_all_medical_records(medical_data: dict, max_tokens: int = 256, overlap: int = 8) -> List[TextChunk]:
+class TokenizerChunker:
+    """
+    Chunker that counts and splits on the embedding model's own fast tokenizer.
+
+    Each text is tokenized once, and chunk text is sliced out of the cleaned
+    string using the token offsets, snapped to word boundaries. Because BERT
+    pre-tokenizes on whitespace and punctuation, a slice of whole words encodes
+    to the same wordpieces, so a chunk that fits the budget is never truncated.
+    """
+
+    def __init__(self, tokenizer, chunk_size: int = 256, overlap: int = 8):
+        """
+        Initialize the TokenizerChunker
+
+        Args:
+            tokenizer: Hugging Face fast tokenizer of the embedding model
+            chunk_size: Maximum size of each chunk (in wordpiece tokens)
+            overlap: Number of tokens to overlap between chunks
+        """
+        if not getattr(tokenizer, 'is_fast', False):
+            raise ValueError("TokenizerChunker needs a fast tokenizer (offset mapping support)")
+        self.tokenizer = tokenizer
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        # [CLS] and [SEP] for BERT models
+        self.special_tokens = tokenizer.num_special_tokens_to_add(pair=False)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False, verbose=False)['input_ids'])
+
+    def chunk(self, cleaned_text: str, budget: Optional[int] = None) -> List[TextChunk]:
+        """
+        Chunk already cleaned text so every chunk has at most `budget` tokens
+
+        Args:
+            cleaned_text: Output of clean_text
+            budget: Token budget per chunk (defaults to chunk_size)
+
+        Returns:
+            List of TextChunk objects
+        """
+        budget = max(1, min(budget or self.chunk_size, self.chunk_size))
+        encoding = self.tokenizer(
+            cleaned_text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            return_attention_mask=False,
+            return_token_type_ids=False,
+            verbose=False,
+        )
+        offsets = encoding['offset_mapping']
+        word_ids = encoding.word_ids()
+        n_tokens = len(offsets)
+
+        if n_tokens <= budget:
+            return [TextChunk(text=cleaned_text, word_count=n_tokens)] if n_tokens else []
+
+        overlap = min(self.overlap, budget - 1)
+        chunks = []
+        start = 0
+        while start < n_tokens:
+            end = min(start + budget, n_tokens)
+            # Do not cut a word in half unless the word alone exceeds the budget
+            if end < n_tokens and word_ids[end] is not None and word_ids[end] == word_ids[end - 1]:
+                word_start = end - 1
+                while word_start > start and word_ids[word_start - 1] == word_ids[end]:
+                    word_start -= 1
+                if word_start > start:
+                    end = word_start
+
+            chunks.append(TextChunk(
+                text=cleaned_text[offsets[start][0]:offsets[end - 1][1]],
+                word_count=end - start,
+            ))
+            if end >= n_tokens:
+                break
+
+            # Move start back by the overlap, then forward to the start of a word
+            next_start = max(end - overlap, start + 1)
+            while next_start < end and word_ids[next_start] is not None and word_ids[next_start] == word_ids[next_start - 1]:
+                next_start += 1
+            start = next_start
+
+        return chunks
+
+def process_all_medical_records(medical_data: dict, max_tokens: int = 256, overlap: int = 8,
+                                tokenizer=None, max_seq_len: int = DEFAULT_MAX_SEQ_LEN) -> ChunkTable:
     """
     Process medical records from a dictionary structure and create text chunks.
 
@@ -115,12 +213,16 @@ def process_all_medical_records(medical_data: dict, max_tokens: int = 256, overl
         medical_data (dict): Dictionary containing medical records data
         max_tokens (int): Maximum tokens per chunk
         overlap (int): Number of overlapping tokens between chunks
+        tokenizer: Optional fast tokenizer of the embedding model. When given, tokens
+            are counted in wordpieces and every prepared chunk fits max_seq_len
+        max_seq_len (int): Encoder sequence limit used with tokenizer
 
     Returns:
-        List[TextChunk]: List of processed text chunks with metadata
+        ChunkTable: Processed text chunks with their record metadata stored once per record
     """
-    all_chunks = []
+    all_chunks = ChunkTable()
     chunker = TextChunker(chunk_size=max_tokens, overlap=overlap)
+    token_chunker = TokenizerChunker(tokenizer, chunk_size=max_tokens, overlap=overlap) if tokenizer else None
 
     # print("Processing medical records with metadata...")
 
@@ -157,6 +259,7 @@ def process_all_medical_records(medical_data: dict, max_tokens: int = 256, overl
               text_content = record.get('text', {})
 
             if isinstance(text_content, dict):
+                record_row = None
                 for category, category_text in text_content.items():
                     if not category_text or not category_text.strip():
                         continue
@@ -164,72 +267,64 @@ def process_all_medical_records(medical_data: dict, max_tokens: int = 256, overl
                     # Clean the text
                     cleaned_text = clean_text(category_text)
 
-                    # Calculate token count
-                    tokens = word_tokenize(cleaned_text)
-                    tokens_len = len(tokens)
-
-                    # Create base metadata for this text chunk
-                    base_metadata = {
-                        "date": date,
-                        "doctor": doctor,
-                        "section_type": section_type,
-                        "text_category": category,
-                        "subsections": subsections,
-                        "allergies": allergies,
-                        "record_index": record_idx
-                    }
-
-                    if tokens_len <= max_tokens:
-                        # Single chunk for this category
-                        chunk = TextChunk(
-                            text=cleaned_text,
-                            word_count=tokens_len,
-                            metadata={**base_metadata, "chunk": 1, "total_chunks": 1}
-                        )
-                        all_chunks.append(chunk)
-                        # print(f"  {category}: Single chunk ({tokens_len} tokens)")
+                    if token_chunker:
+                        # Tokenize once; the budget leaves room for the "date, category: " prefix
+                        # added by prepare_chunks_for_embedding and the special tokens
+                        prefix_tokens = token_chunker.count_tokens(f"{date}, {category}: ")
+                        budget = max_seq_len - token_chunker.special_tokens - prefix_tokens
+                        category_chunks = token_chunker.chunk(cleaned_text, budget)
+                        tokens_len = sum(chunk.word_count for chunk in category_chunks)
                     else:
-                        # Multiple chunks needed for this category
-                        category_chunks = chunker.chunk_by_fixed_size(cleaned_text)
+                        category_chunks = None
 
-                        # Update metadata for each chunk
-                        for chunk_idx, chunk in enumerate(category_chunks, 1):
-                            chunk.metadata = {
-                                **base_metadata,
-                                "chunk": chunk_idx,
-                                "total_chunks": len(category_chunks)
-                            }
+                        # Calculate token count
+                        tokens = word_tokenize(cleaned_text)
+                        tokens_len = len(tokens)
+
+                    # Record metadata is stored once and shared by all of its chunks
+                    if record_row is None:
+                        record_row = all_chunks.add_record(
+                            date, doctor, section_type, subsections, allergies, record_idx,
+                            record.get('source_file', '')
+                        )
 
-                        all_chunks.extend(category_chunks)
+                    if category_chunks is None:
+                        if tokens_len <= max_tokens:
+                            # Single chunk for this category
+                            all_chunks.append(cleaned_text, tokens_len, record_row, category)
+                            # print(f"  {category}: Single chunk ({tokens_len} tokens)")
+                            continue
+                        # Multiple chunks needed for this category
+                        category_chunks = chunker.chunk_by_fixed_size(cleaned_text)
                         # print(f"  {category}: {len(category_chunks)} chunks ({tokens_len} tokens total)")
 
+                    for chunk_idx, chunk in enumerate(category_chunks, 1):
+                        all_chunks.append(chunk.text, chunk.word_count, record_row, category,
+                                          chunk_idx, len(category_chunks))
+
     print(f"Completed. Total chunks: {len(all_chunks)}")
     return all_chunks
 
-def prepare_chunks_for_embedding(chunks: List[TextChunk]) -> List[Dict]:
-    prepared_chunks = []
-
-    for i, chunk in enumerate(chunks):
-        # Generate unique ID using index, date, category, and chunk number
-        chunk_id = i + 1
-        if chunk.metadata and 'date' in chunk.metadata:
-            # Include text_category to avoid duplicates from same date/chunk
-            category = chunk.metadata.get('text_category', 'unknown')
-            chunk_num = chunk.metadata.get('chunk', 1)
-            chunk_id = f"{chunk.metadata['date']}_{category}_chunk_{chunk_num}_{i}"
-        prepared_chunk = {
-            'id': chunk_id,
-            'text': chunk.metadata['date'] + ", " + chunk.metadata['text_category'] + ": " + chunk.text,
-            'metadata': {
-                **chunk.metadata
-            }
-        }
-        prepared_chunks.append(prepared_chunk)
+def prepare_chunks_for_embedding(chunks: ChunkTable, id_prefix: str = "") -> ChunkTable:
+    """
+    Give every chunk a unique id ahead of embedding
 
-    return prepared_chunks
+    Texts are already stored as "<date>, <category>: <chunk>", so the table is
+    updated in place instead of building a new dict per chunk.
+
+    Args:
+        chunks: Output of process_all_medical_records
+        id_prefix: Prefix for the ids (e.g. a content hash for patient indexes)
+
+    Returns:
+        The same ChunkTable, with ids assigned
+    """
+    # Unique ID from date, category, chunk number and index to avoid duplicates
+    chunks.assign_ids(id_prefix)
+    return chunks
 
-def build_bioclinical_sentence_model(max_seq_len: int = 384):
-    word_emb = models.Transformer("emilyalsentzer/Bio_ClinicalBERT", max_seq_length=max_seq_len)
+def build_bioclinical_sentence_model(max_seq_len: int = DEFAULT_MAX_SEQ_LEN, model_name: str = DEFAULT_EMBEDDING_MODEL):
+    word_emb = models.Transformer(model_name, max_seq_length=max_seq_len)
     pooling = models.Pooling(
         word_emb.get_word_embedding_dimension(),
         pooling_mode_mean_tokens=True,
@@ -238,71 +333,372 @@ def build_bioclinical_sentence_model(max_seq_len: int = 384):
     )
     return SentenceTransformer(modules=[word_emb, pooling])
 
-def generate_embeddings(prepared_chunks: List[Dict], model_name: str = "emilyalsentzer/Bio_ClinicalBERT") -> List[Dict]:
-    print(f"Loading model: {model_name}")
-    model = build_bioclinical_sentence_model()
+def resolve_device(device: Optional[str] = None) -> str:
+    """Return the requested device, or cuda when available and cpu otherwise"""
+    if device and device != "auto":
+        return device
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+class EmbeddingModelPool:
+    """
+    Process-wide registry of loaded sentence encoders.
+
+    One encoder is kept per (model name, max_seq_len, device), so the indexing
+    path (generate_embeddings) and the query path (MedicalRAGRetriever) of every
+    concurrent job share the same weights instead of loading them per call.
+    """
+
+    def __init__(self):
+        self._models: Dict[Tuple[str, int, str], SentenceTransformer] = {}
+        self._stats: Dict[Tuple[str, int, str], Dict] = {}
+        self._key_locks: Dict[Tuple[str, int, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_EMBEDDING_MODEL, max_seq_len: int = DEFAULT_MAX_SEQ_LEN,
+            device: Optional[str] = None) -> SentenceTransformer:
+        """
+        Return the shared encoder for the given key, loading it on first use
+
+        Args:
+            model_name: Hugging Face model name of the transformer
+            max_seq_len: Maximum sequence length used by the encoder
+            device: Device to place the model on (defaults to cuda if available)
+
+        Returns:
+            Loaded SentenceTransformer model
+        """
+        key = (model_name, max_seq_len, resolve_device(device))
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        # One lock per key so a slow load does not block other models
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self._load(key)
+        return model
+
+    def warm(self, model_name: str = DEFAULT_EMBEDDING_MODEL, max_seq_len: int = DEFAULT_MAX_SEQ_LEN,
+             device: Optional[str] = None) -> Dict:
+        """Load the encoder ahead of the first job and return its load statistics"""
+        key = (model_name, max_seq_len, resolve_device(device))
+        model = self.get(model_name, max_seq_len, device)
+        # Captured now: a concurrent unload may evict the entry before warm returns
+        with self._lock:
+            stats = dict(self._stats.get(key, {}))
+        # Run one tiny batch so CUDA kernels are initialized before the first job
+        model.encode(["warm up"], show_progress_bar=False)
+        return stats
+
+    def _load(self, key: Tuple[str, int, str]) -> SentenceTransformer:
+        model_name, max_seq_len, device = key
+        print(f"Loading model: {model_name} (max_seq_len={max_seq_len}, device={device})")
+
+        is_cuda = device.startswith('cuda') and torch.cuda.is_available()
+        cuda_before = torch.cuda.memory_allocated(device) if is_cuda else 0
+        start_time = time.perf_counter()
+
+        model = build_bioclinical_sentence_model(max_seq_len, model_name)
+        model = model.to(device)
+        model.eval()
+
+        load_time = time.perf_counter() - start_time
+        param_bytes = sum(p.numel() * p.element_size() for p in model.parameters())
+        cuda_bytes = torch.cuda.memory_allocated(device) - cuda_before if is_cuda else 0
+
+        stats = {
+            "model_name": model_name,
+            "max_seq_len": max_seq_len,
+            "device": device,
+            "load_time_s": round(load_time, 2),
+            "param_memory_mb": round(param_bytes / 1024 ** 2, 1),
+            "cuda_memory_mb": round(cuda_bytes / 1024 ** 2, 1),
+        }
+        # Published under the pool lock so unload/stats never see the dicts change mid-iteration
+        with self._lock:
+            self._models[key] = model
+            self._stats[key] = stats
+        print(f"Model loaded in {load_time:.1f}s ({param_bytes / 1024 ** 2:.0f} MB of weights)")
+        return model
+
+    def unload(self, model_name: Optional[str] = None, max_seq_len: Optional[int] = None,
+               device: Optional[str] = None) -> int:
+        """
+        Evict loaded encoders matching the given filters (None matches everything)
+
+        Jobs already holding a reference keep working; the memory is released
+        once they finish.
+
+        Returns:
+            Number of encoders evicted
+        """
+        with self._lock:
+            keys = [
+                key for key in self._models
+                if (model_name is None or key[0] == model_name)
+                and (max_seq_len is None or key[1] == max_seq_len)
+                and (device is None or key[2] == device)
+            ]
+            for key in keys:
+                del self._models[key]
+                self._stats.pop(key, None)
+                print(f"Unloaded model: {key[0]} (max_seq_len={key[1]}, device={key[2]})")
+
+        if keys and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return len(keys)
+
+    def stats(self) -> List[Dict]:
+        """Return load time and memory statistics for every loaded encoder"""
+        with self._lock:
+            return [dict(stat) for stat in self._stats.values()]
+
+# Shared by every job in this process
+EMBEDDING_MODEL_POOL = EmbeddingModelPool()
+
+def get_embedding_model(model_name: str = DEFAULT_EMBEDDING_MODEL, max_seq_len: int = DEFAULT_MAX_SEQ_LEN,
+                        device: Optional[str] = None) -> SentenceTransformer:
+    return EMBEDDING_MODEL_POOL.get(model_name, max_seq_len, device)
+
+def load_rag_config(config_path: str = "rag_config.yml") -> Dict:
+    with open(config_path, 'r', encoding='utf-8') as file:
+        config = yaml.safe_load(file)
+    return config.get('rag_config', {})
+
+def warm_embedding_model(config_path: str = "rag_config.yml") -> Dict:
+    """
+    Load the configured encoder into the shared pool, so the first job does not
+    pay the model load.
+
+    Nothing in this package calls it: the serving process should call it once
+    at startup (e.g. before app.run in the Flask server), otherwise the first
+    retrieve_rag loads the model lazily.
+    """
+    rag_config = load_rag_config(config_path)
+    return EMBEDDING_MODEL_POOL.warm(
+        rag_config.get('embedding_model', DEFAULT_EMBEDDING_MODEL),
+        rag_config.get('max_seq_len', DEFAULT_MAX_SEQ_LEN),
+        rag_config.get('device'),
+    )
 
-    # Check if GPU is available
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = model.to(device)
-    # print(f"Device: {device}")
+def generate_embeddings(prepared_chunks: ChunkTable, model_name: str = DEFAULT_EMBEDDING_MODEL,
+                        max_seq_len: int = DEFAULT_MAX_SEQ_LEN, cache: Optional[EmbeddingCache] = None) -> ChunkTable:
+    """
+    Embed prepared chunks, only sending chunks missing from the cache to the encoder
+
+    Args:
+        prepared_chunks: Output of prepare_chunks_for_embedding
+        model_name: Name of the embedding model
+        max_seq_len: Maximum sequence length of the encoder
+        cache: Optional EmbeddingCache; pass None (or a disabled cache) to always encode
 
+    Returns:
+        The same ChunkTable with its float32 embedding matrix set
+    """
     # Extract texts for embedding
-    texts = [chunk['text'] for chunk in prepared_chunks]
+    texts = prepared_chunks.texts
+
+    cached = cache.get_many(texts, model_name, max_seq_len) if cache is not None else {}
+    missing = [i for i in range(len(texts)) if i not in cached]
 
-    print(f"Processing {len(texts)} text chunks...")
+    print(f"Processing {len(texts)} text chunks ({len(cached)} cached, {len(missing)} to embed)...")
     # start_time = time.time()
 
-    # Generate embeddings for all texts
-    embeddings = model.encode(
-        texts,
-        convert_to_tensor=True,
-        show_progress_bar=False
-    )
+    new_embeddings = None
+    if missing:
+        model = get_embedding_model(model_name, max_seq_len)
+
+        # Generate embeddings for the texts not found in the cache
+        new_embeddings = model.encode(
+            [texts[i] for i in missing],
+            convert_to_tensor=True,
+            show_progress_bar=False
+        )
+
+        # Convert to CPU and numpy for storage
+        new_embeddings = new_embeddings.cpu().numpy()
 
-    # Convert to CPU and numpy for storage
-    embeddings = embeddings.cpu().numpy()
+        if cache is not None:
+            cache.put_many([texts[i] for i in missing], new_embeddings, model_name, max_seq_len)
 
     # end_time = time.time()
     # print(f"Embedding generation completed in {end_time - start_time:.1f}s")
-    # print(f"Vector dimension: {len(embeddings[0])}")
-
-    # Add embeddings to chunks
-    embedded_chunks = []
-    for chunk, embedding in zip(prepared_chunks, embeddings):
-        embedded_chunk = {
-            **chunk,
-            'embedding': embedding.tolist(),  # Convert numpy array to list for JSON serialization
-            'embedding_model': "emilyalsentzer/Bio_ClinicalBERT",
-            'embedding_dimension': len(embedding)
-        }
-        embedded_chunks.append(embedded_chunk)
 
-    return embedded_chunks
+    if not texts:
+        return prepared_chunks
+
+    # Fill one float32 matrix, row i belonging to chunk i
+    embedding_dim = new_embeddings.shape[1] if new_embeddings is not None else len(next(iter(cached.values())))
+    embeddings = np.empty((len(texts), embedding_dim), dtype=np.float32)
+    for i, embedding in cached.items():
+        embeddings[i] = embedding
+    if new_embeddings is not None:
+        embeddings[missing] = new_embeddings
+
+    prepared_chunks.set_embeddings(embeddings, model_name)
+    return prepared_chunks
 
 from pymilvus import connections, Collection, FieldSchema, CollectionSchema, DataType, utility
 import uuid
 
+def namespaced_collection_name(base_name: str, namespace: Optional[str] = None) -> str:
+    """Return a valid Milvus collection name for a job or patient namespace"""
+    if not namespace:
+        return base_name
+    # Milvus names only allow letters, digits and underscores
+    suffix = re.sub(r'[^0-9A-Za-z_]', '_', str(namespace))
+    return f"{base_name}_{suffix}"[:255]
+
+class MilvusConnectionPool:
+    """
+    Bounded pool of pymilvus connection aliases to one Milvus Lite file.
+
+    Each vector store borrows an alias for its lifetime, so several jobs can
+    index and search in parallel while the number of open connections stays
+    bounded.
+    """
+
+    def __init__(self, db_file: str = "./milvus_lite.db", max_connections: int = 4):
+        self.db_file = db_file
+        self.max_connections = max_connections
+        self._available = queue.Queue()
+        self._connected = set()
+        self._lock = threading.Lock()
+
+        prefix = "rag_" + re.sub(r'[^0-9A-Za-z_]', '_', os.path.basename(db_file))
+        for i in range(max_connections):
+            self._available.put(f"{prefix}_{i}")
+
+    def acquire(self, timeout: Optional[float] = None) -> str:
+        """Borrow a connected alias, waiting if every connection is in use"""
+        try:
+            alias = self._available.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No Milvus connection available within {timeout}s")
+
+        try:
+            with self._lock:
+                if alias not in self._connected:
+                    connections.connect(alias, uri=self.db_file)
+                    self._connected.add(alias)
+        except Exception:
+            self._available.put(alias)
+            raise
+        return alias
+
+    def release(self, alias: str):
+        self._available.put(alias)
+
+class CollectionRegistry:
+    """Reference counts of the collections currently used by running jobs"""
+
+    def __init__(self):
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name: str) -> int:
+        with self._lock:
+            self._refs[name] = self._refs.get(name, 0) + 1
+            return self._refs[name]
+
+    def release(self, name: str) -> int:
+        """Drop one reference and return how many remain"""
+        with self._lock:
+            remaining = self._refs.get(name, 0) - 1
+            if remaining > 0:
+                self._refs[name] = remaining
+            else:
+                self._refs.pop(name, None)
+                remaining = 0
+            return remaining
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self._refs.get(name, 0)
+
+_connection_pools: Dict[str, MilvusConnectionPool] = {}
+_connection_pools_lock = threading.Lock()
+COLLECTION_REGISTRY = CollectionRegistry()
+
+def get_milvus_connection_pool(db_file: str = "./milvus_lite.db", max_connections: int = 4) -> MilvusConnectionPool:
+    """
+    Return the process-wide connection pool for a Milvus Lite file
+
+    There is one pool per file, so the connections to it stay bounded (and its
+    aliases unique); the first caller's max_connections sizes it, and a later
+    request for a different size gets the existing pool with a warning.
+    """
+    with _connection_pools_lock:
+        pool = _connection_pools.get(db_file)
+        if pool is None:
+            pool = MilvusConnectionPool(db_file, max_connections)
+            _connection_pools[db_file] = pool
+        elif pool.max_connections != max_connections:
+            print(f"Warning: Milvus connection pool for {db_file} already has {pool.max_connections} "
+                  f"connections; ignoring max_connections={max_connections}")
+        return pool
+
 class MilvusVectorStore:
 
-    def __init__(self, collection_name: str = "medical_rag_embeddings", db_file: str = "./milvus_lite.db"):
-        self.collection_name = collection_name
+    def __init__(self, collection_name: str = "medical_rag_embeddings", db_file: str = "./milvus_lite.db",
+                 namespace: Optional[str] = None, max_connections: int = 4, drop_on_close: bool = True):
+        """
+        Initialize the store
+
+        Args:
+            collection_name: Base name of the collection
+            db_file: Milvus Lite database file
+            namespace: Job or patient id appended to the collection name, so
+                concurrent jobs never drop each other's collection
+            max_connections: Size of the shared connection pool for db_file
+            drop_on_close: Drop the collection when the last job using it closes
+        """
+        self.collection_name = namespaced_collection_name(collection_name, namespace)
         self.db_file = db_file
         self.collection = None
+        self.drop_on_close = drop_on_close
+        self.alias = None
+        self._pool = get_milvus_connection_pool(db_file, max_connections)
 
     def connect(self):
+        if self.alias:
+            return True
         try:
-            connections.connect("default", uri=self.db_file)
-            print(f"Connected to Milvus Lite at {self.db_file}")
+            self.alias = self._pool.acquire()
+            COLLECTION_REGISTRY.acquire(self.collection_name)
+            print(f"Connected to Milvus Lite at {self.db_file} ({self.alias}, collection {self.collection_name})")
             return True
         except Exception as e:
             print(f"Connection failed: {e}")
             return False
 
+    def close(self):
+        """
+        Give the connection back to the pool and release this job's reference
+        to the collection, dropping it once no other job uses it
+        """
+        if not self.alias:
+            return
+        try:
+            remaining = COLLECTION_REGISTRY.release(self.collection_name)
+            if remaining == 0 and self.drop_on_close and utility.has_collection(self.collection_name, using=self.alias):
+                utility.drop_collection(self.collection_name, using=self.alias)
+                print(f"Dropped collection: {self.collection_name}")
+        except Exception as e:
+            print(f"Failed to clean up collection {self.collection_name}: {e}")
+        finally:
+            self.collection = None
+            self._pool.release(self.alias)
+            self.alias = None
+
     def create_collection(self, embedding_dim: int = 768):
-        # Drop existing collection if it exists
-        if utility.has_collection(self.collection_name):
-            utility.drop_collection(self.collection_name)
+        # Drop existing collection if it exists (namespaced, so only a stale copy of this job's own)
+        if utility.has_collection(self.collection_name, using=self.alias):
+            utility.drop_collection(self.collection_name, using=self.alias)
             print(f"Removed existing collection: {self.collection_name}")
 
         # Define schema
@@ -318,7 +714,7 @@ class MilvusVectorStore:
         schema = CollectionSchema(fields, f"Medical RAG embeddings collection with {embedding_dim}D vectors")
 
         # Create collection
-        self.collection = Collection(self.collection_name, schema)
+        self.collection = Collection(self.collection_name, schema, using=self.alias)
         # print(f"Collection created: {self.collection_name}")
 
         # Create index for vector search
@@ -331,38 +727,32 @@ class MilvusVectorStore:
         self.collection.create_index("embedding", index_params)
         # print("Vector index ready")
 
-    def insert_embeddings(self, embedded_chunks: List[Dict]):
+    def insert_embeddings(self, embedded_chunks: ChunkTable):
         """
         Insert embedded chunks into Milvus collection
 
         Args:
-            embedded_chunks: List of chunks with embeddings
+            embedded_chunks: ChunkTable with embeddings (a list of chunk dicts is converted)
         """
         if not self.collection:
             print("Collection not initialized. Call create_collection() first.")
             return
 
-        # Prepare data for insertion
-        ids = []
-        texts = []
-        embeddings = []
-        dates = []
-        chunk_numbers = []
-        word_counts = []
-        i = 0
-        for chunk in embedded_chunks:
-            # Generate unique ID if not present
-            chunk_id = chunk.get('id', str(uuid.uuid4()))
-
-            ids.append(str(chunk_id))
-            texts.append(chunk['text'][:9999])  # Truncate if too long
-            embeddings.append(chunk['embedding'])
-            dates.append(chunk['metadata'].get('date', 'unknown'))
-            chunk_numbers.append(chunk['metadata'].get('chunk', 1))
-            word_counts.append(chunk['metadata'].get('word_count', 0))
-
-        # Insert data
-        data = [ids, texts, embeddings, dates, chunk_numbers, word_counts]
+        if not isinstance(embedded_chunks, ChunkTable):
+            embedded_chunks = ChunkTable.from_dicts(embedded_chunks)
+
+        if not len(embedded_chunks):
+            return None
+
+        # Columns go to Milvus as they are; the embedding matrix is passed without a list conversion
+        data = [
+            embedded_chunks.ids,
+            [text[:9999] for text in embedded_chunks.texts],  # Truncate if too long
+            embedded_chunks.embeddings,
+            embedded_chunks.dates(),
+            list(embedded_chunks.chunk_numbers),
+            list(embedded_chunks.word_counts),
+        ]
 
         try:
             insert_result = self.collection.insert(data)
@@ -377,12 +767,45 @@ class MilvusVectorStore:
             print(f"Insert failed: {e}")
             return None
 
+    def exists(self) -> bool:
+        return utility.has_collection(self.collection_name, using=self.alias)
+
+    def open_collection(self, embedding_dim: int = 768):
+        """Reuse the existing collection (e.g. a persistent patient index) or create it"""
+        if utility.has_collection(self.collection_name, using=self.alias):
+            self.collection = Collection(self.collection_name, using=self.alias)
+            self.load_collection()
+        else:
+            self.create_collection(embedding_dim)
+
+    def delete_by_ids(self, chunk_ids: List[str]):
+        """Delete chunks by primary key"""
+        if not self.collection or not chunk_ids:
+            return
+        self.collection.delete(f"id in {json.dumps([str(chunk_id) for chunk_id in chunk_ids])}")
+        self.collection.flush()
+        print(f"Deleted {len(chunk_ids)} chunks from {self.collection_name}")
+
     def load_collection(self):
         if self.collection:
             self.collection.load()
             # print("Collection loaded into memory")
 
     def search_similar(self, query_embedding: List[float], top_k: int = 8, date_filter: str = None):
+        return self.search_similar_batch([query_embedding], top_k=top_k, date_filter=date_filter)
+
+    def search_similar_batch(self, query_embeddings, top_k: int = 8, date_filter: str = None):
+        """
+        Search with several query vectors in a single round trip
+
+        Args:
+            query_embeddings: Sequence of query vectors (list of lists or 2D array)
+            top_k: Number of hits per query
+            date_filter: Optional date to restrict the search to
+
+        Returns:
+            One list of hits per query vector, in query order
+        """
         if not self.collection:
             print("Collection not initialized")
             return []
@@ -394,7 +817,7 @@ class MilvusVectorStore:
         if date_filter:
             expr = f'date == "{date_filter}"'
         results = self.collection.search(
-            [query_embedding],
+            [list(map(float, embedding)) for embedding in query_embeddings],
             "embedding",
             search_params,
             limit=top_k,
@@ -411,16 +834,418 @@ class MilvusVectorStore:
             return stats
         return 0
     
+class _NumpyHit:
+    """Search hit with the same attributes MedicalRAGRetriever reads from Milvus hits"""
+    __slots__ = ("id", "score", "entity")
+
+    def __init__(self, id, score: float, entity: Dict):
+        self.id = id
+        self.score = score
+        self.entity = entity
+
+class _NumpyCollection:
+    """Columns of one in-memory collection; row i of every column belongs to the same chunk"""
+
+    def __init__(self, name: str, embedding_dim: int):
+        self.name = name
+        self.embedding_dim = embedding_dim
+        self.matrix = np.empty((0, embedding_dim), dtype=np.float32)
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.dates = np.empty(0, dtype=object)
+        self.chunk_numbers: List[int] = []
+        self.word_counts: List[int] = []
+
+    @property
+    def num_entities(self) -> int:
+        return len(self.ids)
+
+class NumpyVectorStore:
+    """
+    In-process vector store with the same interface as MilvusVectorStore.
+
+    A single patient's timeline gives at most a few hundred chunks, so the
+    normalized float32 vectors are kept in one contiguous matrix and a batch of
+    queries is answered with one matmul plus argpartition, without a database.
+    """
+
+    def __init__(self, collection_name: str = "medical_rag_embeddings", namespace: Optional[str] = None):
+        self.collection_name = namespaced_collection_name(collection_name, namespace)
+        self.collection = None
+
+    def connect(self):
+        return True
+
+    def close(self):
+        # Each store owns its matrix, so closing just frees it
+        self.collection = None
+
+    def create_collection(self, embedding_dim: int = 768):
+        # Replaces any existing data, like MilvusVectorStore.create_collection
+        self.collection = _NumpyCollection(self.collection_name, embedding_dim)
+
+    def insert_embeddings(self, embedded_chunks: ChunkTable):
+        """
+        Insert embedded chunks into the in-memory collection
+
+        Args:
+            embedded_chunks: ChunkTable with embeddings (a list of chunk dicts is converted)
+        """
+        if not self.collection:
+            print("Collection not initialized. Call create_collection() first.")
+            return
+
+        if not isinstance(embedded_chunks, ChunkTable):
+            embedded_chunks = ChunkTable.from_dicts(embedded_chunks)
+
+        if not len(embedded_chunks):
+            return None
+
+        vectors = embedded_chunks.embeddings
+        if vectors is None or vectors.shape[1] != self.collection.embedding_dim:
+            shape = None if vectors is None else vectors.shape
+            print(f"Insert failed: expected {self.collection.embedding_dim}-dim vectors, got shape {shape}")
+            return None
+
+        # Normalize once at insert time so search is a plain dot product
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        collection = self.collection
+        ids = list(embedded_chunks.ids)
+        if collection.num_entities:
+            collection.matrix = np.ascontiguousarray(np.vstack([collection.matrix, vectors]))
+        else:
+            collection.matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        collection.ids.extend(ids)
+        collection.texts.extend(text[:9999] for text in embedded_chunks.texts)
+        collection.dates = np.concatenate([collection.dates, np.array(embedded_chunks.dates(), dtype=object)])
+        collection.chunk_numbers.extend(embedded_chunks.chunk_numbers)
+        collection.word_counts.extend(embedded_chunks.word_counts)
+
+        print(f"Data inserted ({len(embedded_chunks)} chunks)")
+        return ids
+
+    def load_collection(self):
+        # Data is always in memory
+        pass
+
+    def exists(self) -> bool:
+        return self.collection is not None
+
+    def open_collection(self, embedding_dim: int = 768):
+        """Keep the collection already held in memory, or create an empty one"""
+        if not self.collection or self.collection.embedding_dim != embedding_dim:
+            self.create_collection(embedding_dim)
+
+    def delete_by_ids(self, chunk_ids: List[str]):
+        """Delete chunks by id, compacting the matrix"""
+        if not self.collection or not chunk_ids:
+            return
+        collection = self.collection
+        removed = set(str(chunk_id) for chunk_id in chunk_ids)
+        keep = [row for row, chunk_id in enumerate(collection.ids) if chunk_id not in removed]
+
+        collection.matrix = np.ascontiguousarray(collection.matrix[keep])
+        collection.ids = [collection.ids[row] for row in keep]
+        collection.texts = [collection.texts[row] for row in keep]
+        collection.dates = collection.dates[keep]
+        collection.chunk_numbers = [collection.chunk_numbers[row] for row in keep]
+        collection.word_counts = [collection.word_counts[row] for row in keep]
+        print(f"Deleted {len(removed)} chunks from {self.collection_name}")
+
+    def save(self, path: str):
+        """Persist the collection as <path>.npy (vectors) and <path>.json (columns)"""
+        if not self.collection:
+            return
+        collection = self.collection
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.save(path + ".npy", collection.matrix)
+        with open(path + ".json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "embedding_dim": collection.embedding_dim,
+                "ids": collection.ids,
+                "texts": collection.texts,
+                "dates": collection.dates.tolist(),
+                "chunk_numbers": collection.chunk_numbers,
+                "word_counts": collection.word_counts,
+            }, f, ensure_ascii=False)
+
+    def load(self, path: str) -> bool:
+        """Load a collection saved with save(); returns False if there is none"""
+        if not (os.path.exists(path + ".npy") and os.path.exists(path + ".json")):
+            return False
+        with open(path + ".json", 'r', encoding='utf-8') as f:
+            columns = json.load(f)
+
+        collection = _NumpyCollection(self.collection_name, columns["embedding_dim"])
+        collection.matrix = np.ascontiguousarray(np.load(path + ".npy"), dtype=np.float32)
+        collection.ids = columns["ids"]
+        collection.texts = columns["texts"]
+        collection.dates = np.array(columns["dates"], dtype=object)
+        collection.chunk_numbers = columns["chunk_numbers"]
+        collection.word_counts = columns["word_counts"]
+        self.collection = collection
+        return True
+
+    def search_similar(self, query_embedding: List[float], top_k: int = 8, date_filter: str = None):
+        return self.search_similar_batch([query_embedding], top_k=top_k, date_filter=date_filter)
+
+    def search_similar_batch(self, query_embeddings, top_k: int = 8, date_filter: str = None):
+        """
+        Cosine top-k for a batch of query vectors
+
+        Args:
+            query_embeddings: Sequence of query vectors (list of lists or 2D array)
+            top_k: Number of hits per query
+            date_filter: Optional date to restrict the search to
+
+        Returns:
+            One list of hits per query vector, in query order
+        """
+        if not self.collection:
+            print("Collection not initialized")
+            return []
+
+        collection = self.collection
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(-1, collection.embedding_dim)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        # Optional date filtering
+        rows = np.arange(collection.num_entities)
+        if date_filter:
+            rows = np.flatnonzero(collection.dates == date_filter)
+
+        k = min(top_k, len(rows))
+        if k == 0:
+            return [[] for _ in range(len(queries))]
+
+        matrix = collection.matrix if not date_filter else collection.matrix[rows]
+        scores = queries @ matrix.T
+
+        # Unordered top-k per query, then sort only those k
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = []
+        for query_rows, query_scores in zip(top, top_scores):
+            hits = []
+            for local_row, score in zip(query_rows, query_scores):
+                row = rows[local_row]
+                hits.append(_NumpyHit(
+                    collection.ids[row],
+                    float(score),
+                    {
+                        "text": collection.texts[row],
+                        "date": collection.dates[row],
+                        "chunk_number": collection.chunk_numbers[row],
+                        "word_count": collection.word_counts[row],
+                    },
+                ))
+            results.append(hits)
+        return results
+
+    def get_collection_stats(self):
+        if self.collection:
+            stats = self.collection.num_entities
+            print(f"Collection '{self.collection_name}' contains {stats} vectors")
+            return stats
+        return 0
+
+def create_vector_store(store_config: Optional[Dict] = None, namespace: Optional[str] = None):
+    """
+    Build the vector store selected by the 'vector_store' section of rag_config.yml
+
+    Args:
+        store_config: Dict with 'backend' ("milvus" or "numpy") and backend options
+        namespace: Job or patient id used to isolate the collection
+
+    Returns:
+        MilvusVectorStore or NumpyVectorStore
+    """
+    store_config = store_config or {}
+    backend = store_config.get('backend', 'milvus')
+    collection_name = store_config.get('collection_name', 'medical_rag_embeddings')
+
+    if backend == 'numpy':
+        return NumpyVectorStore(collection_name, namespace)
+    if backend == 'milvus':
+        return MilvusVectorStore(
+            collection_name,
+            store_config.get('db_file', './milvus_lite.db'),
+            namespace=namespace,
+            max_connections=store_config.get('max_connections', 4),
+            drop_on_close=store_config.get('drop_on_close', True),
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+    
+def split_timeline_by_source(timeline: Dict) -> Dict[str, Dict[str, List[Dict]]]:
+    """Group a combined patient timeline into one sub-timeline per source_file"""
+    by_source = {}
+    for date, records in timeline.items():
+        for record in records:
+            if not isinstance(record, dict):
+                continue
+            source_file = record.get('source_file') or 'unknown'
+            by_source.setdefault(source_file, {}).setdefault(date, []).append(record)
+    return by_source
+
+def hash_timeline(timeline: Dict) -> str:
+    return hashlib.sha256(json.dumps(timeline, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+_patient_locks: Dict[str, threading.Lock] = {}
+_patient_locks_lock = threading.Lock()
+
+class PatientIndex:
+    """
+    Persistent per-patient index that only embeds new or changed documents.
+
+    A manifest records, for every source_file, the hash of its parsed records
+    and the ids of its chunks. sync() deletes the chunks of removed or changed
+    files and inserts chunks only for new or changed files, reusing the
+    patient's existing collection, so one extra PDF costs one file's worth of
+    chunking, embedding and indexing.
+    """
+
+    def __init__(self, patient_id: str, store_config: Optional[Dict] = None, index_dir: str = "./patient_indexes"):
+        self.patient_id = str(patient_id)
+        store_config = {**(store_config or {}), 'drop_on_close': False}
+        self.vector_store = create_vector_store(store_config, namespace=f"patient_{self.patient_id}")
+
+        safe_id = re.sub(r'[^0-9A-Za-z_.-]', '_', self.patient_id)
+        self.manifest_path = os.path.join(index_dir, f"{safe_id}.manifest.json")
+        self.store_path = os.path.join(index_dir, safe_id)
+
+        # Jobs for the same patient update and search the index one at a time
+        with _patient_locks_lock:
+            self.lock = _patient_locks.setdefault(self.patient_id, threading.Lock())
+
+    def _load_manifest(self) -> Dict:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {"patient_id": self.patient_id, "index_params": None, "embedding_dim": None, "files": {}}
+
+    def _save_manifest(self, manifest: Dict):
+        os.makedirs(os.path.dirname(os.path.abspath(self.manifest_path)), exist_ok=True)
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def sync(self, timeline: Dict, chunk_size: int, overlap: int, model_name: str = DEFAULT_EMBEDDING_MODEL,
+             max_seq_len: int = DEFAULT_MAX_SEQ_LEN, embedding_cache: Optional[EmbeddingCache] = None,
+             tokenizer=None) -> Dict:
+        """
+        Bring the index in line with the given timeline
+
+        Args:
+            timeline: Combined patient timeline (records carry 'source_file')
+            chunk_size: Maximum tokens per chunk
+            overlap: Number of overlapping tokens between chunks
+            model_name: Name of the embedding model
+            max_seq_len: Maximum sequence length of the encoder
+            embedding_cache: Optional EmbeddingCache used for the new chunks
+            tokenizer: Optional fast tokenizer for wordpiece chunking
+
+        Returns:
+            Dict with the added, changed, removed and unchanged source files
+        """
+        if not self.vector_store.connect():
+            raise RuntimeError(f"Could not connect to the vector store for patient {self.patient_id}")
+
+        manifest = self._load_manifest()
+        index_params = {
+            "chunk_size": chunk_size,
+            "overlap": overlap,
+            "model_name": model_name,
+            "max_seq_len": max_seq_len,
+            "chunking_mode": "tokenizer" if tokenizer else "nltk",
+        }
+
+        if isinstance(self.vector_store, NumpyVectorStore) and not self.vector_store.exists():
+            self.vector_store.load(self.store_path)
+
+        # Different chunking/model settings or a lost collection means a full rebuild
+        rebuild = manifest["index_params"] != index_params or not self.vector_store.exists()
+        if rebuild:
+            manifest = {"patient_id": self.patient_id, "index_params": index_params,
+                        "embedding_dim": None, "files": {}}
+
+        by_source = split_timeline_by_source(timeline)
+        hashes = {source_file: hash_timeline(records) for source_file, records in by_source.items()}
+        known = manifest["files"]
+
+        removed = [source_file for source_file in known if source_file not in hashes]
+        changed = [source_file for source_file in hashes
+                   if source_file in known and known[source_file]["content_hash"] != hashes[source_file]]
+        added = [source_file for source_file in hashes if source_file not in known]
+        unchanged = [source_file for source_file in hashes if source_file in known and source_file not in changed]
+
+        print(f"Patient {self.patient_id}: {len(added)} new, {len(changed)} changed, "
+              f"{len(removed)} removed, {len(unchanged)} unchanged files")
+
+        # Chunk and embed only the new or changed files
+        new_chunks = ChunkTable()
+        new_files = {}
+        for source_file in added + changed:
+            content_hash = hashes[source_file]
+            chunks = process_all_medical_records(by_source[source_file], chunk_size, overlap, tokenizer, max_seq_len)
+            # The content hash in the id keeps ids stable across jobs and unique across versions
+            prepared = prepare_chunks_for_embedding(chunks, id_prefix=f"{content_hash[:12]}_")
+            new_chunks.extend(prepared)
+            new_files[source_file] = {
+                "content_hash": content_hash,
+                "chunk_ids": list(prepared.ids),
+            }
+
+        if len(new_chunks):
+            generate_embeddings(new_chunks, model_name, max_seq_len, embedding_cache)
+
+        embedding_dim = new_chunks.embedding_dim or manifest["embedding_dim"] or 768
+        if rebuild:
+            self.vector_store.create_collection(embedding_dim)
+        else:
+            self.vector_store.open_collection(embedding_dim)
+
+        stale_ids = [chunk_id for source_file in removed + changed for chunk_id in known[source_file]["chunk_ids"]]
+        self.vector_store.delete_by_ids(stale_ids)
+        if len(new_chunks):
+            self.vector_store.insert_embeddings(new_chunks)
+        self.vector_store.load_collection()
+
+        for source_file in removed:
+            del known[source_file]
+        known.update(new_files)
+        manifest["embedding_dim"] = embedding_dim
+        self._save_manifest(manifest)
+        if isinstance(self.vector_store, NumpyVectorStore):
+            self.vector_store.save(self.store_path)
+
+        return {
+            "added": added,
+            "changed": changed,
+            "removed": removed,
+            "unchanged": unchanged,
+            "chunks_embedded": len(new_chunks),
+            "chunks_deleted": len(stale_ids),
+        }
+
+    def close(self):
+        # drop_on_close is off, so the collection stays for the next job
+        self.vector_store.close()
+
 class MedicalRAGRetriever:
 
-    def __init__(self, vector_store, embedding_model_name: str = "emilyalsentzer/Bio_ClinicalBERT"):
+    def __init__(self, vector_store, embedding_model_name: str = DEFAULT_EMBEDDING_MODEL,
+                 max_seq_len: int = DEFAULT_MAX_SEQ_LEN):
 
         self.vector_store = vector_store
-        self.embedding_model = build_bioclinical_sentence_model()
-
-        # Move to GPU if available
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.embedding_model = self.embedding_model.to(device)
+        # Shared with generate_embeddings, so the weights are only loaded once per process
+        self.embedding_model = get_embedding_model(embedding_model_name, max_seq_len)
 
         print(f"RAG Retriever initialized ({embedding_model_name})")
         # print(f"Device: {device}")
@@ -429,21 +1254,88 @@ class MedicalRAGRetriever:
         embedding = self.embedding_model.encode(query, convert_to_tensor=True)
         return embedding.cpu().numpy().tolist()
 
-    def retrieve_for_queries(self, queries: List[str], top_k: int) -> Dict:
-        all_chunks = []
+    def generate_query_embeddings(self, queries: List[str], batch_size: int = 64):
+        """Encode all queries with a single encode call, returning a (n_queries, dim) array"""
+        embeddings = self.embedding_model.encode(
+            queries,
+            batch_size=batch_size,
+            convert_to_tensor=True,
+            show_progress_bar=False
+        )
+        return embeddings.cpu().numpy()
+
+    def retrieve_for_queries(self, queries: List[str], top_k: int, batch_size: int = 64,
+                             verbose: bool = False) -> Dict:
+        return self.retrieve_for_field_sets({0: queries}, top_k, batch_size, verbose)[0]
 
-        for i, query in enumerate(queries):
-            print(f"Processing query {i+1}/{len(queries)}: {query[:50]}...")
+    def retrieve_for_field_sets(self, field_sets: Dict, top_k: int, batch_size: int = 64,
+                                verbose: bool = False, packers: Optional[Dict[object, ContextPacker]] = None,
+                                on_result: Optional[Callable[[object, Dict], None]] = None) -> Dict:
+        """
+        Retrieve chunks for every field set with one encode call and one multi-vector search
 
-            # Generate embedding for the query
-            query_embedding = self.generate_query_embedding(query)
+        With on_result, each field set's result is handed over as soon as its
+        chunks are grouped (and packed), so the LLM can start on the first page
+        while the others are still being aggregated.
 
-            # Simple search for top 2 results
-            results = self.vector_store.search_similar(query_embedding, top_k=top_k)
-            chunks = self._process_search_results(results)
+        Args:
+            field_sets: Dict mapping field set key to its list of queries
+            top_k: Number of hits per query
+            batch_size: Encoder batch size
+            verbose: Print each query as its hits are collected
+            packers: Optional dict mapping field set key to a ContextPacker that fits
+                its aggregated text into the page's token budget
+            on_result: Optional callback(field set key, result) called per field set
 
-            if chunks:
-                all_chunks.extend(chunks)
+        Returns:
+            Dict mapping field set key to its retrieval result
+        """
+        all_queries = []
+        owners = []
+        for field_num, queries in field_sets.items():
+            for query in queries:
+                all_queries.append(query)
+                owners.append(field_num)
+
+        all_chunks = {field_num: [] for field_num in field_sets}
+
+        if all_queries:
+            # Generate embeddings for every query of every field set at once
+            query_embeddings = self.generate_query_embeddings(all_queries, batch_size)
+
+            # One search returns a list of hits per query vector
+            results = self.vector_store.search_similar_batch(query_embeddings, top_k=top_k)
+
+            for i, (query, field_num, hits) in enumerate(zip(all_queries, owners, results)):
+                if verbose:
+                    print(f"Processing query {i+1}/{len(all_queries)} (field set {field_num}): {query[:50]}...")
+                chunks = self._process_search_results([hits])
+                if chunks:
+                    all_chunks[field_num].extend(chunks)
+
+        packers = packers or {}
+        grouped = {}
+        for field_num, queries in field_sets.items():
+            grouped[field_num] = self._aggregate_chunks(queries, all_chunks[field_num], packers.get(field_num))
+            if on_result is not None:
+                on_result(field_num, grouped[field_num])
+        return grouped
+
+    def _aggregate_chunks(self, queries: List[str], all_chunks: List[Dict],
+                          packer: Optional[ContextPacker] = None) -> Dict:
+        if packer is not None:
+            packed = packer.pack(all_chunks)
+            stats = packed['stats']
+            print(f"Packed {stats['packed']}/{stats['candidates']} chunks, {stats['tokens_used']}/"
+                  f"{stats['token_budget']} tokens ({stats['tokens_dropped']} dropped, "
+                  f"{stats['tokens_trimmed']} trimmed overlap)")
+            return {
+                'queries': queries,
+                'retrieved_chunks': packed['chunks'],
+                'aggregated_text': packed['aggregated_text'],
+                'chunk_count': len(packed['chunks']),
+                'packing': stats,
+            }
 
         # Remove duplicates based on chunk_id
         seen_ids = set()
@@ -477,68 +1369,112 @@ class MedicalRAGRetriever:
                 })
         return chunks
     
-def retrieve_rag(timeline, field_sets, top_k=2, chunk_size=256, overlap=8):
+def _retrieve_field_sets(vector_store, field_sets, rag_config, model_name, max_seq_len, top_k, token_budgets=None,
+                        on_result=None):
+    retriever = MedicalRAGRetriever(vector_store, model_name, max_seq_len)
+
+    # Encode and search the queries of all field sets in one batch
+    return retriever.retrieve_for_field_sets(
+        field_sets,
+        top_k,
+        batch_size=rag_config.get('query_batch_size', 64),
+        verbose=rag_config.get('verbose_queries', False),
+        packers=build_packers(field_sets, rag_config.get('context_packing'), token_budgets),
+        on_result=on_result,
+    )
+
+def retrieve_rag(timeline, field_sets, top_k=2, chunk_size=256, overlap=8, use_embedding_cache=True, job_id=None,
+                 patient_id=None, token_budgets=None, on_result=None):
+    """
+    Chunk, embed and index the timeline, then retrieve the text for every field set
+
+    token_budgets optionally maps each field set (page) to the LLM tokens left
+    for its retrieved text, e.g. llm.page_context_budgets(...); with
+    context_packing enabled, pages without an entry use its default_token_budget.
+
+    on_result(field set key, result) is called for each field set as its hits
+    are grouped after the single batched encode/search, e.g.
+    llm.PagePipeline.submit to start its LLM call right away.
+    """
     
     ensure_nltk_data()
 
     # Load configuration
-    with open("rag_config.yml", 'r', encoding='utf-8') as file:
-        config = yaml.safe_load(file)
-        rag_config = config.get('rag_config', {})
+    rag_config = load_rag_config()
 
     top_k = rag_config.get('top_k')
     chunk_size = rag_config.get('chunk_size')
     overlap = rag_config.get('overlap')
+    model_name = rag_config.get('embedding_model', DEFAULT_EMBEDDING_MODEL)
+    max_seq_len = rag_config.get('max_seq_len', DEFAULT_MAX_SEQ_LEN)
+
+    # Only chunks not embedded by an earlier job reach the encoder
+    embedding_cache = get_embedding_cache(rag_config.get('embedding_cache')) if use_embedding_cache else None
+
+    # "tokenizer" chunks on the encoder's own wordpieces so no chunk is truncated
+    tokenizer = None
+    if rag_config.get('chunking_mode', 'nltk') == 'tokenizer':
+        tokenizer = get_embedding_model(model_name, max_seq_len).tokenizer
+
+    # With a patient id, reuse the patient's persistent index and only embed new or changed files
+    patient_index_config = rag_config.get('patient_index', {})
+    if patient_id and patient_index_config.get('enabled', True):
+        patient_index = PatientIndex(
+            patient_id,
+            rag_config.get('vector_store'),
+            patient_index_config.get('index_dir', './patient_indexes'),
+        )
+        with patient_index.lock:
+            try:
+                patient_index.sync(timeline, chunk_size, overlap, model_name, max_seq_len, embedding_cache, tokenizer)
+                return _retrieve_field_sets(
+                    patient_index.vector_store, field_sets, rag_config, model_name, max_seq_len, top_k, token_budgets,
+                    on_result
+                )
+            finally:
+                patient_index.close()
 
     # Process using the timeline variable
-    all_processed_chunks = process_all_medical_records(timeline, chunk_size, overlap)
+    all_processed_chunks = process_all_medical_records(timeline, chunk_size, overlap, tokenizer, max_seq_len)
 
     # Prepare chunks for the next stage of RAG pipeline (embedding generation)
     prepared_for_embedding = prepare_chunks_for_embedding(all_processed_chunks)
 
     # Generate embeddings for all prepared chunks
-    embedded_chunks = generate_embeddings(prepared_for_embedding)
-
-    # Show sample embedded chunk structure (without the full embedding vector)
-    sample_chunk = embedded_chunks[0].copy()
-    sample_chunk['embedding'] = f"[{len(sample_chunk['embedding'])}-dim vector]"
-
-    # Initialize and setup Milvus Lite vector database
-    vector_store = MilvusVectorStore()
+    embedded_chunks = generate_embeddings(prepared_for_embedding, model_name, max_seq_len, embedding_cache)
 
-    # Connect to Milvus Lite
-    if vector_store.connect():
-        # Create collection with appropriate embedding dimension
-        embedding_dim = embedded_chunks[0]['embedding_dimension'] if embedded_chunks else 768
-        vector_store.create_collection(embedding_dim)
+    # Initialize the vector store backend chosen in rag_config.yml (Milvus Lite or in-process NumPy)
+    # Each job gets its own collection so concurrent jobs cannot drop each other's index
+    vector_store = create_vector_store(rag_config.get('vector_store'), namespace=job_id or uuid.uuid4().hex)
 
-        # Insert all embeddings
-        insert_result = vector_store.insert_embeddings(embedded_chunks)
-
-        if insert_result:
-            # Load collection for search
-            vector_store.load_collection()
-
-            # Get statistics
-            vector_store.get_collection_stats()
+    try:
+        # Connect to the vector store
+        if vector_store.connect():
+            # Create collection with appropriate embedding dimension
+            embedding_dim = embedded_chunks.embedding_dim or 768
+            vector_store.create_collection(embedding_dim)
+
+            # Insert all embeddings
+            insert_result = vector_store.insert_embeddings(embedded_chunks)
+
+            if insert_result:
+                # Load collection for search
+                vector_store.load_collection()
+
+                # Get statistics
+                vector_store.get_collection_stats()
+            else:
+                print("Failed to insert embeddings")
         else:
-            print("Failed to insert embeddings")
-    else:
-        print("Could not connect to Milvus")
-
-    # Initialize the retriever
-    if 'vector_store' in locals() and hasattr(vector_store, 'collection') and vector_store.collection:
-        retriever = MedicalRAGRetriever(vector_store)
+            print("Could not connect to the vector store")
 
-        # Store retrieval results for all field sets
-        all_retrieval_results = {}
+        # Initialize the retriever
+        if vector_store.collection:
+            return _retrieve_field_sets(vector_store, field_sets, rag_config, model_name, max_seq_len, top_k,
+                                        token_budgets, on_result)
 
-        # Process each field set
-        for field_num, field_queries in field_sets.items():
-            retrieval_result = retriever.retrieve_for_queries(field_queries, top_k)
-            all_retrieval_results[field_num] = retrieval_result
-
-        return all_retrieval_results
-
-    else:
-        print("Vector store not available. Run the database setup cell first.")
\ No newline at end of file
+        else:
+            print("Vector store not available. Run the database setup cell first.")
+    finally:
+        # Release the connection and drop the job's collection once nobody uses it
+        vector_store.close()
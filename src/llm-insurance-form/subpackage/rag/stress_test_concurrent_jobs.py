@@ -0,0 +1,129 @@
+"""
+Stress test for per-job vector store isolation.
+
+Fires N concurrent jobs against the same Milvus Lite file. Every job builds its
+own namespaced collection with job-specific chunks, then searches with its own
+vectors and checks that each top hit is the expected chunk of that job. Finally
+it checks that every job collection was dropped when the job closed its store.
+
+Run from this directory:
+    python stress_test_concurrent_jobs.py --jobs 8 --chunks 300
+    python stress_test_concurrent_jobs.py --backend numpy
+"""
+
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import numpy as np
+from pymilvus import utility
+
+from rag import COLLECTION_REGISTRY, create_vector_store
+
+
+def run_job(job_index: int, store_config: dict, n_chunks: int, n_queries: int, dim: int, top_k: int) -> dict:
+    job_id = f"stress_{job_index}"
+    rng = np.random.default_rng(job_index)
+    vectors = rng.standard_normal((n_chunks, dim)).astype(np.float32)
+
+    embedded_chunks = [
+        {
+            "id": f"{job_id}_chunk_{i}",
+            "text": f"{job_id} chunk {i}",
+            "embedding": vector.tolist(),
+            "embedding_dimension": dim,
+            "metadata": {"date": f"2025-01-{i % 28 + 1:02d}", "chunk": 1},
+        }
+        for i, vector in enumerate(vectors)
+    ]
+
+    store = create_vector_store(store_config, namespace=job_id)
+    start = time.perf_counter()
+    errors = []
+    try:
+        if not store.connect():
+            return {"job_id": job_id, "errors": ["could not connect"], "seconds": 0.0}
+        store.create_collection(dim)
+        store.insert_embeddings(embedded_chunks)
+        store.load_collection()
+
+        # Query with the job's own vectors: the top hit must be that exact chunk
+        query_rows = rng.choice(n_chunks, size=min(n_queries, n_chunks), replace=False)
+        results = store.search_similar_batch(vectors[query_rows], top_k=top_k)
+
+        if len(results) != len(query_rows):
+            errors.append(f"expected {len(query_rows)} result lists, got {len(results)}")
+        for row, hits in zip(query_rows, results):
+            hits = list(hits)
+            expected_id = f"{job_id}_chunk_{row}"
+            if not hits or str(hits[0].id) != expected_id:
+                errors.append(f"top hit for {expected_id} was {hits[0].id if hits else None}")
+            foreign = [hit.id for hit in hits if not str(hit.id).startswith(f"{job_id}_")]
+            if foreign:
+                errors.append(f"hits from other jobs: {foreign}")
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+    finally:
+        store.close()
+
+    return {
+        "job_id": job_id,
+        "collection": store.collection_name,
+        "errors": errors,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Concurrent job isolation stress test")
+    arg_parser.add_argument("--jobs", type=int, default=8)
+    arg_parser.add_argument("--chunks", type=int, default=200, help="Chunks indexed per job")
+    arg_parser.add_argument("--queries", type=int, default=40, help="Queries searched per job")
+    arg_parser.add_argument("--dim", type=int, default=768)
+    arg_parser.add_argument("--top-k", type=int, default=2)
+    arg_parser.add_argument("--max-connections", type=int, default=4)
+    arg_parser.add_argument("--backend", choices=["milvus", "numpy"], default="milvus")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_config = {
+            "backend": args.backend,
+            "collection_name": "stress_embeddings",
+            "db_file": os.path.join(tmp_dir, "milvus_stress.db"),
+            "max_connections": args.max_connections,
+            "drop_on_close": True,
+        }
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            futures = [
+                executor.submit(run_job, i, store_config, args.chunks, args.queries, args.dim, args.top_k)
+                for i in range(args.jobs)
+            ]
+            results = [f.result() for f in futures]
+        elapsed = time.perf_counter() - start
+
+        failed = [r for r in results if r["errors"]]
+        for r in results:
+            status = "OK" if not r["errors"] else f"FAILED ({len(r['errors'])} errors, first: {r['errors'][0]})"
+            print(f"{r['job_id']}: {r['seconds']:.2f}s {status}")
+
+        leftover = [r["collection"] for r in results if COLLECTION_REGISTRY.count(r["collection"])]
+        if args.backend == "milvus":
+            # Check the database itself, not just the registry
+            store = create_vector_store(store_config, namespace="cleanup_check")
+            store.connect()
+            existing = set(utility.list_collections(using=store.alias))
+            store.close()
+            leftover += [r["collection"] for r in results if r["collection"] in existing]
+
+    print(f"\n{args.jobs} concurrent jobs finished in {elapsed:.2f}s "
+          f"({len(failed)} failed, {len(leftover)} collections left behind)")
+    if failed or leftover:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()